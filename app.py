@@ -2,6 +2,16 @@ from flask import Flask, render_template
 from flask_login import LoginManager
 from config import Config
 from models import db, User, Usuario, Rol, Actividad, Entrenamiento, Asistencia, Competicion, ResultadoCompeticion
+from search_index import search_index
+from query_stats import query_stats
+from principal import principal_cache
+import club_stats
+import member_stats
+from calendar_feed import calendar_cache
+from report_jobs import report_jobs
+from report_cache import report_cache
+from checkin import checkin_batcher, failed_codes
+from passwords import password_hasher
 import os
 
 # Crear la aplicación Flask
@@ -19,6 +29,17 @@ if os.environ.get('FLASK_ENV', 'production') == 'production' and not os.environ.
 
 # Inicializar extensiones
 db.init_app(app)
+search_index.init_app(app)
+query_stats.init_app(app)
+principal_cache.init_app(app)
+club_stats.init_app(app)
+member_stats.init_app(app)
+calendar_cache.init_app(app)
+report_jobs.init_app(app)
+report_cache.init_app(app)
+checkin_batcher.init_app(app)
+failed_codes.init_app(app)
+password_hasher.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
@@ -31,6 +52,7 @@ from routes.trainer import trainer_bp
 from routes.member import member_bp
 from routes.main import main_bp
 from routes.reports import reports_bp
+from routes.kiosk import kiosk_bp
 
 # Registrar blueprints
 app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -39,10 +61,12 @@ app.register_blueprint(trainer_bp, url_prefix='/trainer')
 app.register_blueprint(member_bp, url_prefix='/member')
 app.register_blueprint(main_bp)
 app.register_blueprint(reports_bp, url_prefix='/reports')
+app.register_blueprint(kiosk_bp, url_prefix='/kiosco')
 
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    # Resumen del usuario en caché: autenticar y comprobar el rol no consulta la BD
+    return principal_cache.load(int(user_id))
 
 @app.errorhandler(404)
 def not_found_error(error):
@@ -0,0 +1,314 @@
+"""
+Registro de asistencias por lista
+
+Un entrenador pasa lista de un entrenamiento en una sola página: todos los
+miembros, cada uno con su estado (presente, ausente o sin registrar) y sus
+observaciones. Al guardar, las asistencias nuevas o modificadas se escriben en
+una transacción con un único INSERT de varias filas que, si el miembro ya tiene
+asistencia en ese entrenamiento (uq_asistencia_entrenamiento_miembro), actualiza
+la existente: el número de sentencias no depende del número de miembros.
+
+La página de la lista también funciona sin conexión: guarda los cambios en el
+navegador y los envía, cuando vuelve la conexión, en un único lote que
+sync_attendance aplica en una transacción, con el resultado de cada cambio y
+los conflictos con lo que otro usuario haya guardado entretanto.
+
+Como el INSERT no pasa por la sesión, los resúmenes por miembro (member_stats)
+y las versiones de la caché de reportes se ajustan aquí, en la misma
+transacción.
+"""
+
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import and_, delete, or_, select, update
+
+import member_stats
+from models import db, Usuario, Rol, Entrenamiento, Asistencia
+from report_cache import bump_versions
+
+# Filas por sentencia INSERT (por debajo del límite de parámetros de SQLite)
+UPSERT_BATCH = 500
+
+CREADA = 'creada'
+MODIFICADA = 'modificada'
+
+# Cambios como máximo en un lote de sincronización
+SYNC_MAX_CHANGES = 2000
+
+# Estado de cada cambio de un lote de sincronización
+APLICADO = 'aplicado'
+SIN_CAMBIOS = 'sin_cambios'
+CONFLICTO = 'conflicto'
+RECHAZADO = 'rechazado'
+
+# Base de un cambio que se aplica sin comprobar el valor anterior
+SIN_BASE = object()
+
+# ``valor`` es (presente, observaciones), o None para eliminar la asistencia
+SyncChange = namedtuple('SyncChange', 'id_entrenamiento id_miembro valor base')
+
+# ``presente`` es None si el miembro aún no tiene asistencia registrada
+RosterEntry = namedtuple('RosterEntry', 'id_miembro nombre apellido presente observaciones')
+
+
+def roster(id_entrenamiento):
+    """Miembros de la lista de un entrenamiento, con su asistencia si ya está registrada
+
+    Incluye a todos los usuarios con rol Miembro y a cualquiera que ya tenga
+    asistencia en el entrenamiento.
+    """
+    rows = db.session.query(Usuario.id_usuario, Usuario.nombre, Usuario.apellido,
+                            Asistencia.presente, Asistencia.observaciones)\
+        .outerjoin(Rol, Usuario.id_rol == Rol.id_rol)\
+        .outerjoin(Asistencia, and_(Asistencia.id_miembro == Usuario.id_usuario,
+                                    Asistencia.id_entrenamiento == id_entrenamiento))\
+        .filter(or_(Rol.nombre_rol == 'Miembro', Asistencia.id_asistencia.isnot(None)))\
+        .order_by(Usuario.apellido, Usuario.nombre, Usuario.id_usuario)
+    return [RosterEntry(*row) for row in rows]
+
+
+def _fechas(connection, keys):
+    """{id_entrenamiento: fecha} de los entrenamientos de ``keys``"""
+    trainings = {id_entrenamiento for id_entrenamiento, _ in keys}
+    return dict(connection.execute(
+        select(Entrenamiento.id_entrenamiento, Entrenamiento.fecha)
+        .where(Entrenamiento.id_entrenamiento.in_(trainings))).all())
+
+
+def _locked(connection, keys):
+    """{(id_entrenamiento, id_miembro): (presente, observaciones)} de las asistencias existentes
+
+    Las filas quedan bloqueadas hasta el final de la transacción: las
+    diferencias para los resúmenes se calculan sobre los valores que se van a
+    sobrescribir. Puede incluir otras combinaciones de los mismos
+    entrenamientos y miembros.
+    """
+    table = Asistencia.__table__
+    trainings = {id_entrenamiento for id_entrenamiento, _ in keys}
+    members = {id_miembro for _, id_miembro in keys}
+    existing = {}
+    for id_entrenamiento, id_miembro, presente, observaciones in connection.execute(
+            select(table.c.id_entrenamiento, table.c.id_miembro, table.c.presente, table.c.observaciones)
+            .where(table.c.id_entrenamiento.in_(trainings), table.c.id_miembro.in_(members))
+            .with_for_update()):
+        existing[(id_entrenamiento, id_miembro)] = (presente, observaciones)
+    return existing
+
+
+def _upsert(connection, rows):
+    """INSERT de varias filas que actualiza presente y observaciones de las que ya existen"""
+    table = Asistencia.__table__
+    dialect = connection.dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update(presente=stmt.inserted.presente,
+                                            observaciones=stmt.inserted.observaciones)
+        connection.execute(stmt)
+    elif dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.id_entrenamiento, table.c.id_miembro],
+            set_={'presente': stmt.excluded.presente, 'observaciones': stmt.excluded.observaciones})
+        connection.execute(stmt)
+    else:
+        for row in rows:
+            result = connection.execute(
+                update(table)
+                .where(table.c.id_entrenamiento == row['id_entrenamiento'], table.c.id_miembro == row['id_miembro'])
+                .values(presente=row['presente'], observaciones=row['observaciones']))
+            if result.rowcount == 0:
+                connection.execute(table.insert(), row)
+
+
+def write_attendance(marks, keep_observaciones=False):
+    """Escribir asistencias en la transacción de la sesión (sin confirmarla)
+
+    ``marks`` es {(id_entrenamiento, id_miembro): (presente, observaciones)}.
+    Solo se escriben las asistencias nuevas o que cambian; con
+    ``keep_observaciones`` se conservan las observaciones de las que ya existen.
+    Devuelve {(id_entrenamiento, id_miembro): CREADA o MODIFICADA} de las
+    asistencias escritas.
+    """
+    if not marks:
+        return {}
+    connection = db.session.connection()
+    fechas = _fechas(connection, marks)
+    existing = _locked(connection, marks)
+
+    rows = []
+    changes = []
+    written = {}
+    for (id_entrenamiento, id_miembro), (presente, observaciones) in sorted(marks.items()):
+        fecha = fechas.get(id_entrenamiento)
+        if fecha is None:
+            raise LookupError(f'El entrenamiento {id_entrenamiento} no existe')
+        previous = existing.get((id_entrenamiento, id_miembro))
+        if previous is not None and keep_observaciones:
+            observaciones = previous[1]
+        if previous == (presente, observaciones):
+            continue
+        rows.append({'id_entrenamiento': id_entrenamiento, 'id_miembro': id_miembro,
+                     'presente': presente, 'observaciones': observaciones})
+        if previous is None:
+            written[(id_entrenamiento, id_miembro)] = CREADA
+            changes.append((id_miembro, fecha, presente, 1))
+        else:
+            written[(id_entrenamiento, id_miembro)] = MODIFICADA
+            if previous[0] != presente:
+                changes.append((id_miembro, fecha, previous[0], -1))
+                changes.append((id_miembro, fecha, presente, 1))
+
+    if rows:
+        for start in range(0, len(rows), UPSERT_BATCH):
+            _upsert(connection, rows[start:start + UPSERT_BATCH])
+        member_stats.record_changes(connection, changes)
+        bump_versions(connection, ('asistencias',))
+    return written
+
+
+def save_attendance(marks):
+    """Guardar asistencias en la transacción de la sesión (sin confirmarla)
+
+    Como write_attendance; devuelve (asistencias creadas, asistencias modificadas).
+    """
+    written = write_attendance(marks)
+    created = sum(1 for estado in written.values() if estado == CREADA)
+    return created, len(written) - created
+
+
+def delete_attendance(keys):
+    """Eliminar asistencias en la transacción de la sesión (sin confirmarla)
+
+    ``keys`` son pares (id_entrenamiento, id_miembro). Devuelve los pares de
+    las asistencias que existían y se han eliminado.
+    """
+    if not keys:
+        return set()
+    connection = db.session.connection()
+    table = Asistencia.__table__
+    existing = _locked(connection, keys)
+    deleted = sorted(key for key in set(keys) if key in existing)
+    if not deleted:
+        return set()
+    fechas = _fechas(connection, deleted)
+    by_training = defaultdict(list)
+    for id_entrenamiento, id_miembro in deleted:
+        by_training[id_entrenamiento].append(id_miembro)
+    for id_entrenamiento, members in by_training.items():
+        connection.execute(delete(table).where(table.c.id_entrenamiento == id_entrenamiento,
+                                               table.c.id_miembro.in_(members)))
+    member_stats.record_changes(connection, [
+        (id_miembro, fechas[id_entrenamiento], existing[(id_entrenamiento, id_miembro)][0], -1)
+        for id_entrenamiento, id_miembro in deleted])
+    bump_versions(connection, ('asistencias',))
+    return set(deleted)
+
+
+def _parse_change(item):
+    """SyncChange de un cambio recibido en JSON; ValueError si no es válido"""
+    if not isinstance(item, dict):
+        raise ValueError('Cambio no válido')
+    id_entrenamiento, id_miembro = item.get('id_entrenamiento'), item.get('id_miembro')
+    if type(id_entrenamiento) is not int or type(id_miembro) is not int:
+        raise ValueError('Entrenamiento o miembro no válido')
+    accion = item.get('accion')
+    if accion == 'guardar':
+        valor = _parse_value(item)
+    elif accion == 'eliminar':
+        valor = None
+    else:
+        raise ValueError('Acción no válida')
+    if 'base' not in item:
+        base = SIN_BASE
+    elif item['base'] is None:
+        base = None
+    else:
+        base = _parse_value(item['base'])
+    return SyncChange(id_entrenamiento, id_miembro, valor, base)
+
+
+def _parse_value(data):
+    """(presente, observaciones) de un diccionario JSON"""
+    if not isinstance(data, dict) or not isinstance(data.get('presente'), bool):
+        raise ValueError('Estado de asistencia no válido')
+    observaciones = data.get('observaciones')
+    if observaciones is not None and not isinstance(observaciones, str):
+        raise ValueError('Observaciones no válidas')
+    return data['presente'], (observaciones or '').strip() or None
+
+
+def _as_json(valor):
+    if valor is None:
+        return None
+    return {'presente': valor[0], 'observaciones': valor[1]}
+
+
+def sync_attendance(items, id_entrenador):
+    """Aplicar cambios de asistencia enviados por lotes (sin confirmar la transacción)
+
+    Cada cambio es un diccionario con ``id_entrenamiento``, ``id_miembro``,
+    ``accion`` ('guardar' con ``presente`` y ``observaciones``, o 'eliminar') y,
+    opcionalmente, ``base``: el valor de la asistencia cuando el cliente hizo el
+    cambio (null si no estaba registrada). Si el valor actual ya no es la base,
+    el cambio es un CONFLICTO y no se aplica; un cambio que ya está aplicado
+    (por ejemplo, un lote que se reenvía) queda SIN_CAMBIOS. Sin ``base`` gana
+    la última escritura. Los cambios se aplican en orden y solo en
+    entrenamientos de ``id_entrenador``.
+
+    Devuelve, en el orden de ``items``, un diccionario por cambio con su ``id``
+    (el que envió el cliente), ``estado``, ``actual`` (el valor en el servidor
+    tras el cambio) y, si se rechaza, ``mensaje``.
+    """
+    results = []
+    changes = []
+    for item in items:
+        result = {'id': item.get('id') if isinstance(item, dict) else None}
+        results.append(result)
+        try:
+            changes.append((result, _parse_change(item)))
+        except ValueError as exc:
+            result.update(estado=RECHAZADO, mensaje=str(exc))
+    if not changes:
+        return results
+
+    keys = {(change.id_entrenamiento, change.id_miembro) for _, change in changes}
+    own = {row[0] for row in db.session.query(Entrenamiento.id_entrenamiento).filter(
+        Entrenamiento.id_entrenamiento.in_({id_entrenamiento for id_entrenamiento, _ in keys}),
+        Entrenamiento.id_entrenador == id_entrenador)}
+    members = {row[0] for row in db.session.query(Usuario.id_usuario)
+               .join(Rol, Usuario.id_rol == Rol.id_rol)
+               .filter(Usuario.id_usuario.in_({id_miembro for _, id_miembro in keys}),
+                       Rol.nombre_rol == 'Miembro')}
+    original = _locked(db.session.connection(), keys)
+    current = dict(original)
+
+    for result, change in changes:
+        key = (change.id_entrenamiento, change.id_miembro)
+        actual = current.get(key)
+        if change.id_entrenamiento not in own:
+            result.update(estado=RECHAZADO, mensaje='Entrenamiento no válido')
+            continue
+        if change.valor is not None and actual is None and change.id_miembro not in members:
+            result.update(estado=RECHAZADO, mensaje='Miembro no válido')
+            continue
+        if actual == change.valor:
+            result['estado'] = SIN_CAMBIOS
+        elif change.base is not SIN_BASE and change.base != actual:
+            result['estado'] = CONFLICTO
+        else:
+            if change.valor is None:
+                current.pop(key)
+            else:
+                current[key] = change.valor
+            result['estado'] = APLICADO
+        result['actual'] = _as_json(current.get(key))
+
+    # Se escribe solo el estado final de cada asistencia
+    write_attendance({key: valor for key, valor in current.items() if original.get(key) != valor})
+    delete_attendance({key for key in original if key not in current})
+    return results
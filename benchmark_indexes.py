@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Benchmark del efecto de cada índice de models.py sobre las consultas de routes/*.py
+
+Para cada índice se ejecutan las consultas que lo aprovechan, se muestra su plan
+(EXPLAIN) y el tiempo medio. Con --compare se elimina temporalmente cada índice,
+se repite la medición y se vuelve a crear, para ver la diferencia con y sin él.
+En MySQL los índices que empiezan por una clave foránea no se pueden eliminar:
+se comparan con un índice provisional sobre solo esa columna, el que MySQL
+mantendría para la clave foránea.
+
+Los resultados solo son representativos con un volumen de datos realista.
+¡No usar --compare contra la base de datos de producción!
+
+Uso:
+    python benchmark_indexes.py [--repeat 20] [--compare]
+"""
+
+import argparse
+import statistics
+import time
+from datetime import date
+
+from sqlalchemy import Index, func, select
+
+from app import app, db
+from migrate_indexes import backs_foreign_key
+from models import Usuario, Rol, Actividad, Entrenamiento, Asistencia, Competicion, ResultadoCompeticion
+
+
+def _first_id(column, rol=None):
+    stmt = select(column).limit(1)
+    if rol:
+        stmt = stmt.join(Rol, Usuario.id_rol == Rol.id_rol).where(Rol.nombre_rol == rol)
+    return db.session.execute(stmt).scalar() or 0
+
+
+def sample_params():
+    """Valores reales con los que parametrizar las consultas"""
+    return {
+        'entrenador': _first_id(Usuario.id_usuario, 'Entrenador'),
+        'miembro': _first_id(Usuario.id_usuario, 'Miembro'),
+        'actividad': _first_id(Actividad.id_actividad),
+        'hoy': date.today(),
+    }
+
+
+# (índice, consulta de origen, constructor de la sentencia)
+BENCHMARKS = [
+    ('ix_entrenamiento_fecha', 'admin.entrenamientos (primera página keyset)',
+     lambda p: select(Entrenamiento).order_by(Entrenamiento.fecha.desc(), Entrenamiento.id_entrenamiento.desc()).limit(51)),
+    ('ix_entrenamiento_fecha', 'main.calendar (entrenamientos de un mes)',
+     lambda p: select(Entrenamiento).where(Entrenamiento.fecha >= p['hoy'].replace(day=1), Entrenamiento.fecha <= p['hoy'])),
+    ('ix_entrenamiento_entrenador_fecha', 'trainer.dashboard (total_entrenamientos)',
+     lambda p: select(func.count()).select_from(Entrenamiento).where(Entrenamiento.id_entrenador == p['entrenador'])),
+    ('ix_entrenamiento_entrenador_fecha', 'trainer.asistencias (asistencias recientes)',
+     lambda p: select(Asistencia).join(Entrenamiento).where(Entrenamiento.id_entrenador == p['entrenador'])
+     .order_by(Asistencia.id_asistencia.desc()).limit(10)),
+    ('ix_entrenamiento_actividad_fecha', 'admin.entrenamientos (filtro por actividad)',
+     lambda p: select(Entrenamiento).where(Entrenamiento.id_actividad == p['actividad'])
+     .order_by(Entrenamiento.fecha.desc()).limit(51)),
+    ('ix_asistencia_miembro_entrenamiento', 'member.dashboard (total_asistencias)',
+     lambda p: select(func.count()).select_from(Asistencia).where(Asistencia.id_miembro == p['miembro'])),
+    ('ix_asistencia_miembro_entrenamiento', 'member.historial (asistencias con fecha)',
+     lambda p: select(Asistencia.id_asistencia, Entrenamiento.fecha).join(Entrenamiento)
+     .where(Asistencia.id_miembro == p['miembro'])),
+    ('ix_competicion_fecha', 'admin.dashboard (próximas competiciones)',
+     lambda p: select(Competicion).where(Competicion.fecha >= p['hoy']).order_by(Competicion.fecha).limit(5)),
+    ('ix_competicion_actividad_fecha', 'admin.competiciones (filtro por actividad)',
+     lambda p: select(Competicion).where(Competicion.id_actividad == p['actividad'])
+     .order_by(Competicion.fecha.desc()).limit(51)),
+    ('ix_usuario_rol', 'admin.usuarios (filtro por rol)',
+     lambda p: select(Usuario).join(Rol).where(Rol.nombre_rol == 'Miembro').order_by(Usuario.id_usuario).limit(51)),
+    ('ix_usuario_apellido', 'admin.usuarios (orden por apellido)',
+     lambda p: select(Usuario).order_by(Usuario.apellido, Usuario.id_usuario).limit(51)),
+    ('ix_usuario_nombre', 'admin.usuarios (prefijo de nombre)',
+     lambda p: select(Usuario).where(Usuario.nombre.startswith('Mar')).limit(51)),
+    ('ix_resultado_usuario', 'reports.miembro_pdf (resultados del miembro)',
+     lambda p: select(ResultadoCompeticion).where(ResultadoCompeticion.id_usuario == p['miembro'])),
+]
+
+
+def explain(stmt):
+    """Plan de ejecución de la sentencia en el dialecto actual"""
+    connection = db.session.connection()
+    compiled = stmt.compile(dialect=connection.dialect)
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite' else 'EXPLAIN '
+    return connection.exec_driver_sql(prefix + str(compiled), params).fetchall()
+
+
+def time_query(stmt, repeat):
+    """Tiempo medio (ms) de ``repeat`` ejecuciones completas de la sentencia"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        db.session.execute(stmt).all()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.mean(samples)
+
+
+def find_index(name):
+    for table in db.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError(name)
+
+
+def _release_session():
+    # En MySQL la transacción abierta de la sesión retiene un bloqueo de metadatos
+    # sobre las tablas consultadas y DROP/CREATE INDEX esperaría por él
+    db.session.rollback()
+    db.session.close()
+
+
+def drop_for_comparison(index):
+    """Eliminar el índice; devuelve el índice provisional que lo sustituye, si hace falta
+
+    En MySQL un índice que sirve a una clave foránea no se puede eliminar: se crea
+    antes uno sobre la columna de la clave foránea (el que MySQL crearía por sí solo).
+    """
+    _release_session()
+    substitute = None
+    if db.engine.dialect.name == 'mysql' and backs_foreign_key(index):
+        column = next(iter(index.columns))
+        substitute = Index(f'tmp_{index.name}'[:64], column)
+        # Solo para esta comparación: no forma parte de los modelos
+        index.table.indexes.discard(substitute)
+        substitute.create(bind=db.engine)
+    index.drop(bind=db.engine)
+    return substitute
+
+
+def restore(index, substitute):
+    """Volver a crear el índice y eliminar el provisional"""
+    _release_session()
+    index.create(bind=db.engine)
+    if substitute is not None:
+        substitute.drop(bind=db.engine)
+
+
+def run(repeat, compare):
+    with app.app_context():
+        params = sample_params()
+        with_index = {}
+
+        print("=" * 80)
+        print("Planes y tiempos con todos los índices")
+        print("=" * 80)
+        for index_name, label, build in BENCHMARKS:
+            stmt = build(params)
+            with_index[label] = time_query(stmt, repeat)
+            print(f"\n[{index_name}] {label}: {with_index[label]:.2f} ms")
+            for row in explain(stmt):
+                print("    ", tuple(row))
+
+        if not compare:
+            return
+
+        print("\n" + "=" * 80)
+        print(f"{'Consulta':<52}{'con':>9}{'sin':>9}{'mejora':>10}")
+        print("=" * 80)
+        for index_name in dict.fromkeys(name for name, _, _ in BENCHMARKS):
+            index = find_index(index_name)
+            substitute = drop_for_comparison(index)
+            try:
+                for name, label, build in BENCHMARKS:
+                    if name != index_name:
+                        continue
+                    without = time_query(build(params), repeat)
+                    speedup = without / with_index[label] if with_index[label] else float('inf')
+                    mark = '*' if substitute is not None else ''
+                    print(f"{label[:50] + mark:<52}{with_index[label]:>8.2f}{without:>9.2f}{speedup:>9.1f}x")
+            finally:
+                restore(index, substitute)
+        if db.engine.dialect.name == 'mysql':
+            print("\n* sin el índice compuesto, con uno solo sobre la columna de la clave foránea")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Medir el efecto de los índices sobre las consultas de las rutas')
+    parser.add_argument('--repeat', type=int, default=20, help='ejecuciones por consulta (por defecto 20)')
+    parser.add_argument('--compare', action='store_true',
+                        help='eliminar y recrear cada índice para comparar (no usar en producción)')
+    args = parser.parse_args()
+    run(args.repeat, args.compare)
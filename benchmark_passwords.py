@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark del rendimiento de los inicios de sesión con cada política de hash
+
+Para cada método (en el formato de PASSWORD_HASH_METHOD) calcula el hash de una
+contraseña y simula un pico de inicios de sesión: --clients peticiones
+concurrentes que verifican la contraseña en el pool de passwords.py, con
+--threads hilos. Muestra lo que cuesta cifrar una contraseña (registro o
+recálculo tras cambiar de política), la latencia mediana y p95 de cada
+verificación (incluida la espera por un hilo libre) y los inicios de sesión
+por segundo que admite cada proceso. No usa la base de datos: solo se mide el
+coste del hash, que es el que domina un inicio de sesión.
+
+Uso:
+    python benchmark_passwords.py [--logins 40] [--clients 8] [--threads 0]
+                                  [--methods pbkdf2:sha256:600000 scrypt:16384:8:1 ...]
+"""
+
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passwords import DEFAULT_METHOD, PasswordHasher, normalize_method
+
+METHODS = (
+    DEFAULT_METHOD,
+    'pbkdf2:sha256:260000',
+    'pbkdf2:sha256:100000',
+    'scrypt:32768:8:1',
+    'scrypt:16384:8:1',
+)
+
+PASSWORD = 'member123'
+
+
+def run(method, logins, clients, threads):
+    """(ms por hash, latencias de cada verificación en ms, inicios de sesión por segundo)"""
+    hasher = PasswordHasher()
+    hasher.method = normalize_method(method)
+    hasher.threads = threads
+    started = time.perf_counter()
+    pwhash = hasher.hash(PASSWORD)
+    hash_ms = (time.perf_counter() - started) * 1000
+
+    def login(_):
+        started = time.perf_counter()
+        assert hasher.verify(pwhash, PASSWORD)
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as peticiones:
+        latencies = list(peticiones.map(login, range(logins)))
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+    return hash_ms, latencies, logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--methods', nargs='+', default=METHODS, help='Métodos de hash a comparar')
+    parser.add_argument('--logins', type=int, default=40, help='Inicios de sesión por método')
+    parser.add_argument('--clients', type=int, default=8, help='Peticiones concurrentes')
+    parser.add_argument('--threads', type=int, default=0, help='Hilos del pool de hash (0 = uno por núcleo)')
+    args = parser.parse_args()
+    threads = args.threads or os.cpu_count() or 1
+
+    print(f'{args.logins} inicios de sesión por método, {args.clients} concurrentes, {threads} hilos de hash')
+    print(f'{"Método":<24}{"Hash (ms)":>11}{"Mediana (ms)":>14}{"p95 (ms)":>10}{"Logins/s":>10}')
+    for method in args.methods:
+        hash_ms, latencies, throughput = run(method, args.logins, args.clients, threads)
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f'{normalize_method(method):<24}{hash_ms:>11.1f}{statistics.median(latencies):>14.1f}'
+              f'{p95:>10.1f}{throughput:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark del tiempo de generación de cada reporte PDF
+
+Genera los seis reportes de pdf_generator.py con datos sintéticos en memoria
+(sin base de datos), de modo que solo se mide el motor de reportes y ReportLab.
+Muestra la mediana y el mínimo de cada reporte y el tiempo por fila, para
+comparar el efecto de los cambios en el generador, y el rendimiento (filas por
+segundo) de cada reporte tabular maquetado con Platypus y dibujado directamente
+en el canvas.
+
+Uso:
+    python benchmark_reports.py [--rows 500] [--repeat 5]
+"""
+
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from pdf_generator import ClubPDFGenerator, REPORTS, _build_styles
+
+
+def sample_data(rows):
+    """Objetos con los mismos atributos que los modelos que recibe cada reporte"""
+    roles = [SimpleNamespace(nombre_rol=nombre) for nombre in ('Administrador', 'Entrenador', 'Miembro')]
+    actividades = [SimpleNamespace(id_actividad=i + 1, nombre_actividad=f'Actividad {i + 1}') for i in range(8)]
+    usuarios = [SimpleNamespace(id_usuario=i + 1, nombre=f'Nombre{i}', apellido=f'Apellido{i}',
+                                email=f'usuario{i}@club.com', rol=roles[i % 3],
+                                fecha_nacimiento=date(1990, 1, 1) + timedelta(days=i))
+                for i in range(rows)]
+    hoy = date.today()
+    entrenamientos = [SimpleNamespace(id_entrenamiento=i + 1, fecha=hoy - timedelta(days=i),
+                                      entrenador=usuarios[i % len(usuarios)],
+                                      actividad=actividades[i % len(actividades)])
+                      for i in range(rows)]
+    competiciones = [SimpleNamespace(id_competicion=i + 1, nombre=f'Competición {i + 1}',
+                                     fecha=hoy + timedelta(days=i), ubicacion='Pabellón' if i % 2 else None,
+                                     actividad=actividades[i % len(actividades)] if i % 5 else None)
+                     for i in range(rows)]
+    asistencias = [SimpleNamespace(id_asistencia=i + 1, miembro=usuarios[i % len(usuarios)],
+                                   entrenamiento=entrenamientos[i % len(entrenamientos)],
+                                   presente=bool(i % 4), observaciones='Llegó tarde' if i % 7 == 0 else None)
+                   for i in range(rows)]
+    # El reporte de asistencias recibe filas planas del cursor
+    filas_asistencias = [SimpleNamespace(miembro_nombre=a.miembro.nombre, miembro_apellido=a.miembro.apellido,
+                                         actividad=a.entrenamiento.actividad.nombre_actividad,
+                                         fecha=a.entrenamiento.fecha, presente=a.presente,
+                                         observaciones=a.observaciones)
+                         for a in asistencias]
+    # Y el de un miembro, sus asistencias y resultados como en member_reports.py
+    miembro = (
+        [SimpleNamespace(fecha=a.entrenamiento.fecha, actividad=a.entrenamiento.actividad.nombre_actividad,
+                         entrenador_nombre=a.entrenamiento.entrenador.nombre,
+                         entrenador_apellido=a.entrenamiento.entrenador.apellido, presente=a.presente)
+         for a in asistencias],
+        [SimpleNamespace(fecha=c.fecha, nombre=c.nombre, ubicacion=c.ubicacion, posicion=i % 10 + 1,
+                         actividad=c.actividad.nombre_actividad if c.actividad else None)
+         for i, c in enumerate(competiciones)],
+    )
+    return {
+        'usuarios': usuarios,
+        'actividades': actividades,
+        'entrenamientos': entrenamientos,
+        'competiciones': competiciones,
+        'asistencias': filas_asistencias,
+    }, miembro
+
+
+def time_call(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), min(times)
+
+
+def run(rows, repeat):
+    data, (trainings, competitions) = sample_data(rows)
+    generator = ClubPDFGenerator()
+
+    reports = [(name, len(items), lambda name=name, items=items: generator.generate_report(name, items))
+               for name, items in data.items()]
+    member = data['usuarios'][2]
+    reports.append(('miembro', len(trainings) + len(competitions),
+                    lambda: generator.generate_member_report(member, trainings, competitions)))
+
+    print(f"{'Reporte':<16}{'Filas':>8}{'Mediana (ms)':>15}{'Mínimo (ms)':>14}{'ms/fila':>10}{'KB':>8}")
+    for name, count, render in reports:
+        median, best = time_call(render, repeat)
+        with render() as pdf:
+            size = pdf.seek(0, 2) / 1024
+        print(f"{name:<16}{count:>8}{median:>15.1f}{best:>14.1f}{median / max(count, 1):>10.3f}{size:>8.0f}")
+
+    # Mismas filas con los dos modos de dibujo de las tablas
+    print(f"\n{'Reporte':<16}{'Platypus (filas/s)':>20}{'Canvas (filas/s)':>18}{'Mejora':>9}")
+    for name in REPORTS:
+        items = data[name]
+        flowable, _ = time_call(lambda: generator.generate_report(name, items, direct=False), repeat)
+        direct, _ = time_call(lambda: generator.generate_report(name, items, direct=True), repeat)
+        print(f"{name:<16}{len(items) / flowable * 1000:>20.0f}{len(items) / direct * 1000:>18.0f}"
+              f"{flowable / direct:>8.1f}x")
+
+    # Coste que se ahorra cada petición al compartir los estilos del módulo
+    median, _ = time_call(_build_styles, repeat)
+    print(f"\nConstruir la hoja de estilos (una vez por proceso): {median:.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Medir el tiempo de generación de los reportes PDF')
+    parser.add_argument('--rows', type=int, default=500, help='filas de cada reporte (500)')
+    parser.add_argument('--repeat', type=int, default=5, help='repeticiones por reporte (5)')
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
@@ -0,0 +1,303 @@
+"""
+Eventos del calendario por ventana de fechas con caché por meses
+
+/calendar/events devuelve los entrenamientos y competiciones entre dos fechas.
+Los eventos se cargan y guardan en memoria por meses completos: una ventana
+solo consulta la base de datos para los meses que no están en caché, con una
+consulta por tipo de evento para todo el rango que falta. Cada commit que
+crea, modifica o elimina entrenamientos o competiciones invalida los meses
+afectados (ambos, si cambia la fecha); los cambios de nombres de actividades o
+entrenadores vacían la caché entera. Como otros procesos también escriben, cada
+mes caduca además tras CALENDAR_CACHE_TTL segundos.
+
+El ETag de una respuesta se calcula a partir del contenido de sus meses, por lo
+que es el mismo en todos los procesos y un cliente con la versión vigente
+recibe un 304 sin cuerpo.
+
+Para las suscripciones .ics (ics_feed.py) se guarda además una versión por
+actividad (VersionCalendario), que cada flush incrementa en la misma
+transacción para las actividades de los entrenamientos y competiciones
+modificados. Un feed solo cambia de ETag cuando cambian sus actividades. Las
+escrituras que no pasan por la sesión deben llamar a bump_activity_versions().
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, aliased
+
+from models import db, Usuario, Actividad, Entrenamiento, Competicion, VersionCalendario
+from report_cache import increment_versions
+
+# Meses que se conservan en memoria como máximo
+MAX_MONTHS = 60
+
+# Marca de invalidación completa en la lista de meses pendientes
+ALL_MONTHS = 'all'
+
+# Versión común a todas las actividades, para cambios cuyas actividades no se conocen
+ALL_ACTIVITIES = 0
+
+
+def month_of(fecha):
+    return (fecha.year, fecha.month)
+
+
+def months_between(start, end):
+    """Meses (año, mes) que cubren las fechas de ``start`` a ``end`` incluidas"""
+    year, month = start.year, start.month
+    months = []
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def _month_bounds(first, last):
+    start = date(first[0], first[1], 1)
+    year, month = last
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+class MonthBucket:
+    """Eventos de un mes ya serializados y el resumen de su contenido"""
+
+    __slots__ = ('entrenamientos', 'competiciones', 'digest', 'loaded_at')
+
+    def __init__(self, entrenamientos, competiciones):
+        self.entrenamientos = entrenamientos
+        self.competiciones = competiciones
+        raw = json.dumps([entrenamientos, competiciones], sort_keys=True, separators=(',', ':'))
+        self.digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        self.loaded_at = time.monotonic()
+
+
+class CalendarCache:
+    """Caché por meses compartida por todas las peticiones del proceso"""
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._buckets = OrderedDict()
+        # Contador de invalidaciones por mes: una carga iniciada antes de una
+        # invalidación no debe guardarse después de ella
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('CALENDAR_CACHE_TTL', self.ttl)
+        event.listen(Session, 'after_flush', _collect_months)
+        event.listen(Session, 'after_flush', _bump_on_flush)
+        event.listen(Session, 'after_commit', _publish_months)
+        event.listen(Session, 'after_rollback', _discard_months)
+
+    def invalidate(self, months):
+        with self._lock:
+            if ALL_MONTHS in months:
+                self._buckets.clear()
+                self._epoch += 1
+                return
+            for month in months:
+                self._buckets.pop(month, None)
+                self._generations[month] = self._generations.get(month, 0) + 1
+
+    def events(self, start, end):
+        """(entrenamientos, competiciones, etag) con fecha entre ``start`` y ``end``"""
+        months = months_between(start, end)
+        buckets = self._get_buckets(months)
+
+        start_iso, end_iso = start.isoformat(), end.isoformat()
+        entrenamientos = []
+        competiciones = []
+        for month in months:
+            bucket = buckets[month]
+            entrenamientos.extend(e for e in bucket.entrenamientos if start_iso <= e['fecha'] <= end_iso)
+            competiciones.extend(c for c in bucket.competiciones if start_iso <= c['fecha'] <= end_iso)
+
+        return entrenamientos, competiciones, self._etag(start, end, months, buckets)
+
+    def digest(self, start, end):
+        """Resumen del contenido de la ventana (sirve de ETag sin construir la respuesta)"""
+        months = months_between(start, end)
+        return self._etag(start, end, months, self._get_buckets(months))
+
+    @staticmethod
+    def _etag(start, end, months, buckets):
+        key = f'{start.isoformat()}:{end.isoformat()}:' + ':'.join(buckets[month].digest for month in months)
+        return hashlib.sha1(key.encode('ascii')).hexdigest()
+
+    def _get_buckets(self, months):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for month in months:
+                bucket = self._buckets.get(month)
+                if bucket is not None and (not self.ttl or now - bucket.loaded_at < self.ttl):
+                    self._buckets.move_to_end(month)
+                    found[month] = bucket
+            missing = [month for month in months if month not in found]
+            generations = {month: self._generations.get(month, 0) for month in missing}
+            epoch = self._epoch
+
+        if not missing:
+            return found
+
+        loaded = self._load(missing[0], missing[-1])
+        with self._lock:
+            for month in missing:
+                bucket = loaded.get(month) or MonthBucket([], [])
+                found[month] = bucket
+                if self._epoch == epoch and self._generations.get(month, 0) == generations[month]:
+                    self._buckets[month] = bucket
+                    self._buckets.move_to_end(month)
+            while len(self._buckets) > MAX_MONTHS:
+                self._buckets.popitem(last=False)
+        return found
+
+    def _load(self, first, last):
+        """Eventos de los meses de ``first`` a ``last`` con una consulta por tipo"""
+        start, end = _month_bounds(first, last)
+        events = {}
+
+        entrenador = aliased(Usuario)
+        rows = db.session.query(Entrenamiento.id_entrenamiento, Entrenamiento.fecha,
+                                Actividad.nombre_actividad, entrenador.nombre, entrenador.apellido)\
+            .join(Actividad, Entrenamiento.id_actividad == Actividad.id_actividad)\
+            .join(entrenador, Entrenamiento.id_entrenador == entrenador.id_usuario)\
+            .filter(Entrenamiento.fecha >= start, Entrenamiento.fecha < end)\
+            .order_by(Entrenamiento.fecha, Entrenamiento.id_entrenamiento)
+        for id_entrenamiento, fecha, actividad, nombre, apellido in rows:
+            events.setdefault(month_of(fecha), ([], []))[0].append({
+                'id': id_entrenamiento,
+                'fecha': fecha.isoformat(),
+                'actividad': actividad,
+                'entrenador': f'{nombre} {apellido}',
+            })
+
+        rows = db.session.query(Competicion.id_competicion, Competicion.fecha, Competicion.nombre,
+                                Competicion.ubicacion, Actividad.nombre_actividad)\
+            .outerjoin(Actividad, Competicion.id_actividad == Actividad.id_actividad)\
+            .filter(Competicion.fecha >= start, Competicion.fecha < end)\
+            .order_by(Competicion.fecha, Competicion.id_competicion)
+        for id_competicion, fecha, nombre, ubicacion, actividad in rows:
+            competicion = {'id': id_competicion, 'fecha': fecha.isoformat(), 'nombre': nombre}
+            # Campos opcionales solo si tienen valor, para mantener la respuesta compacta
+            if ubicacion:
+                competicion['ubicacion'] = ubicacion
+            if actividad:
+                competicion['actividad'] = actividad
+            events.setdefault(month_of(fecha), ([], []))[1].append(competicion)
+
+        return {month: MonthBucket(*lists) for month, lists in events.items()}
+
+
+def _changed_months(obj, deleted=False):
+    """Meses afectados por un entrenamiento o competición modificado o eliminado"""
+    state = inspect(obj)
+    history = state.attrs.fecha.history
+    if deleted:
+        fecha = history.deleted[0] if history.deleted else state.dict.get('fecha')
+        return {month_of(fecha)} if fecha else {ALL_MONTHS}
+    months = {month_of(fecha) for fecha in history.sum() if fecha}
+    if history.added and not history.deleted:
+        # Nueva fecha sobre un atributo caducado: la anterior es desconocida
+        months.add(ALL_MONTHS)
+    elif not months:
+        months.add(month_of(obj.fecha))
+    return months
+
+
+def _collect_months(session, flush_context):
+    pending = session.info.setdefault('calendar_months', set())
+    for obj in session.new:
+        if isinstance(obj, (Entrenamiento, Competicion)) and obj.fecha:
+            pending.add(month_of(obj.fecha))
+    for obj in session.deleted:
+        if isinstance(obj, (Entrenamiento, Competicion)):
+            pending |= _changed_months(obj, deleted=True)
+        elif isinstance(obj, Actividad):
+            pending.add(ALL_MONTHS)
+    for obj in session.dirty:
+        if isinstance(obj, (Entrenamiento, Competicion)):
+            pending |= _changed_months(obj)
+        elif isinstance(obj, Actividad) and inspect(obj).attrs.nombre_actividad.history.has_changes():
+            pending.add(ALL_MONTHS)
+        elif isinstance(obj, Usuario):
+            state = inspect(obj)
+            if state.attrs.nombre.history.has_changes() or state.attrs.apellido.history.has_changes():
+                pending.add(ALL_MONTHS)
+
+
+def _publish_months(session):
+    months = session.info.pop('calendar_months', None)
+    if months:
+        calendar_cache.invalidate(months)
+
+
+def _discard_months(session):
+    session.info.pop('calendar_months', None)
+
+
+def bump_activity_versions(connection, ids):
+    """Incrementar la versión de las actividades ``ids`` (ALL_ACTIVITIES: todas)"""
+    increment_versions(connection, VersionCalendario.__table__, 'id_actividad', ids)
+
+
+def activity_versions(ids):
+    """Versiones de las actividades ``ids``: [(id_actividad, versión)] con ALL_ACTIVITIES delante"""
+    ids = sorted(set(ids) | {ALL_ACTIVITIES})
+    versions = dict(db.session.query(VersionCalendario.id_actividad, VersionCalendario.version)
+                    .filter(VersionCalendario.id_actividad.in_(ids)))
+    return [(id_actividad, versions.get(id_actividad, 0)) for id_actividad in ids]
+
+
+def _changed_activities(obj, deleted=False):
+    """Actividades afectadas por un entrenamiento o competición (la anterior, si cambia)"""
+    state = inspect(obj)
+    if deleted:
+        history = state.attrs.id_actividad.history
+        id_actividad = history.deleted[0] if history.deleted else state.dict.get('id_actividad')
+        return {id_actividad} if id_actividad else {ALL_ACTIVITIES}
+    history = state.attrs.id_actividad.history
+    activities = {id_actividad for id_actividad in history.sum() if id_actividad}
+    if history.added and not history.deleted:
+        # Actividad nueva sobre un atributo caducado: la anterior es desconocida
+        activities.add(ALL_ACTIVITIES)
+    elif not activities and obj.id_actividad:
+        activities.add(obj.id_actividad)
+    return activities
+
+
+def _bump_on_flush(session, flush_context):
+    activities = set()
+    trainers = set()
+    for obj in session.new:
+        if isinstance(obj, (Entrenamiento, Competicion)) and obj.id_actividad:
+            activities.add(obj.id_actividad)
+    for obj in session.deleted:
+        if isinstance(obj, (Entrenamiento, Competicion)):
+            activities |= _changed_activities(obj, deleted=True)
+    for obj in session.dirty:
+        if isinstance(obj, (Entrenamiento, Competicion)):
+            activities |= _changed_activities(obj)
+        elif isinstance(obj, Actividad) and inspect(obj).attrs.nombre_actividad.history.has_changes():
+            activities.add(obj.id_actividad)
+        elif isinstance(obj, Usuario):
+            state = inspect(obj)
+            if state.attrs.nombre.history.has_changes() or state.attrs.apellido.history.has_changes():
+                trainers.add(obj.id_usuario)
+    if trainers:
+        # El nombre del entrenador aparece en los entrenamientos que dirige
+        activities.update(session.connection().execute(
+            select(Entrenamiento.id_actividad).where(Entrenamiento.id_entrenador.in_(trainers)).distinct()).scalars())
+    if activities:
+        bump_activity_versions(session.connection(), activities)
+
+
+calendar_cache = CalendarCache()
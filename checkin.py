@@ -0,0 +1,288 @@
+"""
+Check-in de los miembros en un kiosco
+
+El entrenador abre en un dispositivo de la instalación (tablet, PC con lector
+de códigos) la página del kiosco de un entrenamiento, identificada por un token
+firmado con SECRET_KEY que caduca a las KIOSK_TOKEN_MAX_AGE segundos, así que
+el kiosco no necesita una sesión iniciada. Cada miembro se registra escaneando
+o tecleando su código de check-in: su id y un PIN de seis cifras derivado de
+SECRET_KEY y de la versión de su código (credentials.py), de modo que el
+miembro puede regenerarlo si se ha difundido. Como un PIN de seis cifras se
+puede adivinar probando, los códigos incorrectos se cuentan por miembro (el
+id del código) y por kiosco durante CHECKIN_LOCKOUT_SECONDS: pasados
+CHECKIN_MAX_FAILURES fallos de un miembro, sus códigos solo se comprueban tras
+una espera desde el último fallo que se duplica con cada nuevo fallo (hasta
+CHECKIN_LOCKOUT_SECONDS). Los fallos de unos miembros no retrasan a los demás;
+el kiosco entero solo se frena a partir de CHECKIN_KIOSK_MAX_FAILURES fallos,
+muy por encima de las erratas de una llegada en masa.
+
+Al empezar un entrenamiento llegan muchos miembros en pocos minutos, así que
+los check-ins no se escriben uno a uno: las peticiones los dejan en una cola y
+un único hilo escritor los agrupa (hasta CHECKIN_BATCH_SIZE, esperando como
+mucho CHECKIN_BATCH_WAIT_MS desde el primero) y los guarda con un commit por
+grupo mediante attendance.write_attendance. Mientras un grupo se escribe, los
+siguientes check-ins se acumulan para el próximo. Registrar dos veces al mismo
+miembro no crea otra asistencia (uq_asistencia_entrenamiento_miembro): la
+segunda respuesta indica que ya estaba registrado.
+"""
+
+import hashlib
+import hmac
+import logging
+import queue
+import re
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+import attendance
+import credentials
+from models import db, Usuario, Rol, Entrenamiento
+
+logger = logging.getLogger('club_deportivo.checkin')
+
+REGISTRADA = 'registrada'
+YA_REGISTRADA = 'ya_registrada'
+NO_VALIDO = 'no_valido'
+BLOQUEADO = 'bloqueado'
+
+# Cifras del PIN que sigue al id del miembro en su código de check-in
+PIN_DIGITS = 6
+
+# Claves de FailedCodes a partir de las cuales se descartan las que ya no tienen fallos recientes
+MAX_TRACKED_KEYS = 10000
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='kiosco')
+
+
+def kiosk_token(id_entrenamiento):
+    """Token de la página del kiosco de un entrenamiento"""
+    return _serializer().dumps(int(id_entrenamiento))
+
+
+def read_kiosk_token(token):
+    """id del entrenamiento de un token válido y no caducado, o None"""
+    try:
+        id_entrenamiento = _serializer().loads(token, max_age=current_app.config['KIOSK_TOKEN_MAX_AGE'])
+    except (BadSignature, TypeError, ValueError):
+        return None
+    return id_entrenamiento if isinstance(id_entrenamiento, int) else None
+
+
+def _pin(id_miembro, version):
+    digest = hmac.new(current_app.config['SECRET_KEY'].encode(), f'checkin:{id_miembro}:{version}'.encode(),
+                      hashlib.sha256).digest()
+    return f'{int.from_bytes(digest[:8], "big") % 10 ** PIN_DIGITS:0{PIN_DIGITS}d}'
+
+
+def checkin_code(id_miembro):
+    """Código de check-in vigente de un miembro: su id y su PIN (por ejemplo, 5-123456)"""
+    return f'{id_miembro}-{_pin(id_miembro, credentials.current_version(id_miembro, credentials.CHECKIN))}'
+
+
+def claimed_member(code):
+    """id de miembro que indica un código, sea o no válido (o None si no tiene el formato)
+
+    Se ignora todo lo que no son cifras, de modo que el código puede
+    teclearse con o sin guion o leerse con un lector de códigos de barras.
+    """
+    digits = _NON_DIGITS.sub('', code or '')
+    if len(digits) <= PIN_DIGITS or len(digits) > PIN_DIGITS + 10:
+        return None
+    return int(digits[:-PIN_DIGITS])
+
+
+def read_checkin_code(code):
+    """id del miembro de un código de check-in válido y vigente, o None"""
+    id_miembro = claimed_member(code)
+    if id_miembro is None:
+        return None
+    version = credentials.current_version(id_miembro, credentials.CHECKIN)
+    if version is None:
+        return None
+    pin = _NON_DIGITS.sub('', code)[-PIN_DIGITS:]
+    if not hmac.compare_digest(pin, _pin(id_miembro, version)):
+        return None
+    return id_miembro
+
+
+class FailedCodes:
+    """Códigos incorrectos recientes por miembro y por kiosco (en cada proceso)
+
+    Cada clave admite sin espera los fallos de su tipo (max_failures) en la
+    ventana de ``window`` segundos; a partir de ahí, tras cada fallo no se
+    comprueba ningún código de esa clave, ni siquiera uno correcto, durante 1,
+    2, 4... segundos (como mucho ``window``).
+    """
+
+    def __init__(self):
+        self.max_failures = {'miembro': 10, 'kiosco': 300}
+        self.window = 600
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.max_failures = {
+            'miembro': max(1, config.get('CHECKIN_MAX_FAILURES', self.max_failures['miembro'])),
+            'kiosco': max(1, config.get('CHECKIN_KIOSK_MAX_FAILURES', self.max_failures['kiosco'])),
+        }
+        self.window = config.get('CHECKIN_LOCKOUT_SECONDS', self.window)
+
+    def _recent(self, key, now):
+        times = self._failures.get(key)
+        while times and times[0] <= now - self.window:
+            times.popleft()
+        if times is not None and not times:
+            del self._failures[key]
+            return None
+        return times
+
+    def retry_after(self, keys):
+        """Segundos que faltan para poder comprobar un código de ``keys`` (0 si ya se puede)"""
+        now = time.monotonic()
+        wait = 0.0
+        with self._lock:
+            for key in keys:
+                times = self._recent(key, now)
+                excess = len(times or ()) - self.max_failures[key[0]]
+                if excess >= 0:
+                    wait = max(wait, min(self.window, 2 ** excess) - (now - times[-1]))
+        return max(0.0, wait)
+
+    def record(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                times = self._recent(key, now)
+                if times is None:
+                    times = self._failures[key] = deque()
+                times.append(now)
+            if len(self._failures) > MAX_TRACKED_KEYS:
+                for key in list(self._failures):
+                    self._recent(key, now)
+
+
+class _Checkin:
+    """Check-in en cola; la petición espera a que su grupo se confirme"""
+
+    __slots__ = ('id_entrenamiento', 'id_miembro', 'done', 'estado', 'nombre', 'error')
+
+    def __init__(self, id_entrenamiento, id_miembro):
+        self.id_entrenamiento = id_entrenamiento
+        self.id_miembro = id_miembro
+        self.done = threading.Event()
+        self.estado = None
+        self.nombre = None
+        self.error = None
+
+
+class CheckinBatcher:
+    """Cola de check-ins y el hilo que los escribe por grupos"""
+
+    def __init__(self):
+        self.app = None
+        self.batch_size = 100
+        self.batch_wait = 0.005
+        self.timeout = 5.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        self.batch_size = max(1, config.get('CHECKIN_BATCH_SIZE', self.batch_size))
+        self.batch_wait = config.get('CHECKIN_BATCH_WAIT_MS', self.batch_wait * 1000) / 1000
+        self.timeout = config.get('CHECKIN_TIMEOUT', self.timeout)
+
+    def check_in(self, id_entrenamiento, id_miembro):
+        """Registrar como presente al miembro; devuelve (estado, nombre del miembro)
+
+        Bloquea hasta que el grupo del check-in se ha confirmado. Lanza
+        TimeoutError si no se confirma en CHECKIN_TIMEOUT segundos, o la
+        excepción con la que falló el grupo.
+        """
+        checkin = _Checkin(id_entrenamiento, id_miembro)
+        self._ensure_writer()
+        self._queue.put(checkin)
+        if not checkin.done.wait(self.timeout):
+            raise TimeoutError('El check-in no se ha confirmado a tiempo')
+        if checkin.error is not None:
+            raise checkin.error
+        return checkin.estado, checkin.nombre
+
+    def _ensure_writer(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name='checkin-writer', daemon=True)
+                self._thread.start()
+
+    def _work(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                try:
+                    self._write(batch)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+        except Exception as exc:
+            logger.exception('Error guardando %d check-ins', len(batch))
+            for checkin in batch:
+                checkin.error = exc
+        else:
+            logger.debug('%d check-ins guardados en %.1f ms', len(batch), (time.perf_counter() - started) * 1000)
+        for checkin in batch:
+            checkin.done.set()
+
+    def _write(self, batch):
+        """Guardar un grupo en la transacción de la sesión y anotar el estado de cada check-in"""
+        trainings = {checkin.id_entrenamiento for checkin in batch}
+        members = {checkin.id_miembro for checkin in batch}
+        # Los códigos y tokens son válidos, pero el miembro o el entrenamiento
+        # pueden haberse eliminado: se descartan sin hacer fallar al resto del grupo
+        nombres = dict(db.session.query(Usuario.id_usuario, Usuario.nombre)
+                       .join(Rol, Usuario.id_rol == Rol.id_rol)
+                       .filter(Usuario.id_usuario.in_(members), Rol.nombre_rol == 'Miembro'))
+        existing = {row[0] for row in db.session.query(Entrenamiento.id_entrenamiento)
+                    .filter(Entrenamiento.id_entrenamiento.in_(trainings))}
+
+        marks = {(checkin.id_entrenamiento, checkin.id_miembro): (True, None) for checkin in batch
+                 if checkin.id_miembro in nombres and checkin.id_entrenamiento in existing}
+        written = attendance.write_attendance(marks, keep_observaciones=True)
+        for checkin in batch:
+            key = (checkin.id_entrenamiento, checkin.id_miembro)
+            checkin.nombre = nombres.get(checkin.id_miembro)
+            if key not in marks:
+                checkin.estado = NO_VALIDO
+            else:
+                checkin.estado = REGISTRADA if key in written else YA_REGISTRADA
+                # Solo el primero de los check-ins repetidos en el grupo lo registra
+                written.pop(key, None)
+
+
+checkin_batcher = CheckinBatcher()
+failed_codes = FailedCodes()
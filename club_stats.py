@@ -0,0 +1,161 @@
+"""
+Estadísticas del club mantenidas de forma incremental
+
+El panel de administración lee los totales de una única fila (EstadisticaClub)
+en lugar de contar las tablas en cada visita. Cada flush que inserta o elimina
+usuarios, entrenamientos o competiciones (o cambia el rol de un usuario) aplica
+la diferencia a esa fila con un UPDATE ... SET total = total + n dentro de la
+misma transacción, de modo que un rollback también deshace el ajuste.
+
+Las operaciones que no pasan por la sesión (DELETE masivos, SQL manual) no se
+reflejan salvo que llamen a record_changes, como las importaciones CSV;
+`python reconcile_stats.py` recalcula los totales desde cero.
+"""
+
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+from models import db, Usuario, Rol, Entrenamiento, Competicion, EstadisticaClub
+
+STATS_ID = 1
+
+# Modelo -> columna con su total
+COUNTERS = {
+    Usuario: 'total_usuarios',
+    Entrenamiento: 'total_entrenamientos',
+    Competicion: 'total_competiciones',
+}
+
+# Nombre de rol -> columna con su total
+ROLE_COUNTERS = {
+    'Entrenador': 'total_entrenadores',
+    'Miembro': 'total_miembros',
+}
+
+# id_rol -> nombre_rol (los roles apenas cambian; se vacía si se modifica alguno)
+_role_names = {}
+
+
+def _role_counter(session, id_rol):
+    if id_rol is None:
+        return None
+    if id_rol not in _role_names:
+        _role_names[id_rol] = session.connection().execute(
+            select(Rol.nombre_rol).where(Rol.id_rol == id_rol)).scalar()
+    return ROLE_COUNTERS.get(_role_names[id_rol])
+
+
+def _previous_rol(usuario):
+    """id_rol antes de los cambios pendientes, o None si no ha cambiado"""
+    state = inspect(usuario)
+    history = state.attrs.id_rol.history
+    if history.deleted:
+        return history.deleted[0]
+    rol_history = state.attrs.rol.history
+    if rol_history.deleted and rol_history.deleted[0] is not None:
+        return rol_history.deleted[0].id_rol
+    return None
+
+
+def _collect_deltas(session):
+    deltas = Counter()
+
+    def count(obj, sign):
+        column = COUNTERS.get(type(obj))
+        if column:
+            deltas[column] += sign
+        if isinstance(obj, Usuario):
+            role_column = _role_counter(session, obj.id_rol)
+            if role_column:
+                deltas[role_column] += sign
+
+    if any(isinstance(obj, Rol) for obj in session.dirty | session.deleted):
+        _role_names.clear()
+
+    for obj in session.new:
+        count(obj, 1)
+    for obj in session.deleted:
+        count(obj, -1)
+    for obj in session.dirty:
+        if not isinstance(obj, Usuario):
+            continue
+        previous = _previous_rol(obj)
+        if previous is not None and previous != obj.id_rol:
+            for id_rol, sign in ((previous, -1), (obj.id_rol, 1)):
+                role_column = _role_counter(session, id_rol)
+                if role_column:
+                    deltas[role_column] += sign
+
+    return {column: delta for column, delta in deltas.items() if delta}
+
+
+def _apply(connection, deltas):
+    values = {column: getattr(EstadisticaClub, column) + delta for column, delta in deltas.items()}
+    values['actualizado'] = datetime.utcnow()
+    # Si la fila aún no existe no se actualiza nada: get_stats() la creará completa
+    connection.execute(
+        update(EstadisticaClub).where(EstadisticaClub.id == STATS_ID).values(**values))
+
+
+def _apply_deltas(session, flush_context):
+    deltas = _collect_deltas(session)
+    if not deltas:
+        return
+    _apply(session.connection(), deltas)
+
+
+def record_changes(connection, deltas):
+    """Ajustar los totales por filas escritas sin pasar por la sesión
+
+    ``deltas`` es {columna: diferencia}, por ejemplo {'total_usuarios': 10}.
+    """
+    deltas = {column: delta for column, delta in deltas.items() if delta}
+    if deltas:
+        _apply(connection, deltas)
+
+
+def compute_stats():
+    """Totales calculados desde cero con COUNT(*)"""
+    role_totals = dict(db.session.query(Rol.nombre_rol, func.count(Usuario.id_usuario))
+                       .join(Usuario, Usuario.id_rol == Rol.id_rol)
+                       .group_by(Rol.nombre_rol).all())
+    totals = {
+        'total_usuarios': db.session.query(func.count(Usuario.id_usuario)).scalar(),
+        'total_entrenamientos': db.session.query(func.count(Entrenamiento.id_entrenamiento)).scalar(),
+        'total_competiciones': db.session.query(func.count(Competicion.id_competicion)).scalar(),
+    }
+    for nombre_rol, column in ROLE_COUNTERS.items():
+        totals[column] = role_totals.get(nombre_rol, 0)
+    return totals
+
+
+def reconcile():
+    """Recalcular la fila de estadísticas y guardarla; devuelve (fila, diferencias)"""
+    totals = compute_stats()
+    stats = db.session.get(EstadisticaClub, STATS_ID, with_for_update=True, populate_existing=True)
+    if stats is None:
+        stats = EstadisticaClub(id=STATS_ID)
+        db.session.add(stats)
+    differences = {column: (getattr(stats, column) or 0, value)
+                   for column, value in totals.items() if getattr(stats, column) != value}
+    for column, value in totals.items():
+        setattr(stats, column, value)
+    stats.actualizado = datetime.utcnow()
+    db.session.commit()
+    return stats, differences
+
+
+def get_stats():
+    """Fila de estadísticas actual (se crea con reconcile() si no existe)"""
+    stats = db.session.get(EstadisticaClub, STATS_ID, populate_existing=True)
+    if stats is None:
+        stats, _ = reconcile()
+    return stats
+
+
+def init_app(app):
+    if not event.contains(Session, 'after_flush', _apply_deltas):
+        event.listen(Session, 'after_flush', _apply_deltas)
@@ -33,3 +33,80 @@ class Config:
 
     # Fallback local: MySQL en localhost (solo para desarrollo)
     SQLALCHEMY_DATABASE_URI = _env_db or 'mysql+pymysql://root@localhost/club_deportivo'
+
+    # Número de filas por página en los listados de administración (paginación keyset)
+    ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE', 50))
+    # Número de filas por página en el historial de asistencias de un miembro
+    MEMBER_PAGE_SIZE = int(os.environ.get('MEMBER_PAGE_SIZE', 25))
+    # Días hacia delante que muestra el panel del miembro como próximos entrenamientos
+    MEMBER_UPCOMING_DAYS = int(os.environ.get('MEMBER_UPCOMING_DAYS', 14))
+
+    # Segundos tras los que el índice de búsqueda en memoria se reconstruye en segundo plano
+    # para recoger cambios hechos por otros procesos (0 = nunca)
+    SEARCH_INDEX_MAX_AGE = int(os.environ.get('SEARCH_INDEX_MAX_AGE', 300))
+
+    # Calendario (calendar_feed.py): días máximos de una ventana de /calendar/events y
+    # segundos que se reutiliza cada mes en caché antes de volver a leerlo
+    CALENDAR_MAX_DAYS = int(os.environ.get('CALENDAR_MAX_DAYS', 62))
+    CALENDAR_CACHE_TTL = int(os.environ.get('CALENDAR_CACHE_TTL', 60))
+    # Suscripciones .ics (ics_feed.py): días hacia atrás y hacia delante que incluye cada feed
+    ICS_PAST_DAYS = int(os.environ.get('ICS_PAST_DAYS', 30))
+    ICS_FUTURE_DAYS = int(os.environ.get('ICS_FUTURE_DAYS', 180))
+
+    # Instrumentación SQL por petición (query_stats.py)
+    # Línea de log JSON por petición con el número de consultas y el tiempo en BD
+    QUERY_STATS_LOG = os.environ.get('QUERY_STATS_LOG', '1').lower() in ('1', 'true', 'yes')
+    # Consultas más lentas que este umbral (ms) van al log de lentas con su EXPLAIN (0 = desactivado)
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+    # Fichero del log de consultas lentas (vacío = salida de errores estándar)
+    SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', '')
+    # Máximo de consultas por petición (0 = sin límite global; las vistas pueden fijar el suyo)
+    QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', 0))
+    # Si está activo, una petición que supera su presupuesto falla en lugar de solo registrarse
+    QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', '').lower() in ('1', 'true', 'yes')
+
+    # Segundos que se reutiliza la identidad y el rol del usuario autenticado sin consultar la BD
+    # (0 = sin caché). Editar o eliminar un usuario la invalida en el proceso que lo hace.
+    PRINCIPAL_CACHE_TTL = int(os.environ.get('PRINCIPAL_CACHE_TTL', 60))
+
+    # Hash de contraseñas (passwords.py): método y coste en el formato de werkzeug
+    # ('pbkdf2:sha256:600000', 'scrypt:32768:8:1'...). Al cambiarlo, los hashes guardados
+    # se recalculan con el nuevo en el siguiente inicio de sesión de cada usuario.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    # Hilos que calculan hashes a la vez en cada proceso (0 = uno por núcleo)
+    PASSWORD_HASH_THREADS = int(os.environ.get('PASSWORD_HASH_THREADS', 0))
+
+    # Cola de reportes PDF (report_jobs.py)
+    # Base de datos SQLite de la cola y carpeta de los PDF generados (por defecto en instance/)
+    REPORT_JOBS_DB = os.environ.get('REPORT_JOBS_DB', '')
+    REPORT_JOBS_DIR = os.environ.get('REPORT_JOBS_DIR', '')
+    # Hilos worker dentro del proceso web (0 = los trabajos los procesa `python report_worker.py`)
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 1))
+    # Segundos sin latido tras los que un trabajo en curso se considera abandonado y se reintenta
+    REPORT_JOB_TIMEOUT = int(os.environ.get('REPORT_JOB_TIMEOUT', 600))
+    # Segundos que se conservan los reportes generados para su descarga
+    REPORT_JOB_RETENTION = int(os.environ.get('REPORT_JOB_RETENTION', 86400))
+    # Procesos que generan en paralelo los PDF del ZIP de todos los miembros (0 = uno por núcleo)
+    REPORT_ZIP_PROCESSES = int(os.environ.get('REPORT_ZIP_PROCESSES', 0))
+    # Caché en disco de los reportes PDF (report_cache.py): carpeta (por defecto en instance/)
+    # y tamaño máximo en MB antes de eliminar los menos usados (0 = sin caché)
+    REPORT_CACHE_DIR = os.environ.get('REPORT_CACHE_DIR', '')
+    REPORT_CACHE_MAX_MB = int(os.environ.get('REPORT_CACHE_MAX_MB', 200))
+
+    # Importación CSV (imports.py): procesos que calculan las contraseñas (0 = uno por núcleo)
+    IMPORT_HASH_PROCESSES = int(os.environ.get('IMPORT_HASH_PROCESSES', 0))
+    # Errores que se muestran en la página tras importar (el informe descargable los tiene todos)
+    IMPORT_ERRORS_SHOWN = int(os.environ.get('IMPORT_ERRORS_SHOWN', 50))
+
+    # Check-in en kiosco (checkin.py): segundos de validez del enlace de un kiosco
+    KIOSK_TOKEN_MAX_AGE = int(os.environ.get('KIOSK_TOKEN_MAX_AGE', 12 * 3600))
+    # Check-ins máximos por commit, milisegundos que espera un grupo a que lleguen más
+    # y segundos que una petición espera a que se confirme el suyo
+    CHECKIN_BATCH_SIZE = int(os.environ.get('CHECKIN_BATCH_SIZE', 100))
+    CHECKIN_BATCH_WAIT_MS = float(os.environ.get('CHECKIN_BATCH_WAIT_MS', 5))
+    CHECKIN_TIMEOUT = float(os.environ.get('CHECKIN_TIMEOUT', 5))
+    # Códigos incorrectos de un miembro, y de todo un kiosco, que se admiten sin espera; a partir
+    # de ahí cada fallo duplica la espera. Segundos de la ventana en que se cuentan (y espera máxima)
+    CHECKIN_MAX_FAILURES = int(os.environ.get('CHECKIN_MAX_FAILURES', 10))
+    CHECKIN_KIOSK_MAX_FAILURES = int(os.environ.get('CHECKIN_KIOSK_MAX_FAILURES', 300))
+    CHECKIN_LOCKOUT_SECONDS = int(os.environ.get('CHECKIN_LOCKOUT_SECONDS', 600))
@@ -0,0 +1,34 @@
+"""
+Versiones de las credenciales personales derivadas de SECRET_KEY
+
+El código de check-in de un miembro (checkin.py) y los enlaces de suscripción
+al calendario (ics_feed.py) no se guardan: se calculan firmando con SECRET_KEY
+el id del usuario y la versión de la credencial (CredencialUsuario). Al
+regenerar una credencial se incrementa su versión y las anteriores dejan de
+ser válidas, sin afectar a las del resto de usuarios.
+"""
+
+from sqlalchemy import func
+
+from models import db, Usuario, CredencialUsuario
+
+CHECKIN = 'version_checkin'
+CALENDARIO = 'version_calendario'
+
+
+def current_version(id_usuario, credencial):
+    """Versión vigente de la credencial del usuario, o None si el usuario no existe"""
+    row = db.session.query(Usuario.id_usuario, func.coalesce(getattr(CredencialUsuario, credencial), 0))\
+        .outerjoin(CredencialUsuario, CredencialUsuario.id_usuario == Usuario.id_usuario)\
+        .filter(Usuario.id_usuario == id_usuario).first()
+    return None if row is None else row[1]
+
+
+def rotate(id_usuario, credencial):
+    """Invalidar la credencial del usuario; el cambio lo guarda quien hace el commit"""
+    row = db.session.get(CredencialUsuario, id_usuario, with_for_update=True)
+    if row is None:
+        row = CredencialUsuario(id_usuario=id_usuario, version_checkin=0, version_calendario=0)
+        db.session.add(row)
+    setattr(row, credencial, getattr(row, credencial) + 1)
+    return getattr(row, credencial)
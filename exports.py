@@ -0,0 +1,171 @@
+"""
+Exportaciones CSV y NDJSON de los datos de los reportes
+
+/reports/export/<conjunto>.<formato> genera la exportación en el servidor en
+lugar de copiar la tabla HTML ya renderizada (window.exportToCSV). Las filas se
+leen con yield_per, que usa un cursor del servidor cuando el driver lo permite,
+y se escriben a la respuesta a medida que llegan: la memoria no depende del
+número de filas y la cabecera se envía antes de leer la primera.
+
+Los conjuntos con fecha admiten los parámetros start_date y end_date
+(AAAA-MM-DD, ambos incluidos).
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from sqlalchemy.orm import aliased
+
+from models import db, Usuario, Rol, Actividad, Entrenamiento, Asistencia, Competicion, ResultadoCompeticion
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+# Filas que se leen del cursor en cada viaje a la base de datos
+STREAM_BATCH = 1000
+
+# Caracteres que se acumulan antes de enviar un trozo de la respuesta
+CHUNK_SIZE = 64 * 1024
+
+
+def _between(query, column, start, end):
+    if start:
+        query = query.filter(column >= start)
+    if end:
+        query = query.filter(column <= end)
+    return query
+
+
+def _usuarios(start, end):
+    return db.session.query(Usuario.id_usuario, Usuario.nombre, Usuario.apellido, Usuario.email,
+                            Usuario.fecha_nacimiento, Rol.nombre_rol.label('rol'))\
+        .outerjoin(Rol, Usuario.id_rol == Rol.id_rol)\
+        .order_by(Usuario.id_usuario)
+
+
+def _entrenamientos(start, end):
+    entrenador = aliased(Usuario)
+    query = db.session.query(Entrenamiento.id_entrenamiento, Entrenamiento.fecha,
+                             Actividad.nombre_actividad.label('actividad'), Entrenamiento.id_entrenador,
+                             entrenador.nombre.label('entrenador_nombre'),
+                             entrenador.apellido.label('entrenador_apellido'))\
+        .join(Actividad, Entrenamiento.id_actividad == Actividad.id_actividad)\
+        .join(entrenador, Entrenamiento.id_entrenador == entrenador.id_usuario)
+    return _between(query, Entrenamiento.fecha, start, end)\
+        .order_by(Entrenamiento.fecha, Entrenamiento.id_entrenamiento)
+
+
+def _competiciones(start, end):
+    query = db.session.query(Competicion.id_competicion, Competicion.nombre, Competicion.fecha,
+                             Competicion.ubicacion, Actividad.nombre_actividad.label('actividad'),
+                             Competicion.descripcion)\
+        .outerjoin(Actividad, Competicion.id_actividad == Actividad.id_actividad)
+    return _between(query, Competicion.fecha, start, end)\
+        .order_by(Competicion.fecha, Competicion.id_competicion)
+
+
+def _asistencias(start, end):
+    miembro = aliased(Usuario)
+    query = db.session.query(Asistencia.id_asistencia, Entrenamiento.fecha, Asistencia.id_entrenamiento,
+                             Actividad.nombre_actividad.label('actividad'), Asistencia.id_miembro,
+                             miembro.nombre.label('miembro_nombre'), miembro.apellido.label('miembro_apellido'),
+                             Asistencia.presente, Asistencia.observaciones)\
+        .join(Entrenamiento, Asistencia.id_entrenamiento == Entrenamiento.id_entrenamiento)\
+        .join(Actividad, Entrenamiento.id_actividad == Actividad.id_actividad)\
+        .join(miembro, Asistencia.id_miembro == miembro.id_usuario)
+    # Por clave primaria: el orden no obliga a ordenar toda la tabla antes de la primera fila
+    return _between(query, Entrenamiento.fecha, start, end).order_by(Asistencia.id_asistencia)
+
+
+def _resultados(start, end):
+    participante = aliased(Usuario)
+    query = db.session.query(ResultadoCompeticion.id_resultado, ResultadoCompeticion.id_competicion,
+                             Competicion.nombre.label('competicion'), Competicion.fecha,
+                             ResultadoCompeticion.id_usuario, participante.nombre.label('participante_nombre'),
+                             participante.apellido.label('participante_apellido'),
+                             ResultadoCompeticion.posicion, ResultadoCompeticion.marca,
+                             ResultadoCompeticion.observaciones)\
+        .join(Competicion, ResultadoCompeticion.id_competicion == Competicion.id_competicion)\
+        .join(participante, ResultadoCompeticion.id_usuario == participante.id_usuario)
+    return _between(query, Competicion.fecha, start, end)\
+        .order_by(Competicion.fecha, ResultadoCompeticion.id_competicion, ResultadoCompeticion.posicion)
+
+
+DATASETS = {
+    'usuarios': _usuarios,
+    'entrenamientos': _entrenamientos,
+    'competiciones': _competiciones,
+    'asistencias': _asistencias,
+    'resultados': _resultados,
+}
+
+
+def dataset_query(name, start=None, end=None):
+    """Consulta (solo columnas, sin objetos del ORM) del conjunto ``name``"""
+    return DATASETS[name](start, end)
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'Sí' if value else 'No'
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Valor no serializable: {value!r}')
+
+
+def iter_csv(query):
+    """Generar el CSV por trozos de CHUNK_SIZE caracteres"""
+    columns = [column['name'] for column in query.column_descriptions]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM para que Excel reconozca la codificación UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    for row in query.yield_per(STREAM_BATCH):
+        writer.writerow([_csv_value(value) for value in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(query):
+    """Generar un objeto JSON por línea, por trozos de CHUNK_SIZE caracteres"""
+    columns = [column['name'] for column in query.column_descriptions]
+    lines = []
+    size = 0
+    first = True
+    for row in query.yield_per(STREAM_BATCH):
+        line = json.dumps(dict(zip(columns, row)), default=_json_default, ensure_ascii=False) + '\n'
+        lines.append(line)
+        size += len(line)
+        # La primera fila se envía en cuanto llega
+        if first or size >= CHUNK_SIZE:
+            yield ''.join(lines)
+            lines = []
+            size = 0
+            first = False
+    if lines:
+        yield ''.join(lines)
+
+
+def iter_export(query, fmt):
+    return iter_csv(query) if fmt == 'csv' else iter_ndjson(query)
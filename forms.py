@@ -1,7 +1,9 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, SelectField, TextAreaField, DateField, TimeField, IntegerField, FloatField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
 from models import Usuario, Rol, Actividad, Entrenamiento, Competicion
+from sqlalchemy.orm import joinedload
 from datetime import date
 
 def validate_fecha_nacimiento(form, field):
@@ -114,12 +116,26 @@ class AsistenciaForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(AsistenciaForm, self).__init__(*args, **kwargs)
         # Cargar entrenamientos disponibles
-        self.id_entrenamiento.choices = [(e.id_entrenamiento, f"{e.actividad.nombre_actividad} - {e.fecha}") for e in Entrenamiento.query.all()]
+        self.id_entrenamiento.choices = [(e.id_entrenamiento, f"{e.actividad.nombre_actividad} - {e.fecha}") for e in Entrenamiento.query.options(joinedload(Entrenamiento.actividad)).all()]
         
         # Cargar miembros (usuarios con rol de miembro)
         miembros = Usuario.query.join(Rol).filter(Rol.nombre_rol == 'Miembro').all()
         self.id_miembro.choices = [(u.id_usuario, f"{u.nombre} {u.apellido}") for u in miembros]
 
+class ImportarForm(FlaskForm):
+    conjunto = SelectField('Datos', choices=[('usuarios', 'Usuarios'), ('entrenamientos', 'Entrenamientos'),
+                                             ('asistencias', 'Asistencias')])
+    archivo = FileField('Archivo CSV', validators=[FileRequired(), FileAllowed(['csv'], 'Solo archivos CSV')])
+    submit = SubmitField('Importar')
+
+class ListaAsistenciaForm(FlaskForm):
+    """Lista de asistencia de un entrenamiento: los estados de cada miembro se leen de la petición"""
+    submit = SubmitField('Guardar lista')
+
+class RegenerarForm(FlaskForm):
+    """Confirmación para regenerar un código o enlace personal (solo lleva el token CSRF)"""
+    submit = SubmitField('Regenerar')
+
 # Alias para compatibilidad
 MemberForm = UsuarioForm
 TrainerForm = UsuarioForm
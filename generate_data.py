@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Generador de datos sintéticos para pruebas de carga
+
+A diferencia de init_db.py, que crea unos pocos registros de ejemplo, genera
+un club del tamaño indicado: miembros repartidos en grupos de --group-size,
+cada grupo con una actividad y un entrenador, --trainings-per-week
+entrenamientos por semana (cada uno de un grupo) durante --years años hasta
+--end, más --weeks-ahead semanas de entrenamientos futuros, y competiciones
+con resultados. Cada miembro del grupo tiene la asistencia registrada en un
+entrenamiento pasado con probabilidad --registration y, si está registrada,
+está presente con una probabilidad propia alrededor de --presence.
+
+Las filas se insertan con sentencias INSERT de SQLAlchemy Core (executemany)
+en lotes de --chunk filas, con un commit por lote, sin pasar por la sesión;
+los ids se asignan aquí a partir del máximo existente, así que funciona igual
+con MySQL y con SQLite. Los resúmenes de asistencia por miembro
+(member_stats.py) se calculan mientras se generan las asistencias y se
+insertan al cerrar cada semana y cada mes; las estadísticas del panel y las
+versiones de la caché de reportes y de las suscripciones al calendario se
+actualizan al terminar. Si se interrumpe,
+los lotes ya confirmados quedan guardados: conviene empezar con --reset.
+
+Con la misma --seed y la misma --end el resultado es idéntico.
+
+Uso:
+    python generate_data.py --reset [--members 1000] [--trainers 20] [--activities 5]
+                            [--trainings-per-week 50] [--years 1] [--seed 1]
+    # ~10 millones de asistencias:
+    python generate_data.py --reset --members 20000 --trainers 400 \\
+                            --trainings-per-week 2200 --years 5
+"""
+
+import argparse
+import random
+import time
+import unicodedata
+from collections import defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import func, select
+
+from app import app, db
+import club_stats
+from calendar_feed import ALL_ACTIVITIES, bump_activity_versions
+from member_stats import period_starts, SEMANA, MES
+from migrate_indexes import backs_foreign_key
+from models import Usuario, Rol, Actividad, Entrenamiento, Asistencia, Competicion, ResultadoCompeticion, \
+    ResumenAsistencia
+from passwords import password_hasher
+from report_cache import TRACKED_TABLES, bump_versions
+
+NOMBRES = ('Juan', 'María', 'Pedro', 'Laura', 'Diego', 'Ana', 'Carlos', 'Lucía', 'Javier', 'Marta',
+           'Pablo', 'Elena', 'Sergio', 'Paula', 'Andrés', 'Sofía', 'Miguel', 'Carmen', 'Raúl', 'Irene',
+           'Alberto', 'Nuria', 'Hugo', 'Claudia', 'Álvaro', 'Sara', 'Daniel', 'Cristina', 'Iván', 'Noelia')
+APELLIDOS = ('García', 'Rodríguez', 'González', 'Fernández', 'López', 'Martínez', 'Sánchez', 'Pérez',
+             'Gómez', 'Martín', 'Jiménez', 'Ruiz', 'Hernández', 'Díaz', 'Moreno', 'Muñoz', 'Álvarez',
+             'Romero', 'Alonso', 'Gutiérrez', 'Navarro', 'Torres', 'Domínguez', 'Vázquez', 'Ramos')
+ACTIVIDADES = ('Fútbol', 'Natación', 'Básquetbol', 'Tenis', 'Atletismo', 'Voleibol', 'Ciclismo',
+               'Balonmano', 'Pádel', 'Gimnasia')
+TIPOS_COMPETICION = ('Torneo', 'Campeonato', 'Copa', 'Liga', 'Open')
+UBICACIONES = ('Complejo Deportivo Municipal', 'Piscina Olímpica', 'Gimnasio Principal',
+               'Pabellón Norte', 'Estadio Municipal', None)
+OBSERVACIONES = ('Llegó tarde', 'Salió antes', 'Lesionado', 'Justificada')
+
+# Contraseñas de los usuarios generados (las de init_db.py)
+PASSWORDS = {'Administrador': 'admin123', 'Entrenador': 'trainer123', 'Miembro': 'member123'}
+
+
+def _slug(text):
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode().lower()
+
+
+def _next_id(connection, column):
+    return (connection.execute(select(func.max(column))).scalar() or 0) + 1
+
+
+class _Loader:
+    """Filas pendientes por tabla, insertadas por lotes con un commit por lote
+
+    Al llenarse un lote se insertan los pendientes de todas las tablas, en el
+    orden de las claves foráneas, para que MySQL (InnoDB) las compruebe con las
+    filas referenciadas ya guardadas.
+    """
+
+    def __init__(self, connection, chunk):
+        self.connection = connection
+        self.chunk = chunk
+        self.pending = {table: [] for table in db.metadata.sorted_tables}
+        self.counts = defaultdict(int)
+
+    def add(self, model, row):
+        rows = self.pending[model.__table__]
+        rows.append(row)
+        if len(rows) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        for table, rows in self.pending.items():
+            if rows:
+                self.connection.execute(table.insert(), rows)
+                self.counts[table.name] += len(rows)
+                rows.clear()
+        self.connection.commit()
+
+
+class _Summaries:
+    """Resúmenes de asistencia de los miembros generados, calculados al vuelo
+
+    Los entrenamientos se generan en orden de fecha, así que los resúmenes de
+    una semana o un mes se insertan en cuanto no puede haber más asistencias
+    en ellos y en memoria solo quedan los periodos abiertos.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        # (periodo, inicio) -> {id_miembro: [asistencias, convocatorias]}
+        self.open = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+
+    def periods(self, fecha):
+        """Contadores abiertos de la semana, el mes y el total de ``fecha``"""
+        return [self.open[key] for key in period_starts(fecha)]
+
+    def add(self, periods, id_miembro, presente):
+        for counters in periods:
+            counter = counters[id_miembro]
+            counter[0] += presente
+            counter[1] += 1
+
+    def close_before(self, fecha):
+        """Insertar las semanas y los meses que terminan antes de ``fecha``"""
+        week = fecha - timedelta(days=fecha.weekday())
+        month = fecha.replace(day=1)
+        closed = [key for key in self.open
+                  if (key[0] == SEMANA and key[1] < week) or (key[0] == MES and key[1] < month)]
+        for key in sorted(closed):
+            self._insert(key, self.open.pop(key))
+
+    def close_all(self):
+        for key in sorted(self.open):
+            self._insert(key, self.open[key])
+        self.open.clear()
+
+    def _insert(self, key, counters):
+        periodo, inicio = key
+        for id_miembro in sorted(counters):
+            asistencias, convocatorias = counters[id_miembro]
+            self.loader.add(ResumenAsistencia, {'id_miembro': id_miembro, 'periodo': periodo, 'inicio': inicio,
+                                                'asistencias': asistencias, 'convocatorias': convocatorias})
+
+
+class Generator:
+    """Genera e inserta un club sintético según las opciones de la línea de órdenes"""
+
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.end = args.end
+        # Semanas completas (de lunes a domingo) de --years años que terminan en la semana de --end
+        last_week = self.end - timedelta(days=self.end.weekday())
+        self.first_week = last_week - timedelta(weeks=round(args.years * 52) - 1)
+        self.weeks = round(args.years * 52) + args.weeks_ahead
+
+    def run(self):
+        with db.engine.connect() as connection:
+            if connection.dialect.name == 'sqlite':
+                # Los resúmenes de cada semana se reparten por toda su clave primaria
+                # (id_miembro, periodo, inicio): caché de páginas de 256 MB para la carga
+                connection.exec_driver_sql('PRAGMA cache_size = -262144')
+            loader = _Loader(connection, self.args.chunk)
+            roles = self._roles(connection)
+            actividades = self._actividades(connection)
+            hashes = {nombre_rol: password_hasher.hash(password) for nombre_rol, password in PASSWORDS.items()}
+
+            next_usuario = _next_id(connection, Usuario.id_usuario)
+            if self.args.reset:
+                self._usuario(loader, next_usuario, 'Administrador', 'Sistema', roles['Administrador'],
+                              hashes['Administrador'], email='admin@club.com')
+                next_usuario += 1
+            entrenadores = list(range(next_usuario, next_usuario + self.args.trainers))
+            next_usuario += self.args.trainers
+            miembros = list(range(next_usuario, next_usuario + self.args.members))
+            for id_usuario in entrenadores:
+                self._usuario(loader, id_usuario, None, None, roles['Entrenador'], hashes['Entrenador'])
+            for id_usuario in miembros:
+                self._usuario(loader, id_usuario, None, None, roles['Miembro'], hashes['Miembro'])
+            loader.flush()
+            print(f"[OK] {len(entrenadores)} entrenadores y {len(miembros)} miembros")
+
+            grupos = self._grupos(miembros, entrenadores, actividades)
+            entrenamientos, asistencias = self._entrenamientos(loader, grupos)
+            print(f"[OK] {entrenamientos} entrenamientos y {asistencias} asistencias")
+
+            competiciones, resultados = self._competiciones(loader, grupos, actividades)
+            print(f"[OK] {competiciones} competiciones y {resultados} resultados")
+
+            club_stats.record_changes(connection, {
+                'total_usuarios': len(entrenadores) + len(miembros) + (1 if self.args.reset else 0),
+                'total_entrenadores': len(entrenadores),
+                'total_miembros': len(miembros),
+                'total_entrenamientos': entrenamientos,
+                'total_competiciones': competiciones,
+            })
+            bump_versions(connection, TRACKED_TABLES)
+            bump_activity_versions(connection, (ALL_ACTIVITIES,))
+            connection.commit()
+        return loader.counts
+
+    def _roles(self, connection):
+        """{nombre_rol: id_rol}, creando los roles que falten"""
+        table = Rol.__table__
+        roles = dict(connection.execute(select(table.c.nombre_rol, table.c.id_rol)).all())
+        missing = [{'nombre_rol': nombre_rol} for nombre_rol in PASSWORDS if nombre_rol not in roles]
+        if missing:
+            connection.execute(table.insert(), missing)
+            roles = dict(connection.execute(select(table.c.nombre_rol, table.c.id_rol)).all())
+        connection.commit()
+        return roles
+
+    def _actividades(self, connection):
+        """ids de las --activities actividades, creando las que falten"""
+        table = Actividad.__table__
+        nombres = [ACTIVIDADES[i] if i < len(ACTIVIDADES) else f'Actividad {i + 1}'
+                   for i in range(self.args.activities)]
+        existing = dict(connection.execute(select(table.c.nombre_actividad, table.c.id_actividad)).all())
+        missing = [{'nombre_actividad': nombre} for nombre in nombres if nombre not in existing]
+        if missing:
+            connection.execute(table.insert(), missing)
+            existing = dict(connection.execute(select(table.c.nombre_actividad, table.c.id_actividad)).all())
+        connection.commit()
+        return [existing[nombre] for nombre in nombres]
+
+    def _usuario(self, loader, id_usuario, nombre, apellido, id_rol, password_hash, email=None):
+        nombre = nombre or self.random.choice(NOMBRES)
+        apellido = apellido or self.random.choice(APELLIDOS)
+        loader.add(Usuario, {
+            'id_usuario': id_usuario,
+            'nombre': nombre,
+            'apellido': apellido,
+            # El id hace único el email también al añadir datos a una base de datos existente
+            'email': email or f'{_slug(nombre)}.{_slug(apellido)}.{id_usuario}@club.com',
+            'password_hash': password_hash,
+            'fecha_nacimiento': date(1950, 1, 1) + timedelta(days=self.random.randrange(365 * 60)),
+            'id_rol': id_rol,
+        })
+
+    def _grupos(self, miembros, entrenadores, actividades):
+        """(id_actividad, id_entrenador, [(id_miembro, probabilidad de estar presente)]) de cada grupo"""
+        if not miembros or not entrenadores:
+            return []
+        size = self.args.group_size
+        presence = self.args.presence
+        grupos = []
+        for g, start in enumerate(range(0, len(miembros), size)):
+            grupo = [(id_miembro, min(1.0, max(0.05, self.random.gauss(presence, 0.1))))
+                     for id_miembro in miembros[start:start + size]]
+            grupos.append((actividades[g % len(actividades)], entrenadores[g % len(entrenadores)], grupo))
+        return grupos
+
+    def _entrenamientos(self, loader, grupos):
+        """Entrenamientos semana a semana, cada uno con las asistencias de su grupo si ya pasó"""
+        if not grupos:
+            return 0, 0
+        rnd = self.random
+        registration = self.args.registration
+        summaries = _Summaries(loader)
+        id_entrenamiento = _next_id(loader.connection, Entrenamiento.id_entrenamiento)
+        id_asistencia = _next_id(loader.connection, Asistencia.id_asistencia)
+        entrenamientos = asistencias = 0
+        g = 0
+        for week in range(self.weeks):
+            lunes = self.first_week + timedelta(weeks=week)
+            summaries.close_before(lunes)
+            fechas = sorted(lunes + timedelta(days=rnd.randrange(6)) for _ in range(self.args.trainings_per_week))
+            for fecha in fechas:
+                id_actividad, id_entrenador, grupo = grupos[g]
+                g = (g + 1) % len(grupos)
+                loader.add(Entrenamiento, {'id_entrenamiento': id_entrenamiento, 'id_entrenador': id_entrenador,
+                                           'id_actividad': id_actividad, 'fecha': fecha})
+                entrenamientos += 1
+                if fecha <= self.end:
+                    periods = summaries.periods(fecha)
+                    for id_miembro, presence in grupo:
+                        if rnd.random() >= registration:
+                            continue
+                        presente = rnd.random() < presence
+                        loader.add(Asistencia, {
+                            'id_asistencia': id_asistencia, 'id_entrenamiento': id_entrenamiento,
+                            'id_miembro': id_miembro, 'presente': presente,
+                            'observaciones': rnd.choice(OBSERVACIONES) if rnd.random() < 0.02 else None,
+                        })
+                        summaries.add(periods, id_miembro, presente)
+                        id_asistencia += 1
+                        asistencias += 1
+                id_entrenamiento += 1
+            if week % 52 == 51:
+                print(f"  ... {lunes.year}: {entrenamientos} entrenamientos, {asistencias} asistencias")
+        summaries.close_all()
+        loader.flush()
+        return entrenamientos, asistencias
+
+    def _competiciones(self, loader, grupos, actividades):
+        """--competitions-per-year competiciones repartidas en el periodo y resultados de las pasadas"""
+        rnd = self.random
+        miembros_por_actividad = defaultdict(list)
+        for id_actividad, _, grupo in grupos:
+            miembros_por_actividad[id_actividad].extend(id_miembro for id_miembro, _ in grupo)
+        nombres = dict(loader.connection.execute(select(Actividad.id_actividad, Actividad.nombre_actividad)).all())
+        id_competicion = _next_id(loader.connection, Competicion.id_competicion)
+        days = self.weeks * 7
+        total = round(self.args.competitions_per_year * self.weeks / 52)
+        resultados = 0
+        for i in range(total):
+            id_actividad = rnd.choice(actividades)
+            fecha = self.first_week + timedelta(days=rnd.randrange(days))
+            loader.add(Competicion, {
+                'id_competicion': id_competicion,
+                'nombre': f'{rnd.choice(TIPOS_COMPETICION)} de {nombres[id_actividad]} {fecha.year} #{i + 1}',
+                'fecha': fecha,
+                'ubicacion': rnd.choice(UBICACIONES),
+                'descripcion': None,
+                'id_actividad': id_actividad,
+            })
+            participantes = miembros_por_actividad[id_actividad]
+            if fecha <= self.end and participantes:
+                for posicion, id_usuario in enumerate(
+                        rnd.sample(participantes, min(self.args.results, len(participantes))), 1):
+                    loader.add(ResultadoCompeticion, {
+                        'id_competicion': id_competicion, 'id_usuario': id_usuario, 'posicion': posicion,
+                        'marca': f'{rnd.randrange(1, 60)}:{rnd.randrange(60):02d}', 'observaciones': None,
+                    })
+                    resultados += 1
+            id_competicion += 1
+        loader.flush()
+        return total, resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reset', action='store_true',
+                        help='Eliminar todas las tablas y empezar con una base de datos vacía (y admin@club.com)')
+    parser.add_argument('--members', type=int, default=1000, help='Miembros')
+    parser.add_argument('--trainers', type=int, default=20, help='Entrenadores')
+    parser.add_argument('--activities', type=int, default=5, help='Actividades')
+    parser.add_argument('--group-size', type=int, default=20, help='Miembros por grupo de entrenamiento')
+    parser.add_argument('--trainings-per-week', type=int, default=50, help='Entrenamientos por semana')
+    parser.add_argument('--years', type=float, default=1, help='Años de historial')
+    parser.add_argument('--weeks-ahead', type=int, default=4, help='Semanas de entrenamientos futuros')
+    parser.add_argument('--end', type=date.fromisoformat, default=date.today(),
+                        help='Último día con asistencias (AAAA-MM-DD, por defecto hoy)')
+    parser.add_argument('--registration', type=float, default=0.9,
+                        help='Probabilidad de que un miembro tenga la asistencia registrada')
+    parser.add_argument('--presence', type=float, default=0.8,
+                        help='Probabilidad media de estar presente en una asistencia registrada')
+    parser.add_argument('--competitions-per-year', type=int, default=24, help='Competiciones por año')
+    parser.add_argument('--results', type=int, default=10, help='Resultados por competición')
+    parser.add_argument('--chunk', type=int, default=10000, help='Filas por INSERT y por commit')
+    parser.add_argument('--seed', type=int, default=1, help='Semilla de los datos generados')
+    args = parser.parse_args()
+    if args.group_size < 1 or args.chunk < 1 or (args.members and not args.trainers):
+        parser.error('--group-size y --chunk deben ser positivos y los miembros necesitan entrenadores')
+
+    with app.app_context():
+        indexes = []
+        if args.reset:
+            db.drop_all()
+            db.create_all()
+            # En tablas vacías es más rápido crear los índices secundarios al final
+            # que mantenerlos fila a fila (las claves primarias y únicas se conservan).
+            # En MySQL se conservan también los que sirven a una clave foránea.
+            mysql = db.engine.dialect.name == 'mysql'
+            indexes = [index for table in db.metadata.sorted_tables for index in table.indexes
+                       if not (mysql and backs_foreign_key(index))]
+            for index in indexes:
+                index.drop(bind=db.engine)
+        started = time.perf_counter()
+        try:
+            counts = Generator(args).run()
+        finally:
+            if indexes:
+                index_started = time.perf_counter()
+                for index in indexes:
+                    index.create(bind=db.engine)
+                print(f"[OK] {len(indexes)} índices creados en {time.perf_counter() - index_started:.1f} s")
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        print(f"[OK] {total} filas en {elapsed:.1f} s ({total / elapsed:.0f} filas/s)")
+
+
+if __name__ == '__main__':
+    main()
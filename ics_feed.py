@@ -0,0 +1,188 @@
+"""
+Suscripciones iCalendar (.ics) a los entrenamientos y competiciones
+
+Cada suscripción se identifica con un token firmado con SECRET_KEY que indica
+su ámbito (un entrenador, una actividad o un miembro), de modo que las
+aplicaciones de calendario pueden consultarla sin iniciar sesión. El token
+lleva también el usuario al que se entregó y la versión de sus enlaces
+(credentials.py): al regenerarlos dejan de funcionar todos los anteriores de
+ese usuario.
+
+- actividad: entrenamientos y competiciones de la actividad
+- entrenador: entrenamientos que dirige y competiciones de sus actividades
+- miembro: entrenamientos y competiciones de las actividades en las que
+  tiene asistencias registradas
+
+El feed cubre desde ICS_PAST_DAYS días atrás hasta ICS_FUTURE_DAYS días por
+delante y se genera fila a fila desde un cursor del servidor, sin cargar los
+eventos en memoria. El ETag se obtiene de las versiones de las actividades del
+ámbito (calendar_feed.py), así que una aplicación que vuelve a consultar un
+feed sin cambios recibe un 304 sin que se lean sus eventos, y los cambios en
+otras actividades no afectan a su ETag.
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy.orm import aliased
+
+import credentials
+from calendar_feed import activity_versions
+from models import db, Usuario, Actividad, Entrenamiento, Asistencia, Competicion
+
+SCOPES = ('entrenador', 'actividad', 'miembro')
+
+# Filas que se leen del cursor en cada viaje a la base de datos
+STREAM_BATCH = 500
+
+# Dominio de los UID de los eventos (estables entre descargas del feed)
+UID_DOMAIN = 'club-deportivo'
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='calendario-ics')
+
+
+def feed_token(scope, id, id_usuario, version):
+    """Token de suscripción para el ámbito ``scope`` (entrenador, actividad o miembro)
+
+    ``version`` es la versión vigente de los enlaces de ``id_usuario``
+    (credentials.current_version), a quien se entrega el enlace.
+    """
+    if scope not in SCOPES:
+        raise ValueError(f'Ámbito de calendario desconocido: {scope}')
+    return _serializer().dumps([scope, int(id), int(id_usuario), version])
+
+
+def read_token(token):
+    """(ámbito, id) de un token válido y no revocado, o None"""
+    try:
+        scope, id, id_usuario, version = _serializer().loads(token)
+    except (BadSignature, TypeError, ValueError):
+        return None
+    if scope not in SCOPES or not all(isinstance(value, int) for value in (id, id_usuario, version)):
+        return None
+    if credentials.current_version(id_usuario, credentials.CALENDARIO) != version:
+        return None
+    return scope, id
+
+
+def feed_window(today=None):
+    today = today or datetime.now().date()
+    config = current_app.config
+    return today - timedelta(days=config['ICS_PAST_DAYS']), today + timedelta(days=config['ICS_FUTURE_DAYS'])
+
+
+def scope_activities(scope, id):
+    """Actividades cuyas competiciones incluye el feed"""
+    if scope == 'actividad':
+        return [id]
+    if scope == 'entrenador':
+        query = db.session.query(Entrenamiento.id_actividad).filter(Entrenamiento.id_entrenador == id)
+    else:
+        query = db.session.query(Entrenamiento.id_actividad)\
+            .join(Asistencia, Asistencia.id_entrenamiento == Entrenamiento.id_entrenamiento)\
+            .filter(Asistencia.id_miembro == id)
+    return sorted(row[0] for row in query.distinct())
+
+
+def feed_etag(scope, id, start, end, actividades, name):
+    """ETag del feed: ventana, nombre y versiones de las actividades del ámbito"""
+    versions = ','.join(f'{id_actividad}.{version}' for id_actividad, version in activity_versions(actividades))
+    key = f'{scope}:{id}:{start.isoformat()}:{end.isoformat()}:{name}:{versions}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def escape_text(value):
+    """Escapar un valor TEXT según RFC 5545"""
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')\
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def fold(line):
+    """Partir una línea en trozos de 75 octetos como máximo (RFC 5545, 3.1)"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # No partir un carácter multibyte
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = 74  # las líneas de continuación empiezan con un espacio
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _event(uid, fecha, summary, stamp, location=None, description=None):
+    # Los eventos no tienen hora: eventos de día completo
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{uid}',
+        f'DTSTAMP:{stamp}',
+        f'DTSTART;VALUE=DATE:{fecha.strftime("%Y%m%d")}',
+        f'DTEND;VALUE=DATE:{(fecha + timedelta(days=1)).strftime("%Y%m%d")}',
+        f'SUMMARY:{escape_text(summary)}',
+    ]
+    if location:
+        lines.append(f'LOCATION:{escape_text(location)}')
+    if description:
+        lines.append(f'DESCRIPTION:{escape_text(description)}')
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+
+def iter_ics(scope, id, start, end, actividades, name):
+    """Generar el calendario evento a evento"""
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    yield ''.join(fold(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Club Deportivo//Calendario//ES',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape_text(name)}',
+        'X-PUBLISHED-TTL:PT1H',
+    ))
+
+    entrenador = aliased(Usuario)
+    trainings = db.session.query(Entrenamiento.id_entrenamiento, Entrenamiento.fecha,
+                                 Actividad.nombre_actividad, entrenador.nombre, entrenador.apellido)\
+        .join(Actividad, Entrenamiento.id_actividad == Actividad.id_actividad)\
+        .join(entrenador, Entrenamiento.id_entrenador == entrenador.id_usuario)\
+        .filter(Entrenamiento.fecha >= start, Entrenamiento.fecha <= end)
+    if scope == 'entrenador':
+        trainings = trainings.filter(Entrenamiento.id_entrenador == id)
+    else:
+        trainings = trainings.filter(Entrenamiento.id_actividad.in_(actividades))
+    trainings = trainings.order_by(Entrenamiento.fecha, Entrenamiento.id_entrenamiento).yield_per(STREAM_BATCH)
+    for id_entrenamiento, fecha, actividad, nombre, apellido in trainings:
+        yield _event(f'entrenamiento-{id_entrenamiento}@{UID_DOMAIN}', fecha, f'Entrenamiento de {actividad}',
+                     stamp, description=f'Entrenador: {nombre} {apellido}')
+
+    if actividades:
+        competitions = db.session.query(Competicion.id_competicion, Competicion.fecha, Competicion.nombre,
+                                        Competicion.ubicacion, Competicion.descripcion)\
+            .filter(Competicion.id_actividad.in_(actividades),
+                    Competicion.fecha >= start, Competicion.fecha <= end)\
+            .order_by(Competicion.fecha, Competicion.id_competicion).yield_per(STREAM_BATCH)
+        for id_competicion, fecha, nombre, ubicacion, descripcion in competitions:
+            yield _event(f'competicion-{id_competicion}@{UID_DOMAIN}', fecha, nombre, stamp,
+                         location=ubicacion, description=descripcion)
+
+    yield fold('END:VCALENDAR')
+
+
+def feed_name(scope, id):
+    """Nombre visible del calendario"""
+    if scope == 'actividad':
+        nombre = db.session.query(Actividad.nombre_actividad).filter(Actividad.id_actividad == id).scalar()
+        return f'Club Deportivo - {nombre or "Actividad"}'
+    usuario = db.session.query(Usuario.nombre, Usuario.apellido).filter(Usuario.id_usuario == id).first()
+    who = f'{usuario.nombre} {usuario.apellido}' if usuario else scope.capitalize()
+    return f'Club Deportivo - {who}'
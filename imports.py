@@ -0,0 +1,397 @@
+"""
+Importación masiva de usuarios, entrenamientos y asistencias desde CSV
+
+Las columnas son las de las exportaciones (exports.py), de modo que un CSV
+exportado se puede volver a importar:
+
+- usuarios: nombre, apellido, email, fecha_nacimiento, rol (por defecto
+  Miembro) y, opcionalmente, password
+- entrenamientos: fecha, actividad y el entrenador (id_entrenador o
+  entrenador_email)
+- asistencias: id_entrenamiento, el miembro (id_miembro o miembro_email),
+  presente (Sí/No, por defecto Sí) y observaciones
+
+El fichero se valida en una sola pasada, fila a fila y sin cargarlo en
+memoria. Roles, actividades, entrenadores, miembros y emails existentes se
+leen una vez al empezar y se resuelven en memoria; las filas válidas se
+insertan por lotes de IMPORT_BATCH con un único executemany y las inválidas se
+devuelven con su línea y el motivo. Las contraseñas (el coste de cada una es
+el de PASSWORD_HASH_METHOD) se calculan en un pool de procesos; las filas
+sin contraseña reciben la temporal de admin.add_usuario, que se calcula una
+vez por importación.
+
+Toda la importación es una transacción. Como los INSERT no pasan por la
+sesión, las estadísticas del club, los resúmenes de asistencia, las versiones
+de la caché de reportes, el calendario y el índice de búsqueda se actualizan
+aquí.
+"""
+
+import csv
+import io
+import os
+import re
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache, partial
+from itertools import chain
+from multiprocessing import get_context
+from types import SimpleNamespace
+
+from email_validator import EmailNotValidError, validate_email
+from werkzeug.security import generate_password_hash
+from wtforms.validators import ValidationError
+
+import attendance
+import club_stats
+from calendar_feed import bump_activity_versions, calendar_cache, month_of
+from forms import validate_fecha_nacimiento
+from models import db, Usuario, Rol, Actividad, Entrenamiento
+from passwords import password_hasher
+from report_cache import bump_versions
+from search_index import search_index
+
+# Filas por sentencia INSERT (executemany)
+IMPORT_BATCH = 1000
+
+# Contraseña de los usuarios importados sin contraseña (la misma que admin.add_usuario)
+TEMP_PASSWORD = 'password123'
+
+# Contraseñas mínimas por proceso: arrancar un proceso cuesta lo que varios hashes
+MIN_HASHES_PER_PROCESS = 8
+
+# Columnas del informe de errores
+ERROR_COLUMNS = ('linea', 'campo', 'valor', 'error')
+
+# Parte local de un email sin caracteres especiales (dot-atom ASCII de hasta 64 caracteres)
+_SIMPLE_LOCAL_PART = re.compile(r"(?=.{1,64}$)[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*$")
+
+RowError = namedtuple('RowError', ERROR_COLUMNS)
+ImportResult = namedtuple('ImportResult', 'filas importadas errores')
+
+
+class InvalidRow(ValueError):
+    """Fila que no se puede importar por el valor de ``campo``"""
+
+    def __init__(self, campo, mensaje):
+        super().__init__(mensaje)
+        self.campo = campo
+
+
+def _text(row, campo, required=False, min_length=0, max_length=None):
+    value = (row.get(campo) or '').strip()
+    if not value:
+        if required:
+            raise InvalidRow(campo, 'Campo obligatorio')
+        return None
+    if len(value) < min_length or (max_length and len(value) > max_length):
+        raise InvalidRow(campo, f'Debe tener entre {min_length} y {max_length} caracteres')
+    return value
+
+
+def _date(row, campo, required=False):
+    value = _text(row, campo, required)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value) if '-' in value else datetime.strptime(value, '%d/%m/%Y').date()
+    except ValueError:
+        raise InvalidRow(campo, 'Fecha no válida (AAAA-MM-DD o DD/MM/AAAA)') from None
+
+
+def _int(row, campo):
+    value = _text(row, campo)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidRow(campo, 'Número no válido') from None
+
+
+def _bool(row, campo, default):
+    value = _text(row, campo)
+    if value is None:
+        return default
+    value = value.lower()
+    if value in ('sí', 'si', 's', '1', 'true', 'x'):
+        return True
+    if value in ('no', 'n', '0', 'false'):
+        return False
+    raise InvalidRow(campo, 'Valor no válido (Sí o No)')
+
+
+@lru_cache(maxsize=1024)
+def _valid_domain(domain):
+    return _valid_email_address(f'usuario@{domain}')
+
+
+def _valid_email_address(email):
+    try:
+        validate_email(email, check_deliverability=False)
+    except EmailNotValidError:
+        return False
+    return True
+
+
+def _valid_email(email):
+    """Las mismas reglas que el validador Email() de los formularios
+
+    El dominio (casi siempre el mismo en todo el fichero) se valida una vez;
+    una parte local ASCII simple no necesita el validador completo.
+    """
+    local, _, domain = email.rpartition('@')
+    if _SIMPLE_LOCAL_PART.match(local):
+        return _valid_domain(domain)
+    return _valid_email_address(email)
+
+
+def _lookup(row, id_campo, email_campo, by_id, by_email, nombre):
+    """id de un usuario indicado por id o por email, que debe estar en ``by_id``"""
+    id_usuario = _int(row, id_campo)
+    if id_usuario is not None:
+        if id_usuario not in by_id:
+            raise InvalidRow(id_campo, f'{nombre} no encontrado')
+        return id_usuario
+    email = _text(row, email_campo)
+    if email is None:
+        raise InvalidRow(email_campo, f'Falta el {nombre.lower()} ({id_campo} o {email_campo})')
+    id_usuario = by_email.get(email.lower())
+    if id_usuario is None:
+        raise InvalidRow(email_campo, f'{nombre} no encontrado')
+    return id_usuario
+
+
+def _users_with_role(nombre_rol):
+    """({email en minúsculas: id}, {ids}) de los usuarios con el rol ``nombre_rol``"""
+    by_email = {email.lower(): id_usuario for id_usuario, email in
+                db.session.query(Usuario.id_usuario, Usuario.email)
+                .join(Rol, Usuario.id_rol == Rol.id_rol).filter(Rol.nombre_rol == nombre_rol)}
+    return by_email, set(by_email.values())
+
+
+class _Import:
+    """Validación fila a fila e inserción por lotes de un tipo de fichero"""
+
+    columns = ()
+
+    def __init__(self, processes):
+        self.processes = processes
+
+    def parse(self, row):
+        """Valores de una fila válida; InvalidRow si no lo es"""
+        raise NotImplementedError
+
+    def insert(self, connection, batch):
+        raise NotImplementedError
+
+    def finish(self, connection):
+        """Ajustes de la transacción tras el último lote"""
+
+    def after_commit(self):
+        """Invalidar las cachés del proceso tras confirmar la importación"""
+
+    def close(self):
+        pass
+
+
+class _UsuariosImport(_Import):
+    columns = ('nombre', 'apellido', 'email')
+
+    def __init__(self, processes):
+        super().__init__(processes)
+        self.roles = {nombre.lower(): (id_rol, nombre) for id_rol, nombre in db.session.query(Rol.id_rol, Rol.nombre_rol)}
+        self.emails = {email.lower() for email, in db.session.query(Usuario.email)}
+        self.counts = Counter()
+        self.temp_hash = None
+        self.pool = None
+
+    def parse(self, row):
+        nombre = _text(row, 'nombre', required=True, min_length=2, max_length=100)
+        apellido = _text(row, 'apellido', required=True, min_length=2, max_length=100)
+        email = _text(row, 'email', required=True, max_length=100)
+        if not _valid_email(email):
+            raise InvalidRow('email', 'Email no válido')
+        # Sin distinguir mayúsculas, como la colación por defecto de MySQL
+        if email.lower() in self.emails:
+            raise InvalidRow('email', 'El email ya está registrado')
+        fecha_nacimiento = _date(row, 'fecha_nacimiento')
+        try:
+            validate_fecha_nacimiento(None, SimpleNamespace(data=fecha_nacimiento))
+        except ValidationError as exc:
+            raise InvalidRow('fecha_nacimiento', str(exc)) from None
+        rol = self.roles.get((_text(row, 'rol') or 'Miembro').lower())
+        if rol is None:
+            raise InvalidRow('rol', 'Rol desconocido')
+        self.emails.add(email.lower())
+        return {'nombre': nombre, 'apellido': apellido, 'email': email, 'fecha_nacimiento': fecha_nacimiento,
+                'id_rol': rol[0], 'rol': rol[1], 'password': _text(row, 'password', max_length=128)}
+
+    def _hash_passwords(self, passwords):
+        if self.processes <= 1 or len(passwords) < 2 * MIN_HASHES_PER_PROCESS:
+            return [password_hasher.hash(password) for password in passwords]
+        if self.pool is None:
+            # Procesos nuevos (spawn): el proceso actual tiene hilos y conexiones abiertas
+            self.pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=get_context('spawn'))
+        chunksize = max(1, len(passwords) // (self.processes * 4))
+        hash_password = partial(generate_password_hash, method=password_hasher.method)
+        return list(self.pool.map(hash_password, passwords, chunksize=chunksize))
+
+    def insert(self, connection, batch):
+        own = [row for row in batch if row['password']]
+        hashes = iter(self._hash_passwords([row['password'] for row in own]))
+        if self.temp_hash is None and len(own) < len(batch):
+            self.temp_hash = password_hasher.hash(TEMP_PASSWORD)
+        rows = []
+        for row in batch:
+            rows.append({'nombre': row['nombre'], 'apellido': row['apellido'], 'email': row['email'],
+                         'fecha_nacimiento': row['fecha_nacimiento'], 'id_rol': row['id_rol'],
+                         'password_hash': next(hashes) if row['password'] else self.temp_hash})
+            self.counts[row['rol']] += 1
+        connection.execute(Usuario.__table__.insert(), rows)
+
+    def finish(self, connection):
+        deltas = {'total_usuarios': sum(self.counts.values())}
+        for nombre_rol, column in club_stats.ROLE_COUNTERS.items():
+            deltas[column] = self.counts[nombre_rol]
+        club_stats.record_changes(connection, deltas)
+        if self.counts:
+            bump_versions(connection, ('usuarios',))
+
+    def after_commit(self):
+        if self.counts:
+            search_index.expire()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+class _EntrenamientosImport(_Import):
+    columns = ('fecha', 'actividad')
+
+    def __init__(self, processes):
+        super().__init__(processes)
+        self.actividades = {nombre.lower(): id_actividad for id_actividad, nombre in
+                            db.session.query(Actividad.id_actividad, Actividad.nombre_actividad)}
+        self.trainers_by_email, self.trainers = _users_with_role('Entrenador')
+        self.months = set()
+        self.activities = set()
+        self.total = 0
+
+    def parse(self, row):
+        fecha = _date(row, 'fecha', required=True)
+        id_actividad = self.actividades.get(_text(row, 'actividad', required=True).lower())
+        if id_actividad is None:
+            raise InvalidRow('actividad', 'Actividad desconocida')
+        id_entrenador = _lookup(row, 'id_entrenador', 'entrenador_email', self.trainers,
+                                self.trainers_by_email, 'Entrenador')
+        return {'fecha': fecha, 'id_actividad': id_actividad, 'id_entrenador': id_entrenador}
+
+    def insert(self, connection, batch):
+        connection.execute(Entrenamiento.__table__.insert(), batch)
+        self.months.update(month_of(row['fecha']) for row in batch)
+        self.activities.update(row['id_actividad'] for row in batch)
+        self.total += len(batch)
+
+    def finish(self, connection):
+        club_stats.record_changes(connection, {'total_entrenamientos': self.total})
+        if self.total:
+            bump_versions(connection, ('entrenamientos',))
+            bump_activity_versions(connection, self.activities)
+
+    def after_commit(self):
+        if self.total:
+            calendar_cache.invalidate(self.months)
+            search_index.expire()
+
+
+class _AsistenciasImport(_Import):
+    columns = ('id_entrenamiento',)
+
+    def __init__(self, processes):
+        super().__init__(processes)
+        self.trainings = {id_entrenamiento for id_entrenamiento, in db.session.query(Entrenamiento.id_entrenamiento)}
+        self.members_by_email, self.members = _users_with_role('Miembro')
+        self.seen = set()
+
+    def parse(self, row):
+        id_entrenamiento = _int(row, 'id_entrenamiento')
+        if id_entrenamiento is None:
+            raise InvalidRow('id_entrenamiento', 'Campo obligatorio')
+        if id_entrenamiento not in self.trainings:
+            raise InvalidRow('id_entrenamiento', 'Entrenamiento no encontrado')
+        id_miembro = _lookup(row, 'id_miembro', 'miembro_email', self.members, self.members_by_email, 'Miembro')
+        key = (id_entrenamiento, id_miembro)
+        if key in self.seen:
+            raise InvalidRow('id_miembro', 'Asistencia repetida en el fichero')
+        self.seen.add(key)
+        return key, (_bool(row, 'presente', True), _text(row, 'observaciones'))
+
+    def insert(self, connection, batch):
+        # INSERT de varias filas que actualiza las asistencias existentes; ajusta
+        # los resúmenes por miembro y la versión de la caché de reportes
+        attendance.write_attendance(dict(batch))
+
+
+IMPORTS = {
+    'usuarios': _UsuariosImport,
+    'entrenamientos': _EntrenamientosImport,
+    'asistencias': _AsistenciasImport,
+}
+
+
+def import_csv(conjunto, stream, processes=None):
+    """Importar el CSV ``stream`` (binario) del conjunto ``conjunto`` y confirmar la transacción
+
+    ``processes`` es el número de procesos que calculan las contraseñas (por
+    defecto, uno por núcleo). Si falla la escritura se deshace toda la
+    importación y se propaga la excepción.
+    """
+    importer = IMPORTS[conjunto](processes or os.cpu_count() or 1)
+    lines = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    header = lines.readline()
+    # Excel con configuración regional española separa las columnas con punto y coma
+    delimiter = ';' if header.count(';') > header.count(',') else ','
+    reader = csv.DictReader(chain([header], lines), delimiter=delimiter)
+    missing = [column for column in importer.columns if column not in (reader.fieldnames or ())]
+    if missing:
+        return ImportResult(0, 0, [RowError(1, ', '.join(missing), '', 'Faltan columnas')])
+
+    filas = importadas = 0
+    errores = []
+    batch = []
+    try:
+        connection = db.session.connection()
+        for row in reader:
+            filas += 1
+            try:
+                batch.append(importer.parse(row))
+            except InvalidRow as exc:
+                errores.append(RowError(reader.line_num, exc.campo, row.get(exc.campo) or '', str(exc)))
+                continue
+            if len(batch) >= IMPORT_BATCH:
+                importer.insert(connection, batch)
+                importadas += len(batch)
+                batch = []
+        if batch:
+            importer.insert(connection, batch)
+            importadas += len(batch)
+        importer.finish(connection)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        importer.close()
+    importer.after_commit()
+    return ImportResult(filas, importadas, errores)
+
+
+def write_error_report(errores, output):
+    """Escribir el informe de errores en el fichero de texto ``output``"""
+    writer = csv.writer(output)
+    # BOM para que Excel reconozca la codificación UTF-8
+    output.write('\ufeff')
+    writer.writerow(ERROR_COLUMNS)
+    writer.writerows(errores)
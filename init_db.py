@@ -8,6 +8,7 @@ from app import app, db
 from models import Usuario, Rol, Actividad, Entrenamiento, Asistencia, Competicion, ResultadoCompeticion
 from datetime import datetime, date, time, timedelta
 from werkzeug.security import generate_password_hash
+from club_stats import reconcile
 
 def create_sample_data():
     """Crear datos de ejemplo para el club deportivo"""
@@ -256,6 +257,9 @@ def create_sample_data():
         # Guardar todos los cambios
         db.session.commit()
         
+        # Totales del panel de administración
+        reconcile()
+        
         print("[OK] Datos de ejemplo creados exitosamente!")
         print("\nUsuarios creados:")
         print("Administrador: admin@club.com / admin123")
@@ -0,0 +1,141 @@
+"""
+Reportes individuales de los miembros
+
+Los datos de los reportes se leen con tres consultas por conjuntos (los
+usuarios, todas sus asistencias y todos sus resultados en competiciones), sin
+una consulta por miembro y como filas planas en lugar de objetos del ORM.
+Así también se pueden enviar a otros procesos: la exportación de fin de
+temporada genera los PDF en un pool de procesos (por defecto, uno por núcleo)
+y los escribe en un único ZIP a medida que terminan.
+"""
+
+import os
+import zipfile
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from tempfile import SpooledTemporaryFile
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from werkzeug.utils import secure_filename
+
+from models import db, Usuario, Rol, Actividad, Entrenamiento, Asistencia, Competicion, ResultadoCompeticion
+from pdf_generator import ClubPDFGenerator, SPOOL_MAX_SIZE
+
+# Tablas que leen los reportes de miembros
+MEMBER_TABLES = ('usuarios', 'roles', 'asistencias', 'entrenamientos', 'actividades', 'competiciones',
+                 'resultados_competicion')
+
+# Reportes en cola o en curso por cada proceso del pool (limita la memoria de los PDF pendientes)
+PENDING_PER_PROCESS = 4
+
+# Reportes mínimos por proceso: arrancar un proceso (importar ReportLab) cuesta
+# lo que generar varias decenas de PDF
+MIN_REPORTS_PER_PROCESS = 25
+
+Member = namedtuple('Member', 'id_usuario nombre apellido email fecha_nacimiento rol')
+MemberRole = namedtuple('MemberRole', 'nombre_rol')
+MemberTraining = namedtuple('MemberTraining', 'fecha actividad entrenador_nombre entrenador_apellido presente')
+MemberCompetition = namedtuple('MemberCompetition', 'fecha nombre ubicacion actividad posicion')
+MemberReport = namedtuple('MemberReport', 'member trainings competitions')
+
+
+def _members_of(user_ids):
+    """Subconsulta con los miembros (rol Miembro) de ``user_ids``, o todos si es None"""
+    query = select(Usuario.id_usuario).join(Rol, Usuario.id_rol == Rol.id_rol).where(Rol.nombre_rol == 'Miembro')
+    if user_ids is not None:
+        query = query.where(Usuario.id_usuario.in_(user_ids))
+    return query
+
+
+def load_member_reports(user_ids=None):
+    """Datos del reporte de ``user_ids`` (por defecto, de todos los miembros)
+
+    Solo los usuarios con rol Miembro tienen entrenamientos y competiciones.
+    """
+    query = db.session.query(Usuario.id_usuario, Usuario.nombre, Usuario.apellido, Usuario.email,
+                             Usuario.fecha_nacimiento, Rol.nombre_rol)\
+        .outerjoin(Rol, Usuario.id_rol == Rol.id_rol)
+    if user_ids is None:
+        query = query.filter(Rol.nombre_rol == 'Miembro')
+    else:
+        query = query.filter(Usuario.id_usuario.in_(user_ids))
+    reports = {}
+    for id_usuario, nombre, apellido, email, fecha_nacimiento, nombre_rol in \
+            query.order_by(Usuario.apellido, Usuario.nombre, Usuario.id_usuario):
+        member = Member(id_usuario, nombre, apellido, email, fecha_nacimiento,
+                        MemberRole(nombre_rol) if nombre_rol else None)
+        reports[id_usuario] = MemberReport(member, [], [])
+    if not reports:
+        return []
+    members = _members_of(user_ids)
+
+    entrenador = aliased(Usuario)
+    trainings = db.session.query(Asistencia.id_miembro, Entrenamiento.fecha, Actividad.nombre_actividad,
+                                 entrenador.nombre, entrenador.apellido, Asistencia.presente)\
+        .join(Entrenamiento, Asistencia.id_entrenamiento == Entrenamiento.id_entrenamiento)\
+        .join(Actividad, Entrenamiento.id_actividad == Actividad.id_actividad)\
+        .join(entrenador, Entrenamiento.id_entrenador == entrenador.id_usuario)\
+        .filter(Asistencia.id_miembro.in_(members))\
+        .order_by(Asistencia.id_miembro, Entrenamiento.fecha, Asistencia.id_asistencia)
+    for id_miembro, *row in trainings:
+        reports[id_miembro].trainings.append(MemberTraining(*row))
+
+    results = db.session.query(ResultadoCompeticion.id_usuario, Competicion.fecha, Competicion.nombre,
+                               Competicion.ubicacion, Actividad.nombre_actividad, ResultadoCompeticion.posicion)\
+        .join(Competicion, ResultadoCompeticion.id_competicion == Competicion.id_competicion)\
+        .outerjoin(Actividad, Competicion.id_actividad == Actividad.id_actividad)\
+        .filter(ResultadoCompeticion.id_usuario.in_(members))\
+        .order_by(ResultadoCompeticion.id_usuario, Competicion.fecha, Competicion.id_competicion)
+    for id_usuario, *row in results:
+        reports[id_usuario].competitions.append(MemberCompetition(*row))
+
+    return list(reports.values())
+
+
+def render_member_report(report, generated_at=None):
+    """Fichero temporal con el PDF del reporte ``report``"""
+    return ClubPDFGenerator(generated_at).generate_member_report(report.member, report.trainings,
+                                                                  report.competitions)
+
+
+def _render_entry(report, generated_at):
+    """(nombre en el ZIP, bytes del PDF); se ejecuta en los procesos del pool"""
+    member = report.member
+    nombre = secure_filename(f'{member.id_usuario:06d}_{member.apellido}_{member.nombre}.pdf')
+    with render_member_report(report, generated_at) as pdf:
+        return nombre, pdf.read()
+
+
+def _render_entries(reports, generated_at, processes):
+    """PDF de ``reports`` en orden; en paralelo si hay más de un proceso"""
+    if processes <= 1 or len(reports) <= 1:
+        for report in reports:
+            yield _render_entry(report, generated_at)
+        return
+    # Procesos nuevos (spawn): el proceso actual tiene hilos y conexiones abiertas
+    with ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn')) as pool:
+        pending = deque()
+        for report in reports:
+            pending.append(pool.submit(_render_entry, report, generated_at))
+            if len(pending) >= processes * PENDING_PER_PROCESS:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def build_members_zip(reports, generated_at, processes=None):
+    """Fichero temporal con un ZIP que contiene el PDF de cada reporte de ``reports``
+
+    ``processes`` es el número de procesos del pool (por defecto, uno por núcleo).
+    Los PDF ya están comprimidos, así que se guardan en el ZIP sin volver a comprimir.
+    """
+    processes = min(processes or os.cpu_count() or 1, -(-len(reports) // MIN_REPORTS_PER_PROCESS))
+    date_time = generated_at.timetuple()[:6]
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as archive:
+        for nombre, pdf in _render_entries(reports, generated_at, processes):
+            archive.writestr(zipfile.ZipInfo(nombre, date_time), pdf)
+    output.seek(0)
+    return output
@@ -0,0 +1,240 @@
+"""
+Resúmenes de asistencia por miembro mantenidos de forma incremental
+
+Para cada miembro se guardan, en ResumenAsistencia, las asistencias y
+convocatorias (asistencias registradas, presente o no) de cada semana, de
+cada mes y en total, según la fecha del entrenamiento. Cada flush que crea,
+elimina o modifica asistencias (o cambia la fecha de un entrenamiento) aplica
+la diferencia a esos contadores en la misma transacción, de modo que los
+paneles del miembro obtienen sus cifras con una única consulta por clave
+primaria.
+
+Las escrituras que no pasan por la sesión (los INSERT ... ON DUPLICATE KEY de
+attendance.py) aplican sus cambios con record_changes().
+
+`python reconcile_stats.py` recalcula todos los resúmenes desde cero.
+"""
+
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.orm import Session
+
+from models import db, Asistencia, Entrenamiento, ResumenAsistencia
+
+SEMANA = 'S'
+MES = 'M'
+TOTAL = 'T'
+
+# Fecha fija con la que se guarda el resumen total de cada miembro
+INICIO_TOTAL = date(1970, 1, 1)
+
+
+def period_starts(fecha):
+    """Claves (periodo, inicio) a las que suma una asistencia en ``fecha``"""
+    return (
+        (SEMANA, fecha - timedelta(days=fecha.weekday())),
+        (MES, fecha.replace(day=1)),
+        (TOTAL, INICIO_TOTAL),
+    )
+
+
+def _old_value(state, key):
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.object, key)
+
+
+def _training_dates(session, ids):
+    """Fecha de cada entrenamiento, usando los ya cargados en la sesión cuando es posible"""
+    fechas = {}
+    missing = set()
+    for id_entrenamiento in ids:
+        instance = session.identity_map.get(inspect(Entrenamiento).identity_key_from_primary_key((id_entrenamiento,)))
+        if instance is not None and 'fecha' in instance.__dict__:
+            fechas[id_entrenamiento] = _old_value(inspect(instance), 'fecha')
+        else:
+            missing.add(id_entrenamiento)
+    if missing:
+        rows = session.connection().execute(
+            select(Entrenamiento.id_entrenamiento, Entrenamiento.fecha)
+            .where(Entrenamiento.id_entrenamiento.in_(missing)))
+        fechas.update(rows.all())
+    return fechas
+
+
+def _collect_deltas(session):
+    """Diferencias por (id_miembro, periodo, inicio) -> [asistencias, convocatorias]"""
+    # (id_miembro, id_entrenamiento, presente, signo) de cada cambio de asistencia
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Asistencia):
+            changes.append((obj.id_miembro, obj.id_entrenamiento, obj.presente, 1))
+    for obj in session.deleted:
+        if isinstance(obj, Asistencia):
+            state = inspect(obj)
+            changes.append((_old_value(state, 'id_miembro'), _old_value(state, 'id_entrenamiento'),
+                            _old_value(state, 'presente'), -1))
+
+    moved_trainings = {}
+    for obj in session.dirty:
+        if isinstance(obj, Asistencia):
+            state = inspect(obj)
+            old = tuple(_old_value(state, key) for key in ('id_miembro', 'id_entrenamiento', 'presente'))
+            new = (obj.id_miembro, obj.id_entrenamiento, obj.presente)
+            if old != new:
+                changes.append(old + (-1,))
+                changes.append(new + (1,))
+        elif isinstance(obj, Entrenamiento):
+            history = inspect(obj).attrs.fecha.history
+            if history.deleted and history.added and history.deleted[0] != history.added[0]:
+                moved_trainings[obj.id_entrenamiento] = (history.deleted[0], history.added[0])
+
+    if not changes and not moved_trainings:
+        return {}
+
+    fechas = _training_dates(session, {id_entrenamiento for _, id_entrenamiento, _, _ in changes})
+    deltas = defaultdict(lambda: [0, 0])
+
+    def add(id_miembro, fecha, presentes, convocatorias):
+        for periodo, inicio in period_starts(fecha):
+            delta = deltas[(id_miembro, periodo, inicio)]
+            delta[0] += presentes
+            delta[1] += convocatorias
+
+    for id_miembro, id_entrenamiento, presente, sign in changes:
+        fecha = fechas.get(id_entrenamiento)
+        if fecha is not None:
+            add(id_miembro, fecha, sign if presente else 0, sign)
+
+    if moved_trainings:
+        # Las asistencias ya guardadas de un entrenamiento que cambia de fecha pasan
+        # de los periodos de la fecha anterior a los de la nueva
+        rows = session.connection().execute(
+            select(Asistencia.id_entrenamiento, Asistencia.id_miembro, Asistencia.presente)
+            .where(Asistencia.id_entrenamiento.in_(moved_trainings)))
+        for id_entrenamiento, id_miembro, presente in rows:
+            antes, despues = moved_trainings[id_entrenamiento]
+            add(id_miembro, antes, -1 if presente else 0, -1)
+            add(id_miembro, despues, 1 if presente else 0, 1)
+
+    return {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+
+
+def _upsert(connection, rows):
+    """Sumar las diferencias a los contadores, creando las filas que no existan"""
+    table = ResumenAsistencia.__table__
+    dialect = connection.dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update(
+            asistencias=table.c.asistencias + stmt.inserted.asistencias,
+            convocatorias=table.c.convocatorias + stmt.inserted.convocatorias)
+        connection.execute(stmt, rows)
+    elif dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.id_miembro, table.c.periodo, table.c.inicio],
+            set_={'asistencias': table.c.asistencias + stmt.excluded.asistencias,
+                  'convocatorias': table.c.convocatorias + stmt.excluded.convocatorias})
+        connection.execute(stmt, rows)
+    else:
+        for row in rows:
+            result = connection.execute(
+                update(table)
+                .where(table.c.id_miembro == row['id_miembro'], table.c.periodo == row['periodo'],
+                       table.c.inicio == row['inicio'])
+                .values(asistencias=table.c.asistencias + row['asistencias'],
+                        convocatorias=table.c.convocatorias + row['convocatorias']))
+            if result.rowcount == 0:
+                connection.execute(table.insert(), row)
+
+
+def _apply(connection, deltas):
+    rows = [{'id_miembro': id_miembro, 'periodo': periodo, 'inicio': inicio,
+             'asistencias': presentes, 'convocatorias': convocatorias}
+            for (id_miembro, periodo, inicio), (presentes, convocatorias) in sorted(deltas.items())]
+    _upsert(connection, rows)
+
+
+def _apply_deltas(session, flush_context):
+    deltas = _collect_deltas(session)
+    if deltas:
+        _apply(session.connection(), deltas)
+
+
+def record_changes(connection, changes):
+    """Ajustar los resúmenes por asistencias escritas sin pasar por la sesión
+
+    ``changes`` son tuplas (id_miembro, fecha del entrenamiento, presente, signo):
+    +1 por cada asistencia creada y -1 por cada eliminada (una modificación de
+    ``presente`` es una eliminación y una creación).
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for id_miembro, fecha, presente, sign in changes:
+        for periodo, inicio in period_starts(fecha):
+            delta = deltas[(id_miembro, periodo, inicio)]
+            delta[0] += sign if presente else 0
+            delta[1] += sign
+    deltas = {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+    if deltas:
+        _apply(connection, deltas)
+
+
+def get_member_stats(id_miembro, today=None):
+    """Asistencias y convocatorias del miembro esta semana, este mes y en total"""
+    today = today or date.today()
+    # Tres búsquedas por clave primaria en una sola consulta
+    rows = db.session.query(ResumenAsistencia.periodo, ResumenAsistencia.asistencias,
+                            ResumenAsistencia.convocatorias)\
+        .filter(ResumenAsistencia.id_miembro == id_miembro,
+                db.or_(*[db.and_(ResumenAsistencia.periodo == periodo, ResumenAsistencia.inicio == inicio)
+                         for periodo, inicio in period_starts(today)]))\
+        .all()
+    found = {periodo: (asistencias, convocatorias) for periodo, asistencias, convocatorias in rows}
+    semana = found.get(SEMANA, (0, 0))
+    mes = found.get(MES, (0, 0))
+    total = found.get(TOTAL, (0, 0))
+    return {
+        'asistencias_semana': semana[0],
+        'asistencias_mes': mes[0],
+        'total_asistencias': total[0],
+        'total_convocatorias': total[1],
+        'tasa_asistencia': round(total[0] / total[1] * 100, 1) if total[1] else 0,
+    }
+
+
+def reconcile():
+    """Recalcular todos los resúmenes desde las asistencias; devuelve el número de filas"""
+    counts = defaultdict(Counter)
+    rows = db.session.query(Asistencia.id_miembro, Entrenamiento.fecha, Asistencia.presente,
+                            db.func.count(Asistencia.id_asistencia))\
+        .join(Entrenamiento, Asistencia.id_entrenamiento == Entrenamiento.id_entrenamiento)\
+        .group_by(Asistencia.id_miembro, Entrenamiento.fecha, Asistencia.presente)
+    for id_miembro, fecha, presente, total in rows:
+        for key in period_starts(fecha):
+            counter = counts[(id_miembro,) + key]
+            counter['convocatorias'] += total
+            if presente:
+                counter['asistencias'] += total
+
+    db.session.execute(ResumenAsistencia.__table__.delete())
+    values = [{'id_miembro': id_miembro, 'periodo': periodo, 'inicio': inicio,
+               'asistencias': counter['asistencias'], 'convocatorias': counter['convocatorias']}
+              for (id_miembro, periodo, inicio), counter in counts.items()]
+    if values:
+        db.session.execute(ResumenAsistencia.__table__.insert(), values)
+    db.session.commit()
+    return len(values)
+
+
+def init_app(app):
+    if not event.contains(Session, 'after_flush', _apply_deltas):
+        event.listen(Session, 'after_flush', _apply_deltas)
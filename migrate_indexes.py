@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Script para crear en una base de datos existente los índices declarados en models.py
+
+Las bases de datos nuevas ya los reciben con db.create_all() (init_db.py). En una
+base de datos MySQL en producción este script compara los índices declarados con
+los existentes y crea solo los que faltan, por lo que puede ejecutarse varias veces.
+MySQL (InnoDB) crea los índices secundarios en línea, sin bloquear las escrituras.
+
+Uso:
+    python migrate_indexes.py             # crear los índices que falten
+    python migrate_indexes.py --dry-run   # mostrar el DDL sin ejecutarlo
+"""
+
+import argparse
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateIndex
+
+from app import app, db
+
+
+def missing_indexes():
+    """Índices declarados en los modelos que no existen en la base de datos"""
+    inspector = inspect(db.engine)
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if index.name not in existing:
+                missing.append(index)
+    return missing
+
+
+def backs_foreign_key(index):
+    """El índice empieza por una columna con clave foránea
+
+    MySQL (InnoDB) necesita un índice que empiece por las columnas de cada clave
+    foránea; al crear uno de estos elimina el que había creado implícitamente, así
+    que no se puede eliminar (ERROR 1553) mientras no haya otro que lo sustituya.
+    """
+    return bool(next(iter(index.columns)).foreign_keys)
+
+
+def migrate_indexes(dry_run=False):
+    """Crear los índices que falten"""
+    with app.app_context():
+        missing = missing_indexes()
+        if not missing:
+            print("[OK] Todos los índices declarados ya existen")
+            return
+
+        for index in missing:
+            print(str(CreateIndex(index).compile(dialect=db.engine.dialect)).strip() + ';')
+            if not dry_run:
+                index.create(bind=db.engine)
+
+        if dry_run:
+            print(f"\n[INFO] {len(missing)} índices pendientes (no se ha modificado la base de datos)")
+        else:
+            print(f"\n[OK] {len(missing)} índices creados")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crear los índices de models.py que falten en la base de datos')
+    parser.add_argument('--dry-run', action='store_true', help='mostrar el DDL sin ejecutarlo')
+    args = parser.parse_args()
+    migrate_indexes(dry_run=args.dry_run)
@@ -1,7 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import password_hasher
 
 # Crear instancia de SQLAlchemy que será inicializada en app.py
 db = SQLAlchemy()
@@ -22,10 +22,19 @@ class Usuario(UserMixin, db.Model):
     email = db.Column(db.String(100), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     fecha_nacimiento = db.Column(db.Date)
-    id_rol = db.Column(db.Integer, db.ForeignKey('roles.id_rol'), nullable=False)
+    # active_history: al cambiar el rol se conserva el anterior para ajustar las estadísticas
+    id_rol = db.column_property(db.Column(db.Integer, db.ForeignKey('roles.id_rol'), nullable=False),
+                                active_history=True)
     
     # Relaciones
-    rol = db.relationship('Rol', backref='usuarios')
+    rol = db.relationship('Rol', backref=db.backref('usuarios', lazy='dynamic'))
+    
+    # Índices: listados filtrados por rol y ordenación/búsqueda por apellido o nombre
+    __table_args__ = (
+        db.Index('ix_usuario_rol', 'id_rol', 'id_usuario'),
+        db.Index('ix_usuario_apellido', 'apellido', 'id_usuario'),
+        db.Index('ix_usuario_nombre', 'nombre'),
+    )
     
     # Propiedades para compatibilidad con Flask-Login
     @property
@@ -37,10 +46,17 @@ class Usuario(UserMixin, db.Model):
         return self.email
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Comprobar la contraseña; si es correcta y su hash no sigue la política
+        actual (PASSWORD_HASH_METHOD), se vuelve a calcular con ella. El cambio
+        queda pendiente en la sesión: lo guarda quien hace el commit."""
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
     def __repr__(self):
         return f'<Usuario {self.nombre} {self.apellido}>'
@@ -58,29 +74,47 @@ class Entrenamiento(db.Model):
     id_entrenamiento = db.Column(db.Integer, primary_key=True, autoincrement=True)
     id_entrenador = db.Column(db.Integer, db.ForeignKey('usuarios.id_usuario'), nullable=False)
     id_actividad = db.Column(db.Integer, db.ForeignKey('actividades.id_actividad'), nullable=False)
-    fecha = db.Column(db.Date, nullable=False)
+    # active_history: al cambiar la fecha se conserva la anterior para mover sus asistencias
+    # entre los resúmenes por periodo (member_stats.py)
+    fecha = db.column_property(db.Column(db.Date, nullable=False), active_history=True)
     
-    # Relaciones
-    entrenador = db.relationship('Usuario', backref='entrenamientos')
-    actividad = db.relationship('Actividad', backref='entrenamientos')
+    # Relaciones (las colecciones inversas crecen sin límite: se consultan bajo demanda)
+    entrenador = db.relationship('Usuario', backref=db.backref('entrenamientos', lazy='dynamic'))
+    actividad = db.relationship('Actividad', backref=db.backref('entrenamientos', lazy='dynamic'))
     asistencias = db.relationship('Asistencia', backref='entrenamiento', lazy=True)
     
+    # Índices: calendario y listados por fecha, paneles del entrenador y filtros por actividad
+    __table_args__ = (
+        db.Index('ix_entrenamiento_fecha', 'fecha', 'id_entrenamiento'),
+        db.Index('ix_entrenamiento_entrenador_fecha', 'id_entrenador', 'fecha'),
+        db.Index('ix_entrenamiento_actividad_fecha', 'id_actividad', 'fecha'),
+    )
+    
     def __repr__(self):
         return f'<Entrenamiento {self.fecha}>'
 
 class Asistencia(db.Model):
     __tablename__ = 'asistencias'
     id_asistencia = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    id_entrenamiento = db.Column(db.Integer, db.ForeignKey('entrenamientos.id_entrenamiento'), nullable=False)
-    id_miembro = db.Column(db.Integer, db.ForeignKey('usuarios.id_usuario'), nullable=False)
-    presente = db.Column(db.Boolean, nullable=False, default=True)
+    # active_history: al modificar una asistencia se conservan los valores anteriores
+    # para ajustar los resúmenes por miembro (member_stats.py)
+    id_entrenamiento = db.column_property(
+        db.Column(db.Integer, db.ForeignKey('entrenamientos.id_entrenamiento'), nullable=False),
+        active_history=True)
+    id_miembro = db.column_property(
+        db.Column(db.Integer, db.ForeignKey('usuarios.id_usuario'), nullable=False),
+        active_history=True)
+    presente = db.column_property(db.Column(db.Boolean, nullable=False, default=True), active_history=True)
     observaciones = db.Column(db.Text)
     
     # Relaciones
-    miembro = db.relationship('Usuario', backref='asistencias')
+    miembro = db.relationship('Usuario', backref=db.backref('asistencias', lazy='dynamic'))
     
-    # Restricción única
-    __table_args__ = (db.UniqueConstraint('id_entrenamiento', 'id_miembro', name='uq_asistencia_entrenamiento_miembro'),)
+    # Restricción única (sirve también de índice por entrenamiento) e índice por miembro
+    __table_args__ = (
+        db.UniqueConstraint('id_entrenamiento', 'id_miembro', name='uq_asistencia_entrenamiento_miembro'),
+        db.Index('ix_asistencia_miembro_entrenamiento', 'id_miembro', 'id_entrenamiento'),
+    )
     
     def __repr__(self):
         return f'<Asistencia {self.id_miembro} - {self.id_entrenamiento}>'
@@ -95,9 +129,15 @@ class Competicion(db.Model):
     id_actividad = db.Column(db.Integer, db.ForeignKey('actividades.id_actividad'))
     
     # Relaciones
-    actividad = db.relationship('Actividad', backref='competiciones')
+    actividad = db.relationship('Actividad', backref=db.backref('competiciones', lazy='dynamic'))
     resultados = db.relationship('ResultadoCompeticion', backref='competicion', lazy=True)
     
+    # Índices: próximas competiciones y listados por fecha, filtro por actividad
+    __table_args__ = (
+        db.Index('ix_competicion_fecha', 'fecha', 'id_competicion'),
+        db.Index('ix_competicion_actividad_fecha', 'id_actividad', 'fecha'),
+    )
+    
     def __repr__(self):
         return f'<Competicion {self.nombre}>'
 
@@ -111,14 +151,91 @@ class ResultadoCompeticion(db.Model):
     observaciones = db.Column(db.Text)
     
     # Relaciones
-    usuario = db.relationship('Usuario', backref='resultados_competicion')
+    usuario = db.relationship('Usuario', backref=db.backref('resultados_competicion', lazy='dynamic'))
     
-    # Restricción única
-    __table_args__ = (db.UniqueConstraint('id_competicion', 'id_usuario', name='uq_resultado_competicion_participante'),)
+    # Restricción única e índice para los resultados de un participante
+    __table_args__ = (
+        db.UniqueConstraint('id_competicion', 'id_usuario', name='uq_resultado_competicion_participante'),
+        db.Index('ix_resultado_usuario', 'id_usuario'),
+    )
     
     def __repr__(self):
         return f'<ResultadoCompeticion {self.id_competicion} - {self.id_usuario}>'
 
+class EstadisticaClub(db.Model):
+    """Totales del panel de administración (una sola fila, mantenida por club_stats.py)"""
+    __tablename__ = 'estadisticas_club'
+    id = db.Column(db.Integer, primary_key=True)
+    total_usuarios = db.Column(db.Integer, nullable=False, default=0)
+    total_entrenadores = db.Column(db.Integer, nullable=False, default=0)
+    total_miembros = db.Column(db.Integer, nullable=False, default=0)
+    total_entrenamientos = db.Column(db.Integer, nullable=False, default=0)
+    total_competiciones = db.Column(db.Integer, nullable=False, default=0)
+    actualizado = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<EstadisticaClub {self.total_usuarios} usuarios>'
+
+class ResumenAsistencia(db.Model):
+    """Asistencias de un miembro por semana, mes y total (mantenido por member_stats.py)
+
+    ``convocatorias`` cuenta las asistencias registradas (presente o no) y
+    ``asistencias`` solo aquellas en las que el miembro estuvo presente.
+    """
+    __tablename__ = 'resumen_asistencias'
+    id_miembro = db.Column(db.Integer, db.ForeignKey('usuarios.id_usuario', ondelete='CASCADE'), primary_key=True)
+    periodo = db.Column(db.String(1), primary_key=True)  # 'S' semana, 'M' mes, 'T' total
+    inicio = db.Column(db.Date, primary_key=True)
+    asistencias = db.Column(db.Integer, nullable=False, default=0)
+    convocatorias = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ResumenAsistencia {self.id_miembro} {self.periodo} {self.inicio}>'
+
+class VersionDatos(db.Model):
+    """Versión de los datos de cada tabla (report_cache.py)
+
+    Cada commit que modifica una tabla incrementa su versión; los reportes en
+    caché se identifican por las versiones de las tablas que leen.
+    """
+    __tablename__ = 'versiones_datos'
+    tabla = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    actualizado = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<VersionDatos {self.tabla} {self.version}>'
+
+class VersionCalendario(db.Model):
+    """Versión de los eventos de cada actividad en las suscripciones .ics (calendar_feed.py)
+
+    Cada commit que modifica entrenamientos o competiciones de una actividad
+    incrementa su versión; el ETag de cada feed se calcula con las versiones de
+    sus actividades. La fila con id_actividad 0 es común a todas (cambios cuyas
+    actividades no se conocen), por eso la columna no es clave ajena.
+    """
+    __tablename__ = 'versiones_calendario'
+    id_actividad = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<VersionCalendario {self.id_actividad} {self.version}>'
+
+class CredencialUsuario(db.Model):
+    """Versión de las credenciales personales de un usuario (credentials.py)
+
+    El código de check-in y los enlaces de calendario se firman con SECRET_KEY
+    y con esta versión: incrementarla invalida los anteriores. Sin fila, la
+    versión es 0.
+    """
+    __tablename__ = 'credenciales_usuario'
+    id_usuario = db.Column(db.Integer, db.ForeignKey('usuarios.id_usuario', ondelete='CASCADE'), primary_key=True)
+    version_checkin = db.Column(db.Integer, nullable=False, default=0)
+    version_calendario = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CredencialUsuario {self.id_usuario}>'
+
 # Alias para compatibilidad con el código existente
 User = Usuario
 Member = Usuario  # Los miembros ahora son usuarios con rol específico
@@ -0,0 +1,96 @@
+"""
+Paginación por cursor (keyset) para los listados del Club Deportivo
+
+En lugar de OFFSET, cada página continúa a partir de la última fila vista
+usando las columnas de ordenación, de modo que el coste de una página no
+depende de lo lejos que esté en la tabla.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+from flask import abort, request, url_for
+from models import db
+
+
+class KeysetPage:
+    """Página de resultados junto con el cursor de la página siguiente"""
+
+    def __init__(self, items, next_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(values):
+    """Serializar los valores de ordenación de la última fila en un cursor opaco"""
+    payload = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Recuperar los valores de un cursor convirtiéndolos al tipo de cada columna"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Cursor inválido')
+
+    decoded = []
+    for column, value in zip(columns, values):
+        python_type = column.type.python_type
+        if python_type is datetime:
+            value = datetime.fromisoformat(value)
+        elif python_type is date:
+            value = date.fromisoformat(value)
+        elif value is not None:
+            value = python_type(value)
+        decoded.append(value)
+    return decoded
+
+
+def _after(columns, values, descending):
+    """Condición "fila posterior al cursor" expandida para aprovechar los índices"""
+    conditions = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        beyond = column < values[i] if descending else column > values[i]
+        conditions.append(db.and_(*equal, beyond))
+    return db.or_(*conditions)
+
+
+def keyset_paginate(query, columns, cursor=None, per_page=50, descending=False):
+    """Obtener una página de ``query`` ordenada por ``columns``
+
+    La última columna debe ser única (normalmente la clave primaria) para que
+    el orden sea total y ninguna fila se repita ni se pierda entre páginas.
+    """
+    if cursor:
+        try:
+            values = decode_cursor(cursor, columns)
+        except (ValueError, TypeError):
+            abort(400)
+        query = query.filter(_after(columns, values, descending))
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(*order).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+
+    return KeysetPage(rows, next_cursor)
+
+
+def next_page_url(endpoint, page):
+    """URL de la página siguiente conservando los filtros de la petición actual"""
+    if not page.has_next:
+        return None
+    args = request.args.to_dict()
+    args['cursor'] = page.next_cursor
+    return url_for(endpoint, **args)
@@ -0,0 +1,105 @@
+"""
+Cifrado y verificación de contraseñas
+
+El método y el coste del hash se configuran con PASSWORD_HASH_METHOD, en el
+formato de werkzeug.security ('pbkdf2:sha256:600000', 'scrypt:32768:8:1'...).
+Cada hash guardado lleva delante el método con el que se calculó, así que al
+cambiar la política los hashes existentes siguen siendo válidos y se vuelven a
+calcular con la nueva (más o menos costosa) en el siguiente inicio de sesión
+correcto de cada usuario (Usuario.check_password).
+
+Los hashes se calculan en un pool de PASSWORD_HASH_THREADS hilos. hashlib
+libera el GIL mientras calcula PBKDF2 o scrypt, de modo que el resto de hilos
+del proceso siguen atendiendo peticiones durante un inicio de sesión, y el
+tamaño del pool limita cuántos núcleos ocupan a la vez los inicios de sesión
+en un pico: los que sobran esperan su turno en lugar de competir por la CPU
+con las demás peticiones.
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+
+# Parámetros de scrypt que usa werkzeug cuando no se indican
+_SCRYPT_DEFAULTS = ('32768', '8', '1')
+
+
+def normalize_method(method):
+    """Método completo, con todos sus parámetros, tal como aparece en los hashes
+
+    'pbkdf2' equivale a 'pbkdf2:sha256:600000' y 'scrypt' a 'scrypt:32768:8:1'.
+    Lanza ValueError si el método no es PBKDF2 ni scrypt o sus parámetros no
+    son válidos.
+    """
+    name, *args = (method or '').strip().split(':')
+    try:
+        if name == 'pbkdf2' and len(args) <= 2:
+            hash_name = args[0] if args else 'sha256'
+            iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+            if iterations > 0 and hashlib.new(hash_name):
+                return f'pbkdf2:{hash_name}:{iterations}'
+        elif name == 'scrypt' and len(args) in (0, 3):
+            n, r, p = map(int, args or _SCRYPT_DEFAULTS)
+            if n > 1 and n & (n - 1) == 0 and r > 0 and p > 0:
+                return f'scrypt:{n}:{r}:{p}'
+    except ValueError:
+        pass
+    raise ValueError(f'Método de hash de contraseñas no válido: {method!r}')
+
+
+def hash_method(pwhash):
+    """Método con el que se calculó un hash guardado ('' si no tiene el formato de werkzeug)"""
+    return pwhash.split('$', 1)[0] if pwhash and pwhash.count('$') >= 2 else ''
+
+
+class PasswordHasher:
+    """Política de hash de contraseñas y pool de hilos en el que se calculan"""
+
+    def __init__(self):
+        self.method = DEFAULT_METHOD
+        self.threads = os.cpu_count() or 1
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.method = normalize_method(config.get('PASSWORD_HASH_METHOD') or DEFAULT_METHOD)
+        self.threads = config.get('PASSWORD_HASH_THREADS') or os.cpu_count() or 1
+        self.shutdown()
+
+    def hash(self, password):
+        """Hash de una contraseña con el método configurado"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """Comprobar una contraseña contra su hash guardado, con el método del propio hash"""
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """El hash no se calculó con la política actual (ni más ni menos costoso)"""
+        return hash_method(pwhash) != self.method
+
+    def _run(self, function, *args):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.threads,
+                                                        thread_name_prefix='password-hash')
+        return self._executor.submit(function, *args).result()
+
+    def shutdown(self):
+        """Cerrar el pool; se vuelve a crear, con el tamaño configurado, al siguiente uso"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+password_hasher = PasswordHasher()
@@ -1,453 +1,731 @@
 #!/usr/bin/env python3
 """
 Generador de PDFs para el Club Deportivo
+
+Todos los reportes se describen con especificaciones de columnas (título,
+atributo o función de acceso, ancho y formato) y los genera el mismo motor.
+Los estilos de párrafo y de tabla se construyen una sola vez al importar el
+módulo y se comparten entre todos los reportes.
+
+Las filas pueden llegar de un iterador (por ejemplo, un cursor con yield_per):
+las tablas se dividen en bloques de TABLE_CHUNK_ROWS filas, cada uno con su
+cabecera, que ReportLab maqueta a medida que los consume. Cada página se
+comprime y se escribe al cerrarla en un fichero temporal que pasa a disco al
+superar SPOOL_MAX_SIZE. Así ni las filas, ni las tablas maquetadas, ni las
+páginas terminadas se acumulan en memoria: de cada página solo queda su posición
+en el fichero para la tabla xref.
+
+Los reportes de una sola tabla marcados con ``direct`` (o cuando quien llama lo
+pide) no pasan por la maquetación de Platypus: las filas se dibujan directamente
+en el canvas con la geometría de columnas precalculada, altura de fila fija y
+texto recortado al ancho de la celda. El encabezado, el pie y los números de
+página son los mismos.
 """
 
-from reportlab.lib.pagesizes import letter, A4
+from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch, mm
 from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Image
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab.platypus import SimpleDocTemplate, Frame, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus.doctemplate import LayoutError
+from reportlab.lib.enums import TA_CENTER
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.lib.rl_accel import fp_str
+from reportlab.pdfbase.pdfdoc import (PDFArray, PDFBase85Encode, PDFFile, PDFIndirectObject, PDFName, PDFStream,
+                                     PDFTrailer, PDFZCompress, pdfdocEnc)
 from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
-from io import BytesIO
-from datetime import datetime, date
-import os
+from reportlab import rl_config
+from array import array
+from datetime import datetime
+from itertools import chain, islice
+from tempfile import SpooledTemporaryFile
+
+# Filas de cada bloque de una tabla (cada bloque repite la cabecera)
+TABLE_CHUNK_ROWS = 500
+
+# Bytes del PDF que se mantienen en memoria antes de pasar a un fichero temporal
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Márgenes de todas las páginas (en puntos)
+PAGE_MARGINS = dict(rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
+
+# Geometría de las celdas de las tablas de datos: el interlineado es el de
+# Table por defecto y el relleno inferior el de grid_table_style
+CELL_LEADING = 12
+CELL_TOP_PADDING = 3
+CELL_BOTTOM_PADDING = 12
+CELL_SIDE_PADDING = 6
+ROW_HEIGHT = CELL_LEADING + CELL_TOP_PADDING + CELL_BOTTOM_PADDING
+
+# Valores distintos por columna cuyo bloque de texto se recuerda al dibujar
+# directamente en el canvas (fechas, actividades y Sí/No se repiten mucho)
+FIT_CACHE_SIZE = 4096
+
+
+def _build_styles():
+    """Hoja de estilos con los estilos personalizados del club"""
+    styles = getSampleStyleSheet()
+
+    # Título principal
+    styles.add(ParagraphStyle(
+        name='CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        spaceAfter=30,
+        alignment=TA_CENTER,
+        textColor=colors.darkblue
+    ))
+
+    # Subtítulos
+    styles.add(ParagraphStyle(
+        name='CustomHeading',
+        parent=styles['Heading2'],
+        fontSize=16,
+        spaceAfter=12,
+        spaceBefore=20,
+        textColor=colors.darkblue
+    ))
+
+    # Texto normal
+    styles.add(ParagraphStyle(
+        name='CustomNormal',
+        parent=styles['Normal'],
+        fontSize=11,
+        spaceAfter=6
+    ))
+
+    # Texto pequeño
+    styles.add(ParagraphStyle(
+        name='CustomSmall',
+        parent=styles['Normal'],
+        fontSize=9,
+        spaceAfter=3
+    ))
+
+    # Texto de encabezado de tabla
+    styles.add(ParagraphStyle(
+        name='TableHeader',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.white,
+        alignment=TA_CENTER
+    ))
+    return styles
+
+
+STYLES = _build_styles()
+
+# Tabla clave/valor de la información personal
+INFO_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+    ('BACKGROUND', (1, 0), (1, -1), colors.beige),
+])
+
+
+def grid_table_style(header_color, body_color, font_size):
+    """Estilo común de las tablas de datos: cabecera de color y cuadrícula"""
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), header_color),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), font_size),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), CELL_BOTTOM_PADDING),
+        ('BACKGROUND', (0, 1), (-1, -1), body_color),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+
+
+# Formatos de las celdas
+
+def fecha_corta(value):
+    return value.strftime('%d/%m/%Y')
+
+
+def nombre_completo(usuario):
+    return f"{usuario.nombre} {usuario.apellido}"
+
+
+def si_no(value):
+    return "Sí" if value else "No"
+
+
+def _path_getter(path):
+    """Función que lee ``path`` ('a.b.c') y devuelve None si falta algún eslabón"""
+    names = path.split('.')
+
+    def get(obj):
+        for name in names:
+            obj = getattr(obj, name, None)
+            if obj is None:
+                return None
+        return obj
+    return get
+
+
+class Column:
+    """Columna de una tabla: título, atributo (ruta con puntos o función), ancho y formato"""
+
+    __slots__ = ('title', 'get', 'width', 'formatter', 'default')
+
+    def __init__(self, title, accessor, width, formatter=str, default='N/A'):
+        self.title = title
+        self.get = accessor if callable(accessor) else _path_getter(accessor)
+        self.width = width
+        self.formatter = formatter
+        self.default = default
+
+    def value(self, row):
+        value = self.get(row)
+        if value is None or value == '':
+            return self.default
+        return self.formatter(value)
+
+
+class TableSpec:
+    """Tabla de datos con su estilo ya construido"""
+
+    __slots__ = ('columns', 'header', 'widths', 'style', 'header_color', 'body_color', 'font_size',
+                 'empty_text')
+
+    def __init__(self, columns, header_color, body_color, font_size, empty_text):
+        self.columns = columns
+        self.header = [column.title for column in columns]
+        self.widths = [column.width for column in columns]
+        self.style = grid_table_style(header_color, body_color, font_size)
+        self.header_color = header_color
+        self.body_color = body_color
+        self.font_size = font_size
+        self.empty_text = empty_text
+
+    def row(self, item):
+        return [column.value(item) for column in self.columns]
+
+
+class ReportSpec:
+    """Reporte de una tabla: título, especificación de la tabla y si se dibuja directamente en el canvas"""
+
+    __slots__ = ('title', 'table', 'direct')
+
+    def __init__(self, title, table, direct=False):
+        self.title = title
+        self.table = table
+        self.direct = direct
+
+
+REPORTS = {
+    'usuarios': ReportSpec("REPORTE DE USUARIOS", TableSpec([
+        Column('ID', 'id_usuario', 1*inch),
+        Column('Nombre', nombre_completo, 2.5*inch),
+        Column('Email', 'email', 2.5*inch),
+        Column('Rol', 'rol.nombre_rol', 1.5*inch, default='No asignado'),
+    ], colors.darkblue, colors.beige, 10, "No hay usuarios registrados.")),
+
+    'actividades': ReportSpec("REPORTE DE ACTIVIDADES", TableSpec([
+        Column('ID', 'id_actividad', 1*inch),
+        Column('Nombre de la Actividad', 'nombre_actividad', 5*inch),
+    ], colors.darkblue, colors.beige, 10, "No hay actividades registradas.")),
+
+    'entrenamientos': ReportSpec("REPORTE DE ENTRENAMIENTOS", TableSpec([
+        Column('ID', 'id_entrenamiento', 0.8*inch),
+        Column('Entrenador', 'entrenador', 2.5*inch, nombre_completo),
+        Column('Actividad', 'actividad.nombre_actividad', 2*inch),
+        Column('Fecha', 'fecha', 1.2*inch, fecha_corta),
+    ], colors.darkgreen, colors.lightgreen, 9, "No hay entrenamientos registrados."), direct=True),
+
+    'competiciones': ReportSpec("REPORTE DE COMPETICIONES", TableSpec([
+        Column('ID', 'id_competicion', 0.8*inch),
+        Column('Nombre', 'nombre', 2*inch),
+        Column('Fecha', 'fecha', 1.2*inch, fecha_corta),
+        Column('Ubicación', 'ubicacion', 1.5*inch, default='No especificada'),
+        Column('Actividad', 'actividad.nombre_actividad', 1.5*inch, default='General'),
+    ], colors.darkorange, colors.lightyellow, 9, "No hay competiciones registradas.")),
+
+    # Filas planas (miembro_nombre, miembro_apellido, actividad, fecha, presente,
+    # observaciones): el reporte puede tener cientos de miles
+    'asistencias': ReportSpec("REPORTE DE ASISTENCIAS", TableSpec([
+        Column('Miembro', lambda fila: f"{fila.miembro_nombre} {fila.miembro_apellido}", 2*inch),
+        Column('Entrenamiento', 'actividad', 1.5*inch),
+        Column('Fecha', 'fecha', 1*inch, fecha_corta),
+        Column('Presente', 'presente', 0.8*inch, si_no),
+        Column('Observaciones', 'observaciones', 1.7*inch, default='-'),
+    ], colors.darkred, colors.lightcoral, 8, "No hay asistencias registradas."), direct=True),
+}
+
+# Secciones del reporte de un miembro: filas planas de member_reports.py (sus
+# asistencias y los resultados de las competiciones en que ha participado)
+MEMBER_TRAININGS = TableSpec([
+    Column('Fecha', 'fecha', 1.5*inch, fecha_corta),
+    Column('Actividad', 'actividad', 2*inch),
+    Column('Entrenador', lambda fila: f"{fila.entrenador_nombre} {fila.entrenador_apellido}", 2*inch),
+    Column('Asistencia', 'presente', 1*inch, si_no),
+], colors.darkblue, colors.beige, 9, "No hay entrenamientos registrados.")
+
+MEMBER_COMPETITIONS = TableSpec([
+    Column('Fecha', 'fecha', 1.2*inch, fecha_corta),
+    Column('Nombre', 'nombre', 2.2*inch),
+    Column('Ubicación', 'ubicacion', 1.7*inch, default='No especificada'),
+    Column('Actividad', 'actividad', 1.4*inch, default='General'),
+    Column('Posición', 'posicion', 0.8*inch, default='-'),
+], colors.darkgreen, colors.lightgreen, 9, "No hay competiciones registradas.")
+
+
+def fit_text(text, width, font_name, font_size):
+    """(texto, ancho): ``text`` recortado con '…' para no superar ``width``"""
+    text_width = stringWidth(text, font_name, font_size)
+    if text_width <= width:
+        return text, text_width
+    ellipsis = stringWidth('…', font_name, font_size)
+    # Primer corte proporcional y después carácter a carácter
+    text = text[:int(len(text) * width / text_width)]
+    text_width = stringWidth(text, font_name, font_size)
+    while text and text_width + ellipsis > width:
+        text = text[:-1]
+        text_width = stringWidth(text, font_name, font_size)
+    return text + '…', text_width + ellipsis
+
+
+class DirectTableLayout:
+    """Geometría precalculada de una tabla que se dibuja directamente en el canvas
+
+    Reproduce el aspecto de grid_table_style: cabecera de color en negrita,
+    texto centrado, filas de ROW_HEIGHT y cuadrícula de 1 punto. Cada celda se
+    convierte una sola vez por valor en su bloque de texto PDF (posición,
+    recorte y codificación) y cada fila se coloca con una traslación.
+    """
+
+    FONT = 'Helvetica'
+    HEADER_FONT = 'Helvetica-Bold'
+
+    def __init__(self, spec, frame_x, frame_width):
+        self.spec = spec
+        self.width = sum(spec.widths)
+        # Centrada en el marco, como Table (hAlign CENTER)
+        self.edges = [frame_x + (frame_width - self.width) / 2]
+        for width in spec.widths:
+            self.edges.append(self.edges[-1] + width)
+        self.centers = [(left + right) / 2 for left, right in zip(self.edges, self.edges[1:])]
+        self.text_widths = [width - 2 * CELL_SIDE_PADDING for width in spec.widths]
+        self.baseline = CELL_BOTTOM_PADDING + CELL_LEADING - spec.font_size
+        self._header = None
+        self._cache = [{} for _ in spec.columns]
+
+    def _cell(self, canv, column, value, font_name):
+        """Bloque de texto de la celda ``value`` de ``column``, con la línea base en y=0
+
+        No cambia de fuente: draw() fija ``font_name`` en el canvas antes de cada grupo de celdas.
+        """
+        text, width = fit_text(value, self.text_widths[column], font_name, self.spec.font_size)
+        cell = canv.beginText(self.centers[column] - width / 2, 0)
+        cell.textOut(text)
+        return cell.getCode()
+
+    def _row(self, canv, values):
+        cells = []
+        for column, (value, cache) in enumerate(zip(values, self._cache)):
+            cell = cache.get(value)
+            if cell is None:
+                if len(cache) >= FIT_CACHE_SIZE:
+                    cache.clear()
+                cell = cache[value] = self._cell(canv, column, value, self.FONT)
+            cells.append(cell)
+        return cells
+
+    @staticmethod
+    def _place(canv, y, cells):
+        canv.addLiteral(f"q 1 0 0 1 0 {fp_str(y)} cm\n" + "\n".join(cells) + "\nQ")
+
+    def draw(self, canv, top, rows):
+        """Dibujar la cabecera y ``rows`` (valores ya formateados) bajo ``top``; devuelve el y final"""
+        spec = self.spec
+        left, right = self.edges[0], self.edges[-1]
+        bottom = top - (len(rows) + 1) * ROW_HEIGHT
+        canv.saveState()
+
+        canv.setFillColor(spec.header_color)
+        canv.rect(left, top - ROW_HEIGHT, self.width, ROW_HEIGHT, stroke=0, fill=1)
+        canv.setFillColor(spec.body_color)
+        canv.rect(left, bottom, self.width, top - ROW_HEIGHT - bottom, stroke=0, fill=1)
+
+        y = top - ROW_HEIGHT + self.baseline
+        canv.setFont(self.HEADER_FONT, spec.font_size, CELL_LEADING)
+        canv.setFillColor(colors.whitesmoke)
+        if self._header is None:
+            self._header = [self._cell(canv, column, value, self.HEADER_FONT)
+                            for column, value in enumerate(spec.header)]
+        self._place(canv, y, self._header)
+        canv.setFont(self.FONT, spec.font_size, CELL_LEADING)
+        canv.setFillColor(colors.black)
+        for row in rows:
+            y -= ROW_HEIGHT
+            self._place(canv, y, self._row(canv, row))
+
+        canv.setStrokeColor(colors.black)
+        canv.setLineWidth(1)
+        lines = [(left, top - i * ROW_HEIGHT, right, top - i * ROW_HEIGHT) for i in range(len(rows) + 2)]
+        lines.extend((x, top, x, bottom) for x in self.edges)
+        canv.lines(lines)
+
+        canv.restoreState()
+        return bottom
+
+
+class LazyStory:
+    """Lista de flowables que se genera a medida que ReportLab la consume
+
+    Implementa solo las operaciones que usa BaseDocTemplate.build sobre el
+    principio de la lista; ``len()`` cuenta únicamente los elementos ya
+    generados (como mucho ``lookahead`` por delante).
+    """
+
+    def __init__(self, flowables, lookahead=2):
+        self._head = []
+        self._rest = iter(flowables)
+        self._lookahead = lookahead
+
+    def _fill(self, count):
+        while len(self._head) < count:
+            try:
+                self._head.append(next(self._rest))
+            except StopIteration:
+                break
+
+    def _fill_for(self, index):
+        if isinstance(index, slice):
+            self._fill(index.stop if index.stop is not None else self._lookahead)
+        else:
+            self._fill(index + 1)
+
+    def __len__(self):
+        self._fill(self._lookahead)
+        return len(self._head)
+
+    def __getitem__(self, index):
+        self._fill_for(index)
+        return self._head[index]
+
+    def __delitem__(self, index):
+        self._fill_for(index)
+        del self._head[index]
+
+    def __setitem__(self, index, value):
+        self._head[index] = value
+
+    def insert(self, index, value):
+        self._head.insert(index, value)
+
+
+class PageCompressingCanvas(canvas.Canvas):
+    """Canvas que escribe cada página en el fichero de salida al cerrarla
+
+    ReportLab guarda todas las páginas hasta save() y entonces compone el PDF
+    entero en memoria. Aquí cada página se codifica con los mismos filtros que
+    aplicaría ReportLab (zlib y, si rl_config.useA85, ASCII85) y se escribe con
+    su contenido en cuanto se cierra. De ella solo quedan su referencia en el
+    árbol de páginas y la posición de sus dos objetos para la tabla xref, unos
+    pocos bytes por página. save() añade el resto de objetos (catálogo, árbol de
+    páginas, fuentes, información), la tabla xref y el trailer.
+
+    La salida tiene que ser un fichero abierto en modo binario, sin cifrado, y
+    nada puede hacer referencia por nombre a una página ya cerrada (marcadores
+    o enlaces internos). Una página que haga referencia a un objeto que todavía
+    no existe se queda en memoria y se escribe con el resto en save().
+    """
+
+    def __init__(self, filename, *args, **kwargs):
+        super().__init__(filename, *args, **kwargs)
+        self._offset = 0
+        # Posición en el fichero de cada objeto escrito, por número de objeto
+        self._offsets = array('Q')
+        self._write(b''.join(PDFFile(self._doc._pdfVersion).strings))
+
+    def _write(self, data):
+        offset = self._offset
+        self._filename.write(data)
+        self._offset += len(data)
+        return offset
+
+    def _write_object(self, name):
+        """Escribir el objeto ``name`` del documento y devolver su número"""
+        doc = self._doc
+        obj = doc.idToObject[name]
+        number = doc.idToObjectNumberAndVersion[name][0]
+        data = PDFIndirectObject(name, obj).format(doc)
+        # El mismo comentario que pone PDFDocument.format delante de cada objeto
+        if not rl_config.invariant and rl_config.pdfComments:
+            self._write(pdfdocEnc("%% %s: class %s \n" % (ascii(name), obj.__class__.__name__[:50])))
+        if len(self._offsets) <= number:
+            self._offsets.extend([0] * (number + 1 - len(self._offsets)))
+        self._offsets[number] = self._write(data)
+        return number
+
+    def _forget(self, name):
+        doc = self._doc
+        number = doc.idToObjectNumberAndVersion.pop(name)[0]
+        del doc.numberToId[number], doc.idToObject[name]
+
+    def showPage(self):
+        super().showPage()
+        pages = self._doc.Pages.pages
+        page = pages[-1] if pages else None
+        if page is None or isinstance(page, bytes):
+            return
+        if page.compression and page.stream and not page.Contents:
+            # Los mismos filtros, en el mismo orden, que PDFPage.check_format y PDFStream.format
+            filters = [PDFBase85Encode, PDFZCompress] if rl_config.useA85 else [PDFZCompress]
+            content = page.stream
+            for pdf_filter in reversed(filters):
+                content = pdf_filter.encode(content)
+            stream = PDFStream(content=content)
+            stream.dictionary['Filter'] = PDFArray([PDFName(pdf_filter.pdfname) for pdf_filter in filters])
+            stream.__Comment__ = "page stream"
+            page.Contents = stream
+            page.stream = None
+        name = page.__InternalName__
+        try:
+            number = self._write_object(name)
+        except KeyError:
+            # Referencia a un objeto que aún no existe: la página se escribe en save()
+            return
+        contents = page.Contents.__InternalName__
+        self._write_object(contents)
+        # El árbol de páginas solo necesita la referencia, ya formateada
+        pages[-1] = b'%d 0 R' % number
+        self._forget(name)
+        self._forget(contents)
+
+    def save(self):
+        """Escribir los objetos pendientes, la tabla xref y el trailer"""
+        if len(self._code):
+            self.showPage()
+        doc = self._doc
+        if getattr(doc, '_savedToFile', False):
+            raise RuntimeError(f"{self.__class__.__name__} solo se puede guardar una vez")
+        doc._savedToFile = True
+        # Lo mismo que PDFDocument.GetPDFData y format antes de formatear los objetos
+        for font in doc.delayedFonts:
+            font.addObjects(doc)
+        doc.info.invariant = doc.invariant
+        doc.info.digest(doc.signature)
+        doc.Outlines.prepare(doc, self)
+        if doc.Outlines.ready < 0:
+            doc.Catalog.Outlines = None
+        doc.encrypt.prepare(doc)
+        root = doc.Reference(doc.Catalog)
+        info = doc.Reference(doc.info)
+        # Formatear un objeto puede registrar otros nuevos: se recorre por número hasta agotarlos
+        number = 1
+        while number <= doc.objectcounter:
+            if number in doc.numberToId:
+                self._write_object(doc.numberToId[number])
+            number += 1
+        offsets = self._offsets[1:number]
+        if len(offsets) != number - 1 or 0 in offsets:
+            raise ValueError("Hay objetos del PDF sin escribir")
+        startxref = self._write(b'xref\n0 %d\n0000000000 65535 f \n' % number)
+        for offset in offsets:
+            self._write(b'%010d 00000 n \n' % offset)
+        trailer = PDFTrailer(startxref=startxref, Size=number, Root=root, Info=info, ID=doc.ID())
+        self._write(trailer.format(doc))
+
 
 class ClubPDFGenerator:
-    def __init__(self):
-        self.styles = getSampleStyleSheet()
-        self.setup_custom_styles()
-    
-    def setup_custom_styles(self):
-        """Configurar estilos personalizados para el PDF"""
-        # Título principal
-        self.styles.add(ParagraphStyle(
-            name='CustomTitle',
-            parent=self.styles['Heading1'],
-            fontSize=24,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=colors.darkblue
-        ))
-        
-        # Subtítulos
-        self.styles.add(ParagraphStyle(
-            name='CustomHeading',
-            parent=self.styles['Heading2'],
-            fontSize=16,
-            spaceAfter=12,
-            spaceBefore=20,
-            textColor=colors.darkblue
-        ))
-        
-        # Texto normal
-        self.styles.add(ParagraphStyle(
-            name='CustomNormal',
-            parent=self.styles['Normal'],
-            fontSize=11,
-            spaceAfter=6
-        ))
-        
-        # Texto pequeño
-        self.styles.add(ParagraphStyle(
-            name='CustomSmall',
-            parent=self.styles['Normal'],
-            fontSize=9,
-            spaceAfter=3
-        ))
-        
-        # Texto de encabezado de tabla
-        self.styles.add(ParagraphStyle(
-            name='TableHeader',
-            parent=self.styles['Normal'],
-            fontSize=10,
-            textColor=colors.white,
-            alignment=TA_CENTER
-        ))
+    def __init__(self, generated_at=None):
+        """``generated_at`` fija la fecha que muestra el PDF y hace su contenido reproducible"""
+        self.styles = STYLES
+        self.generated_at = generated_at
 
-    def generate_member_report(self, member, trainings=None, competitions=None):
-        """Generar reporte de miembro individual"""
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, 
-                               topMargin=72, bottomMargin=18)
-        
-        story = []
-        
-        # Encabezado
-        story.extend(self._create_header("REPORTE DE MIEMBRO"))
-        story.append(Spacer(1, 20))
-        
-        # Información personal
-        story.extend(self._create_personal_info(member))
-        story.append(Spacer(1, 20))
-        
-        # Entrenamientos
-        if trainings:
-            story.extend(self._create_trainings_section(trainings))
-            story.append(Spacer(1, 20))
-        
-        # Competiciones
-        if competitions:
-            story.extend(self._create_competitions_section(competitions))
-            story.append(Spacer(1, 20))
-        
-        # Pie de página
-        story.extend(self._create_footer())
-        
-        # Construir PDF
-        doc.build(story, onFirstPage=self._add_page_number, onLaterPages=self._add_page_number)
-        
-        buffer.seek(0)
-        return buffer
+    def generate_report(self, name, items, direct=None):
+        """Generar el reporte ``name`` de REPORTS con las filas ``items`` (lista o iterador)
+
+        ``direct`` elige si la tabla se dibuja directamente en el canvas o con
+        Platypus; por defecto, lo que indique la especificación del reporte.
+        Devuelve un fichero temporal con el PDF, posicionado al principio.
+        """
+        spec = REPORTS[name]
+        if spec.direct if direct is None else direct:
+            return self._build_direct(spec.title, spec.table, items)
+        return self._build(spec.title, self._create_table(spec.table, items))
+
+    def generate_users_report(self, users):
+        """Generar reporte de usuarios"""
+        return self.generate_report('usuarios', users)
 
     def generate_activities_report(self, activities):
         """Generar reporte de actividades"""
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, 
-                               topMargin=72, bottomMargin=18)
-        
-        story = []
-        
-        # Encabezado
-        story.extend(self._create_header("REPORTE DE ACTIVIDADES"))
-        story.append(Spacer(1, 20))
-        
-        # Tabla de actividades
-        story.extend(self._create_activities_table(activities))
-        story.append(Spacer(1, 20))
-        
-        # Pie de página
-        story.extend(self._create_footer())
-        
-        doc.build(story, onFirstPage=self._add_page_number, onLaterPages=self._add_page_number)
-        
-        buffer.seek(0)
-        return buffer
+        return self.generate_report('actividades', activities)
 
     def generate_trainings_report(self, trainings):
         """Generar reporte de entrenamientos"""
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, 
-                               topMargin=72, bottomMargin=18)
-        
-        story = []
-        
-        # Encabezado
-        story.extend(self._create_header("REPORTE DE ENTRENAMIENTOS"))
-        story.append(Spacer(1, 20))
-        
-        # Tabla de entrenamientos
-        story.extend(self._create_trainings_table(trainings))
-        story.append(Spacer(1, 20))
-        
-        # Pie de página
-        story.extend(self._create_footer())
-        
-        doc.build(story, onFirstPage=self._add_page_number, onLaterPages=self._add_page_number)
-        
-        buffer.seek(0)
-        return buffer
+        return self.generate_report('entrenamientos', trainings)
 
     def generate_competitions_report(self, competitions):
         """Generar reporte de competiciones"""
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, 
-                               topMargin=72, bottomMargin=18)
-        
-        story = []
-        
-        # Encabezado
-        story.extend(self._create_header("REPORTE DE COMPETICIONES"))
-        story.append(Spacer(1, 20))
-        
-        # Tabla de competiciones
-        story.extend(self._create_competitions_table(competitions))
-        story.append(Spacer(1, 20))
-        
-        # Pie de página
-        story.extend(self._create_footer())
-        
-        doc.build(story, onFirstPage=self._add_page_number, onLaterPages=self._add_page_number)
-        
-        buffer.seek(0)
-        return buffer
+        return self.generate_report('competiciones', competitions)
 
     def generate_attendance_report(self, attendances):
         """Generar reporte de asistencias"""
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, 
-                               topMargin=72, bottomMargin=18)
-        
-        story = []
-        
-        # Encabezado
-        story.extend(self._create_header("REPORTE DE ASISTENCIAS"))
-        story.append(Spacer(1, 20))
-        
-        # Tabla de asistencias
-        story.extend(self._create_attendance_table(attendances))
-        story.append(Spacer(1, 20))
-        
-        # Pie de página
-        story.extend(self._create_footer())
-        
-        doc.build(story, onFirstPage=self._add_page_number, onLaterPages=self._add_page_number)
-        
-        buffer.seek(0)
-        return buffer
+        return self.generate_report('asistencias', attendances)
+
+    def generate_member_report(self, member, trainings=None, competitions=None):
+        """Generar reporte de miembro individual (``trainings`` son sus asistencias)"""
+        body = self._create_personal_info(member)
+        if trainings:
+            body.append(Spacer(1, 20))
+            body.append(Paragraph("ENTRENAMIENTOS", self.styles['CustomHeading']))
+            body = chain(body, self._create_table(MEMBER_TRAININGS, trainings))
+        if competitions:
+            body = chain(body, [Spacer(1, 20), Paragraph("COMPETICIONES", self.styles['CustomHeading'])],
+                         self._create_table(MEMBER_COMPETITIONS, competitions))
+        return self._build("REPORTE DE MIEMBRO", body)
+
+    def _build(self, title, body):
+        """Documento completo: encabezado, contenido, pie y números de página"""
+        output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        doc = SimpleDocTemplate(output, pagesize=A4, invariant=self.generated_at is not None, **PAGE_MARGINS)
+
+        story = LazyStory(chain(self._create_header(title), [Spacer(1, 20)], body,
+                                [Spacer(1, 20)], self._create_footer()))
+
+        doc.build(story, onFirstPage=self._add_page_number, onLaterPages=self._add_page_number,
+                  canvasmaker=PageCompressingCanvas)
+
+        output.seek(0)
+        return output
+
+    def _build_direct(self, title, spec, items):
+        """Documento de una sola tabla dibujada directamente en el canvas
+
+        Los párrafos del encabezado y del pie se colocan con un Frame igual al
+        de SimpleDocTemplate; las filas se dibujan por páginas completas, sin
+        maquetar flowables.
+        """
+        output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        canv = PageCompressingCanvas(output, pagesize=A4, invariant=self.generated_at is not None)
+
+        frame = self._page_frame()
+        layout = DirectTableLayout(spec, frame._x, frame._aW)
+        frame = self._flow(canv, frame, chain(self._create_header(title), [Spacer(1, 20)]))
+
+        items = iter(items)
+        pending = next(items, None)
+        if pending is None:
+            frame = self._flow(canv, frame, [Paragraph(spec.empty_text, self.styles['CustomNormal'])])
+        while pending is not None:
+            # Filas de datos que caben bajo la cabecera en lo que queda de página
+            capacity = int((frame._y - frame._y1p) // ROW_HEIGHT) - 1
+            if capacity < 1:
+                frame = self._next_page(canv)
+                continue
+            rows = [spec.row(pending)]
+            rows.extend(spec.row(item) for item in islice(items, capacity - 1))
+            pending = next(items, None)
+            frame._y = layout.draw(canv, frame._y, rows)
+            frame._atTop = 0
+
+        self._flow(canv, frame, chain([Spacer(1, 20)], self._create_footer()))
+        self._add_page_number(canv, None)
+        canv.showPage()
+        canv.save()
+
+        output.seek(0)
+        return output
+
+    @staticmethod
+    def _page_frame():
+        """Marco de contenido de una página, el mismo que usa SimpleDocTemplate"""
+        width, height = A4
+        left, bottom = PAGE_MARGINS['leftMargin'], PAGE_MARGINS['bottomMargin']
+        return Frame(left, bottom, width - left - PAGE_MARGINS['rightMargin'],
+                     height - bottom - PAGE_MARGINS['topMargin'])
+
+    def _next_page(self, canv):
+        self._add_page_number(canv, None)
+        canv.showPage()
+        return self._page_frame()
+
+    def _flow(self, canv, frame, flowables):
+        """Colocar ``flowables`` en ``frame`` pasando de página cuando no caben"""
+        for flowable in flowables:
+            while not frame.add(flowable, canv):
+                if frame._atTop:
+                    raise LayoutError(f"{flowable.__class__.__name__} no cabe en una página")
+                frame = self._next_page(canv)
+        return frame
+
+    def _generated_at(self):
+        return self.generated_at or datetime.now()
+
+    def _create_table(self, spec, items):
+        """Tabla de datos según ``spec`` en bloques de TABLE_CHUNK_ROWS filas
+
+        Cada bloque repite la cabecera, también en cada página que ocupa. Las
+        filas se leen de ``items`` a medida que se maqueta el documento.
+        """
+        items = iter(items)
+        first = next(items, None)
+        if first is None:
+            yield Paragraph(spec.empty_text, self.styles['CustomNormal'])
+            return
+        data = [spec.header, spec.row(first)]
+        for item in items:
+            data.append(spec.row(item))
+            if len(data) > TABLE_CHUNK_ROWS:
+                yield self._table(spec, data)
+                data = [spec.header]
+        if len(data) > 1:
+            yield self._table(spec, data)
+
+    @staticmethod
+    def _table(spec, data):
+        table = Table(data, colWidths=spec.widths, repeatRows=1)
+        table.setStyle(spec.style)
+        return table
 
     def _create_header(self, title):
         """Crear encabezado del PDF"""
         elements = []
-        
+
         # Título del club
         elements.append(Paragraph("CLUB DEPORTIVO", self.styles['CustomTitle']))
         elements.append(Paragraph(title, self.styles['CustomHeading']))
-        elements.append(Paragraph(f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M')}", self.styles['CustomSmall']))
-        
+        elements.append(Paragraph(f"Generado el: {self._generated_at().strftime('%d/%m/%Y %H:%M')}", self.styles['CustomSmall']))
+
         return elements
 
     def _create_personal_info(self, member):
         """Crear sección de información personal"""
         elements = []
-        
+
         elements.append(Paragraph("INFORMACIÓN PERSONAL", self.styles['CustomHeading']))
-        
+
         data = [
             ['Nombre:', f"{member.nombre} {member.apellido}"],
             ['Email:', member.email],
             ['Rol:', member.rol.nombre_rol if member.rol else 'No asignado'],
             ['Fecha de Nacimiento:', member.fecha_nacimiento.strftime('%d/%m/%Y') if member.fecha_nacimiento else 'No especificada']
         ]
-        
-        table = Table(data, colWidths=[2*inch, 4*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('BACKGROUND', (1, 0), (1, -1), colors.beige),
-        ]))
-        
-        elements.append(table)
-        return elements
-
-    def _create_trainings_section(self, trainings):
-        """Crear sección de entrenamientos"""
-        elements = []
-        
-        elements.append(Paragraph("ENTRENAMIENTOS", self.styles['CustomHeading']))
-        
-        if not trainings:
-            elements.append(Paragraph("No hay entrenamientos registrados.", self.styles['CustomNormal']))
-            return elements
-        
-        data = [['Fecha', 'Actividad', 'Entrenador', 'Asistencia']]
-        
-        for training in trainings:
-            asistencia = "Sí" if hasattr(training, 'presente') and training.presente else "No"
-            data.append([
-                training.fecha.strftime('%d/%m/%Y') if hasattr(training, 'fecha') else 'N/A',
-                training.actividad.nombre_actividad if hasattr(training, 'actividad') and training.actividad else 'N/A',
-                f"{training.entrenador.nombre} {training.entrenador.apellido}" if hasattr(training, 'entrenador') and training.entrenador else 'N/A',
-                asistencia
-            ])
-        
-        table = Table(data, colWidths=[1.5*inch, 2*inch, 2*inch, 1*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        elements.append(table)
-        return elements
-
-    def _create_competitions_section(self, competitions):
-        """Crear sección de competiciones"""
-        elements = []
-        
-        elements.append(Paragraph("COMPETICIONES", self.styles['CustomHeading']))
-        
-        if not competitions:
-            elements.append(Paragraph("No hay competiciones registradas.", self.styles['CustomNormal']))
-            return elements
-        
-        data = [['Fecha', 'Nombre', 'Ubicación', 'Actividad']]
-        
-        for comp in competitions:
-            data.append([
-                comp.fecha.strftime('%d/%m/%Y') if hasattr(comp, 'fecha') else 'N/A',
-                comp.nombre if hasattr(comp, 'nombre') else 'N/A',
-                comp.ubicacion if hasattr(comp, 'ubicacion') and comp.ubicacion else 'No especificada',
-                comp.actividad.nombre_actividad if hasattr(comp, 'actividad') and comp.actividad else 'General'
-            ])
-        
-        table = Table(data, colWidths=[1.5*inch, 2.5*inch, 2*inch, 1.5*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkgreen),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgreen),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        elements.append(table)
-        return elements
-
-    def _create_activities_table(self, activities):
-        """Crear tabla de actividades"""
-        elements = []
-        
-        if not activities:
-            elements.append(Paragraph("No hay actividades registradas.", self.styles['CustomNormal']))
-            return elements
-        
-        data = [['ID', 'Nombre de la Actividad']]
-        
-        for activity in activities:
-            data.append([
-                str(activity.id_actividad),
-                activity.nombre_actividad
-            ])
-        
-        table = Table(data, colWidths=[1*inch, 5*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        elements.append(table)
-        return elements
-
-    def _create_trainings_table(self, trainings):
-        """Crear tabla de entrenamientos"""
-        elements = []
-        
-        if not trainings:
-            elements.append(Paragraph("No hay entrenamientos registrados.", self.styles['CustomNormal']))
-            return elements
-        
-        data = [['ID', 'Entrenador', 'Actividad', 'Fecha']]
-        
-        for training in trainings:
-            data.append([
-                str(training.id_entrenamiento),
-                f"{training.entrenador.nombre} {training.entrenador.apellido}" if hasattr(training, 'entrenador') and training.entrenador else 'N/A',
-                training.actividad.nombre_actividad if hasattr(training, 'actividad') and training.actividad else 'N/A',
-                training.fecha.strftime('%d/%m/%Y') if hasattr(training, 'fecha') else 'N/A'
-            ])
-        
-        table = Table(data, colWidths=[0.8*inch, 2.5*inch, 2*inch, 1.2*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkgreen),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgreen),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        elements.append(table)
-        return elements
 
-    def _create_competitions_table(self, competitions):
-        """Crear tabla de competiciones"""
-        elements = []
-        
-        if not competitions:
-            elements.append(Paragraph("No hay competiciones registradas.", self.styles['CustomNormal']))
-            return elements
-        
-        data = [['ID', 'Nombre', 'Fecha', 'Ubicación', 'Actividad']]
-        
-        for comp in competitions:
-            data.append([
-                str(comp.id_competicion),
-                comp.nombre,
-                comp.fecha.strftime('%d/%m/%Y') if hasattr(comp, 'fecha') else 'N/A',
-                comp.ubicacion if hasattr(comp, 'ubicacion') and comp.ubicacion else 'No especificada',
-                comp.actividad.nombre_actividad if hasattr(comp, 'actividad') and comp.actividad else 'General'
-            ])
-        
-        table = Table(data, colWidths=[0.8*inch, 2*inch, 1.2*inch, 1.5*inch, 1.5*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkorange),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightyellow),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        elements.append(table)
-        return elements
+        table = Table(data, colWidths=[2*inch, 4*inch])
+        table.setStyle(INFO_TABLE_STYLE)
 
-    def _create_attendance_table(self, attendances):
-        """Crear tabla de asistencias"""
-        elements = []
-        
-        if not attendances:
-            elements.append(Paragraph("No hay asistencias registradas.", self.styles['CustomNormal']))
-            return elements
-        
-        data = [['Miembro', 'Entrenamiento', 'Fecha', 'Presente', 'Observaciones']]
-        
-        for att in attendances:
-            data.append([
-                f"{att.miembro.nombre} {att.miembro.apellido}" if hasattr(att, 'miembro') and att.miembro else 'N/A',
-                att.entrenamiento.actividad.nombre_actividad if hasattr(att, 'entrenamiento') and att.entrenamiento and att.entrenamiento.actividad else 'N/A',
-                att.entrenamiento.fecha.strftime('%d/%m/%Y') if hasattr(att, 'entrenamiento') and att.entrenamiento and hasattr(att.entrenamiento, 'fecha') else 'N/A',
-                "Sí" if att.presente else "No",
-                att.observaciones if hasattr(att, 'observaciones') and att.observaciones else '-'
-            ])
-        
-        table = Table(data, colWidths=[2*inch, 1.5*inch, 1*inch, 0.8*inch, 1.7*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkred),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightcoral),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
         elements.append(table)
         return elements
 
     def _create_footer(self):
         """Crear pie de página"""
         elements = []
-        
+
         elements.append(Spacer(1, 20))
         elements.append(Paragraph("---", self.styles['CustomSmall']))
         elements.append(Paragraph("Club Deportivo - Sistema de Gestión", self.styles['CustomSmall']))
-        elements.append(Paragraph(f"Página generada el {datetime.now().strftime('%d/%m/%Y a las %H:%M')}", self.styles['CustomSmall']))
-        
+        elements.append(Paragraph(f"Página generada el {self._generated_at().strftime('%d/%m/%Y a las %H:%M')}", self.styles['CustomSmall']))
+
         return elements
 
     def _add_page_number(self, canvas, doc):
@@ -457,4 +735,4 @@ class ClubPDFGenerator:
         page_num = canvas.getPageNumber()
         text = f"Página {page_num}"
         canvas.drawRightString(200*mm, 20*mm, text)
-        canvas.restoreState()
\ No newline at end of file
+        canvas.restoreState()
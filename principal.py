@@ -0,0 +1,129 @@
+"""
+Identidad en caché del usuario autenticado
+
+Flask-Login llama a load_user en cada petición. En lugar de cargar el Usuario
+completo (y después su Rol para cada comprobación de permisos), se guarda en
+una caché con TTL corto un resumen inmutable del usuario (id, nombre, email y
+rol), de modo que autenticar y comprobar el rol no cuesta ninguna consulta.
+
+Los atributos que no forman parte del resumen (fecha_nacimiento, relaciones...)
+se resuelven cargando el Usuario bajo demanda, una sola vez por petición.
+Las rutas que modifican o eliminan un usuario deben llamar a
+principal_cache.invalidate(id_usuario).
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask_login import UserMixin
+
+from models import db, Usuario, Rol
+
+PrincipalData = namedtuple('PrincipalData', 'id_usuario nombre apellido email id_rol nombre_rol')
+
+# Número máximo de usuarios en la caché de cada proceso
+MAX_PRINCIPALS = 10000
+
+
+class RolPrincipal:
+    """Rol del usuario autenticado (mismos atributos que Rol)"""
+
+    __slots__ = ('id_rol', 'nombre_rol')
+
+    def __init__(self, id_rol, nombre_rol):
+        self.id_rol = id_rol
+        self.nombre_rol = nombre_rol
+
+    def __repr__(self):
+        return f'<RolPrincipal {self.nombre_rol}>'
+
+
+class Principal(UserMixin):
+    """Usuario autenticado tal como lo ve current_user"""
+
+    def __init__(self, data):
+        self.id_usuario = data.id_usuario
+        self.nombre = data.nombre
+        self.apellido = data.apellido
+        self.email = data.email
+        self.id_rol = data.id_rol
+        self.rol = RolPrincipal(data.id_rol, data.nombre_rol)
+        self._usuario = None
+
+    @property
+    def id(self):
+        return self.id_usuario
+
+    @property
+    def username(self):
+        return self.email
+
+    @property
+    def display_name(self):
+        return f'{self.nombre} {self.apellido}'
+
+    @property
+    def usuario(self):
+        """Usuario completo de la base de datos (se carga la primera vez que se pide)"""
+        if self._usuario is None:
+            self._usuario = db.session.get(Usuario, self.id_usuario)
+        return self._usuario
+
+    def __getattr__(self, name):
+        # Solo se llama para atributos que no están en el resumen; los que tampoco
+        # existen en Usuario (p. ej. current_user.role en plantillas) no cargan nada
+        if name.startswith('_') or not hasattr(Usuario, name):
+            raise AttributeError(name)
+        return getattr(self.usuario, name)
+
+    def __repr__(self):
+        return f'<Principal {self.display_name} ({self.rol.nombre_rol})>'
+
+
+class PrincipalCache:
+    """Caché con TTL de los resúmenes de usuario, compartida por los hilos del proceso"""
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('PRINCIPAL_CACHE_TTL', self.ttl)
+
+    def load(self, id_usuario):
+        """Principal del usuario, o None si ya no existe"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(id_usuario)
+            if entry is not None and entry[0] > now:
+                return Principal(entry[1])
+
+        row = db.session.query(Usuario.id_usuario, Usuario.nombre, Usuario.apellido, Usuario.email,
+                               Usuario.id_rol, Rol.nombre_rol)\
+            .join(Rol, Usuario.id_rol == Rol.id_rol)\
+            .filter(Usuario.id_usuario == id_usuario).first()
+        if row is None:
+            self.invalidate(id_usuario)
+            return None
+
+        data = PrincipalData(*row)
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[id_usuario] = (now + self.ttl, data)
+                self._entries.move_to_end(id_usuario)
+                while len(self._entries) > MAX_PRINCIPALS:
+                    self._entries.popitem(last=False)
+        return Principal(data)
+
+    def invalidate(self, id_usuario):
+        with self._lock:
+            self._entries.pop(id_usuario, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache()
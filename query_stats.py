@@ -0,0 +1,231 @@
+"""
+Instrumentación de las consultas SQL de cada petición
+
+Cuenta las sentencias que ejecuta cada petición y el tiempo total pasado en la
+base de datos, y lo expone en las cabeceras de la respuesta (X-Query-Count,
+X-Query-Time y Server-Timing) y en una línea de log en JSON. Las respuestas en
+streaming generan el cuerpo después de enviar las cabeceras: no las llevan, sus
+consultas se siguen contando mientras se genera y la línea de log se escribe al
+cerrar la respuesta. Las sentencias que
+superan SLOW_QUERY_MS se escriben en el log de consultas lentas junto con su
+plan de ejecución (EXPLAIN), que se obtiene al cerrar la respuesta, una vez
+enviada al cliente, para no retrasarla.
+
+Con QUERY_BUDGET (global) o el decorador @query_budget(n) (por vista) se fija
+un máximo de sentencias por petición; con QUERY_BUDGET_STRICT la petición que
+lo supere falla en lugar de solo registrarse, lo que permite detectar N+1 al
+probar las rutas.
+"""
+
+import json
+import logging
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import db
+
+logger = logging.getLogger('club_deportivo.sql')
+slow_logger = logging.getLogger('club_deportivo.sql.slow')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Una petición ha ejecutado más sentencias de las permitidas"""
+
+
+def query_budget(limit):
+    """Decorador: número máximo de sentencias SQL de la vista (incluye las de login)"""
+    def decorator(f):
+        def decorated_function(*args, **kwargs):
+            g.query_budget = limit
+            return f(*args, **kwargs)
+        decorated_function.__name__ = f.__name__
+        return decorated_function
+    return decorator
+
+
+class RequestStats:
+    """Contadores de las consultas de una petición"""
+
+    __slots__ = ('count', 'seconds', 'slow', 'started')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slow = []
+        self.started = time.perf_counter()
+
+
+# Contadores de una respuesta en streaming: stream_with_context genera el cuerpo
+# con otro contexto de aplicación (otro g), pero con el mismo entorno WSGI
+STREAMED_STATS_KEY = 'club_deportivo.query_stats'
+
+
+def _current_stats():
+    if not has_request_context():
+        return None
+    return g.get('query_stats') or request.environ.get(STREAMED_STATS_KEY)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+    if context is not None:
+        context.query_stats_pending = True
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.query_stats_pending = False
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    stats = _current_stats()
+    if stats is None or conn.info.get('query_stats_skip'):
+        return
+    stats.count += 1
+    stats.seconds += elapsed
+    threshold = query_stats.slow_query_ms
+    if threshold and elapsed * 1000 >= threshold:
+        stats.slow.append((statement, None if executemany else parameters, elapsed))
+
+
+def _handle_error(exception_context):
+    # Una sentencia que falla no llega a after_cursor_execute: descartar su inicio
+    context = exception_context.execution_context
+    if context is not None and getattr(context, 'query_stats_pending', False):
+        context.query_stats_pending = False
+        exception_context.connection.info['query_start'].pop()
+
+
+def explain(engine, statement, parameters):
+    """Plan de ejecución de una sentencia SELECT, en una conexión aparte"""
+    if not statement.lstrip().upper().startswith('SELECT') or parameters is None:
+        return None
+    with engine.connect() as connection:
+        connection.info['query_stats_skip'] = True
+        try:
+            prefix = 'EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite' else 'EXPLAIN '
+            rows = connection.exec_driver_sql(prefix + statement, parameters).fetchall()
+            return [[str(value) for value in row] for row in rows]
+        except Exception as exc:
+            return [f'EXPLAIN no disponible: {exc}']
+        finally:
+            connection.info.pop('query_stats_skip', None)
+
+
+def _log_slow_queries(engine, path, endpoint, slow):
+    """Escribir las consultas lentas de una petición con su plan (al cerrar la respuesta)"""
+    for statement, parameters, elapsed in slow:
+        slow_logger.warning(json.dumps({
+            'event': 'slow_query',
+            'path': path,
+            'endpoint': endpoint,
+            'ms': round(elapsed * 1000, 1),
+            'statement': statement,
+            'parameters': repr(parameters),
+            'plan': explain(engine, statement, parameters),
+        }, ensure_ascii=False))
+
+
+def _log_request(fields, stats):
+    db_ms = stats.seconds * 1000
+    logger.info(json.dumps({
+        'event': 'request',
+        **fields,
+        'queries': stats.count,
+        'db_ms': round(db_ms, 1),
+        'total_ms': round((time.perf_counter() - stats.started) * 1000, 1),
+    }))
+
+
+def _log_budget(endpoint, count, budget):
+    logger.warning(json.dumps({'event': 'query_budget', 'endpoint': endpoint,
+                               'queries': count, 'budget': budget}))
+
+
+def _close_streamed(engine, fields, stats, budget):
+    """Registrar una respuesta en streaming una vez generado y enviado el cuerpo"""
+    _log_request(fields, stats)
+    if stats.slow:
+        _log_slow_queries(engine, fields['path'], fields['endpoint'], stats.slow)
+    if budget and stats.count > budget:
+        # Ya no se puede hacer fallar la petición: también en modo estricto solo se registra
+        _log_budget(fields['endpoint'], stats.count, budget)
+
+
+class QueryStats:
+    """Registra los eventos del motor y los ganchos de petición de la aplicación"""
+
+    def __init__(self):
+        self.slow_query_ms = 0
+        self.budget = 0
+        self.strict = False
+
+    def init_app(self, app):
+        self.slow_query_ms = app.config.get('SLOW_QUERY_MS', 0)
+        self.budget = app.config.get('QUERY_BUDGET', 0)
+        self.strict = app.config.get('QUERY_BUDGET_STRICT', False)
+
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+
+        if app.config.get('QUERY_STATS_LOG', True) and not logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+        slow_log = app.config.get('SLOW_QUERY_LOG')
+        if slow_log and not slow_logger.handlers:
+            handler = logging.FileHandler(slow_log, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            slow_logger.addHandler(handler)
+            slow_logger.setLevel(logging.INFO)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    @staticmethod
+    def _start_request():
+        g.query_stats = RequestStats()
+
+    def _finish_request(self, response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+
+        budget = g.pop('query_budget', None) or self.budget
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+        }
+        # Fuera del contexto de la petición: se pasan el motor y los datos que se registran
+        engine = db.engine
+
+        if response.is_streamed and not response.direct_passthrough:
+            # El cuerpo (y sus consultas) se genera después: send_file, en cambio, solo lee un fichero
+            request.environ[STREAMED_STATS_KEY] = stats
+            response.call_on_close(lambda: _close_streamed(engine, fields, stats, budget))
+            return response
+
+        db_ms = stats.seconds * 1000
+        response.headers['X-Query-Count'] = str(stats.count)
+        response.headers['X-Query-Time'] = f'{db_ms:.1f}'
+        response.headers.add('Server-Timing', f'db;desc="{stats.count} consultas";dur={db_ms:.1f}')
+        _log_request(fields, stats)
+
+        if stats.slow:
+            slow = stats.slow
+            response.call_on_close(lambda: _log_slow_queries(engine, fields['path'], fields['endpoint'], slow))
+
+        if budget and stats.count > budget:
+            if self.strict:
+                raise QueryBudgetExceeded(f'{request.endpoint}: {stats.count} consultas SQL (máximo {budget})')
+            _log_budget(request.endpoint, stats.count, budget)
+        return response
+
+query_stats = QueryStats()
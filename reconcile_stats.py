@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Script para recalcular desde cero las estadísticas mantenidas de forma incremental
+
+La fila de estadísticas del panel de administración (EstadisticaClub,
+club_stats.py) y los resúmenes de asistencia por miembro (ResumenAsistencia,
+member_stats.py) se actualizan en cada commit. Este script los recalcula desde
+las tablas de origen y muestra las diferencias encontradas, por ejemplo tras
+borrados masivos o cambios hechos directamente en la base de datos. Puede
+ejecutarse periódicamente.
+
+En una base de datos existente crea además las tablas de estadísticas, de
+versiones de datos (caché de reportes y suscripciones al calendario) y de
+versiones de las credenciales personales (credentials.py), por lo que debe ejecutarse una vez al desplegar
+esta versión.
+
+Uso:
+    python reconcile_stats.py
+"""
+
+from app import app, db
+import club_stats
+import member_stats
+from models import EstadisticaClub, ResumenAsistencia, VersionDatos, VersionCalendario, CredencialUsuario
+
+
+def reconcile_stats():
+    """Recalcular las estadísticas y mostrar las diferencias corregidas"""
+    with app.app_context():
+        EstadisticaClub.__table__.create(bind=db.engine, checkfirst=True)
+        ResumenAsistencia.__table__.create(bind=db.engine, checkfirst=True)
+        VersionDatos.__table__.create(bind=db.engine, checkfirst=True)
+        VersionCalendario.__table__.create(bind=db.engine, checkfirst=True)
+        CredencialUsuario.__table__.create(bind=db.engine, checkfirst=True)
+        stats, differences = club_stats.reconcile()
+        if not differences:
+            print("[OK] Las estadísticas ya estaban al día")
+        for column, (before, after) in sorted(differences.items()):
+            print(f"[INFO] {column}: {before} -> {after}")
+        print(f"[OK] {stats.total_usuarios} usuarios ({stats.total_entrenadores} entrenadores, "
+              f"{stats.total_miembros} miembros), {stats.total_entrenamientos} entrenamientos, "
+              f"{stats.total_competiciones} competiciones")
+
+        rows = member_stats.reconcile()
+        print(f"[OK] {rows} resúmenes de asistencia por miembro recalculados")
+
+
+if __name__ == '__main__':
+    reconcile_stats()
@@ -0,0 +1,220 @@
+"""
+Caché en disco de los reportes PDF generados
+
+Un reporte se identifica por su tipo, sus parámetros y la versión de los datos
+que lee: cada commit que inserta, modifica o elimina filas de una tabla
+incrementa su versión en VersionDatos (en la misma transacción). La clave de
+la caché es el SHA-256 de todo ello, así que mientras las tablas del reporte no
+cambien la misma petición encuentra el mismo fichero, en cualquier proceso, y
+se sirve sin volver a ejecutar ReportLab. La clave sirve también de ETag.
+
+Para que los bytes en caché sigan siendo válidos, el PDF es determinista: la
+fecha que muestra es la del último cambio de sus datos y ReportLab se ejecuta
+en modo invariante (sin fecha de creación ni identificador aleatorio).
+
+La caché ocupa como máximo REPORT_CACHE_MAX_MB: al superarlo se eliminan los
+reportes usados hace más tiempo (la fecha de modificación de cada fichero se
+actualiza con cada acierto). Las escrituras que no pasan por la sesión deben
+llamar a bump_versions().
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from sqlalchemy import event, inspect, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import db, VersionDatos
+
+# Tablas cuya versión se registra
+TRACKED_TABLES = ('roles', 'usuarios', 'actividades', 'entrenamientos', 'asistencias',
+                  'competiciones', 'resultados_competicion')
+
+# Columnas que ningún reporte lee: modificarlas no cambia la versión de su tabla
+# (la contraseña se vuelve a cifrar en el inicio de sesión al cambiar la política)
+UNREPORTED_COLUMNS = {'usuarios': {'password_hash'}}
+
+# Extensiones de los ficheros que generan los reportes (el ZIP de miembros y los PDF)
+REPORT_EXTENSIONS = ('.pdf', '.zip')
+
+CachedReport = namedtuple('CachedReport', 'key path nombre')
+
+
+def increment_versions(connection, table, key, keys, **values):
+    """Sumar 1 a la columna ``version`` de las filas ``keys`` de ``table``, creando con versión 1 las que falten
+
+    En MySQL, SQLite y PostgreSQL es una sola sentencia (upsert), así que dos
+    primeras escrituras concurrentes no chocan al crear la misma fila. Las
+    columnas de ``values`` se guardan tal cual en todas las filas.
+    """
+    keys = sorted(set(keys))
+    column = table.c[key]
+    rows = [{key: value, 'version': 1, **values} for value in keys]
+    dialect = connection.dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_duplicate_key_update(version=table.c.version + 1,
+                                            **{name: stmt.inserted[name] for name in values})
+        connection.execute(stmt, rows)
+    elif dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[column],
+            set_={'version': table.c.version + 1, **{name: stmt.excluded[name] for name in values}})
+        connection.execute(stmt, rows)
+    else:
+        result = connection.execute(update(table).where(column.in_(keys))
+                                    .values(version=table.c.version + 1, **values))
+        if result.rowcount < len(keys):
+            existing = set(connection.execute(select(column).where(column.in_(keys))).scalars())
+            connection.execute(insert(table), [row for row in rows if row[key] not in existing])
+
+
+def bump_versions(connection, tables):
+    """Incrementar la versión de ``tables`` (creando las filas que falten)"""
+    increment_versions(connection, VersionDatos.__table__, 'tabla', tables, actualizado=datetime.utcnow())
+
+
+def _reported_change(obj, tabla):
+    """La fila modificada ha cambiado alguna columna que leen los reportes"""
+    state = inspect(obj)
+    ignored = UNREPORTED_COLUMNS.get(tabla, ())
+    return any(state.attrs[attr.key].history.has_changes()
+               for attr in state.mapper.column_attrs if attr.key not in ignored)
+
+
+def _touched_tables(session):
+    tables = set()
+    for obj in session.new | session.deleted:
+        tabla = getattr(obj, '__tablename__', None)
+        if tabla in TRACKED_TABLES:
+            tables.add(tabla)
+    for obj in session.dirty:
+        tabla = getattr(obj, '__tablename__', None)
+        if tabla in TRACKED_TABLES and tabla not in tables and _reported_change(obj, tabla):
+            tables.add(tabla)
+    return tables
+
+
+def _bump_on_flush(session, flush_context):
+    tables = _touched_tables(session)
+    if tables:
+        bump_versions(session.connection(), tables)
+
+
+def data_stamp(tables):
+    """(versiones de ``tables``, fecha local del último cambio o None)"""
+    rows = db.session.query(VersionDatos.tabla, VersionDatos.version, VersionDatos.actualizado)\
+        .filter(VersionDatos.tabla.in_(tables)).all()
+    versions = {tabla: (version, actualizado) for tabla, version, actualizado in rows}
+    stamp = ';'.join(f'{tabla}:{versions.get(tabla, (0, None))[0]}' for tabla in sorted(tables))
+    updated = max((actualizado for _, actualizado in versions.values() if actualizado), default=None)
+    if updated is not None:
+        # Las versiones se guardan en UTC; los reportes muestran la hora local
+        updated = updated.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None, microsecond=0)
+    return stamp, updated
+
+
+class ReportCache:
+    """Reportes en disco por clave de contenido, con expulsión LRU por tamaño"""
+
+    def __init__(self):
+        self.directory = None
+        self.max_bytes = 0
+
+    def init_app(self, app):
+        config = app.config
+        self.directory = config.get('REPORT_CACHE_DIR') or os.path.join(app.instance_path, 'report_cache')
+        self.max_bytes = config.get('REPORT_CACHE_MAX_MB', 200) * 1024 * 1024
+        os.makedirs(self.directory, exist_ok=True)
+        if not event.contains(Session, 'after_flush', _bump_on_flush):
+            event.listen(Session, 'after_flush', _bump_on_flush)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(tipo, params, stamp):
+        raw = json.dumps([tipo, params, stamp], sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _meta_path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _path(self, key, nombre):
+        """Fichero del reporte, con la extensión del nombre de descarga (.pdf o .zip)"""
+        extension = os.path.splitext(nombre)[1].lower()
+        if extension not in REPORT_EXTENSIONS:
+            raise ValueError(f'Extensión de reporte no admitida: {nombre}')
+        return os.path.join(self.directory, key + extension)
+
+    def get(self, key):
+        """Reporte en caché con la clave ``key``, o None"""
+        if not self.enabled:
+            return None
+        try:
+            with open(self._meta_path(key), encoding='utf-8') as meta:
+                nombre = json.load(meta)['nombre']
+            path = self._path(key, nombre)
+            # Marcar como usado recientemente para la expulsión LRU
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return CachedReport(key, path, nombre)
+
+    def put(self, key, nombre, pdf):
+        """Guardar con la clave ``key`` el fichero ``pdf`` (PDF o ZIP, se copia por bloques)"""
+        if not self.enabled:
+            return None
+        path, meta_path = self._path(key, nombre), self._meta_path(key)
+        suffix = f'.{os.getpid()}.tmp'
+        pdf.seek(0)
+        with open(path + suffix, 'wb') as output:
+            shutil.copyfileobj(pdf, output)
+        os.replace(path + suffix, path)
+        # Los metadatos se escriben los últimos: get() solo encuentra entradas completas
+        with open(meta_path + suffix, 'w', encoding='utf-8') as meta:
+            json.dump({'nombre': nombre}, meta)
+        os.replace(meta_path + suffix, meta_path)
+        self.evict()
+        return CachedReport(key, path, nombre)
+
+    def evict(self):
+        """Eliminar los reportes menos usados hasta no superar el tamaño máximo"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                key, extension = os.path.splitext(entry.name)
+                if extension in REPORT_EXTENSIONS:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, key, entry.path))
+                    total += stat.st_size
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for _, size, key, path in sorted(entries):
+            # Los metadatos primero: get() no encuentra entradas a medio borrar
+            for path in (self._meta_path(key), path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            removed += 1
+            if total <= self.max_bytes:
+                break
+        return removed
+
+
+report_cache = ReportCache()
@@ -0,0 +1,376 @@
+"""
+Cola de trabajos en segundo plano para la generación de reportes PDF
+
+Las rutas de reportes ya no construyen el PDF dentro de la petición: guardan un
+trabajo en una cola persistente (una base de datos SQLite propia, separada de
+la del club) y responden de inmediato con su identificador. Un conjunto de
+workers toma los trabajos pendientes por orden de llegada, genera el PDF con
+la función registrada para su tipo y lo deja en REPORT_JOBS_DIR, de donde se
+descarga con /reports/jobs/<id>/download.
+
+Los workers pueden ejecutarse como hilos del propio proceso web
+(REPORT_WORKERS > 0, se arrancan al encolar un trabajo o consultar uno sin
+terminar, también los que quedaron en la cola de una ejecución anterior) o en un
+proceso aparte con `python report_worker.py`, que es lo recomendable en
+producción: así la generación de PDFs no compite con las peticiones. Varios
+procesos pueden compartir la misma cola; cada trabajo se reclama con una
+transacción BEGIN IMMEDIATE, de modo que solo lo ejecuta un worker.
+
+Mientras genera un trabajo, el worker actualiza su latido cada tercio de
+REPORT_JOB_TIMEOUT. Un trabajo en curso sin latido durante REPORT_JOB_TIMEOUT
+segundos (su worker se ha caído) vuelve a la cola hasta MAX_ATTEMPTS veces;
+los que tardan más pero siguen vivos no se interrumpen. Cada intento escribe
+su propio fichero y solo guarda el resultado si el trabajo sigue siendo suyo
+(mismo instante de inicio), de modo que un worker dado por caído que termina
+tarde no pisa el resultado del siguiente intento. Los trabajos terminados y
+sus ficheros se eliminan pasados REPORT_JOB_RETENTION segundos.
+"""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger('club_deportivo.jobs')
+
+PENDIENTE = 'pendiente'
+EN_CURSO = 'en_curso'
+TERMINADO = 'terminado'
+ERROR = 'error'
+
+# Intentos de un trabajo cuyo worker deja de responder antes de darlo por fallido
+MAX_ATTEMPTS = 3
+
+# Segundos que espera un worker sin trabajo antes de volver a mirar la cola
+# (los trabajos encolados en el mismo proceso lo despiertan al momento)
+POLL_INTERVAL = 2.0
+
+# Segundos entre limpiezas de trabajos caducados
+CLEANUP_INTERVAL = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id TEXT PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    parametros TEXT NOT NULL,
+    id_usuario INTEGER,
+    estado TEXT NOT NULL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    creado REAL NOT NULL,
+    iniciado REAL,
+    latido REAL,
+    terminado REAL,
+    fichero TEXT,
+    nombre TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_trabajos_estado ON trabajos (estado, creado);
+CREATE INDEX IF NOT EXISTS ix_trabajos_usuario ON trabajos (id_usuario, tipo, estado);
+"""
+
+
+class ReportJobQueue:
+    """Cola persistente de trabajos y workers que la procesan"""
+
+    def __init__(self):
+        self.app = None
+        self.db_path = None
+        self.output_dir = None
+        self.workers = 0
+        self.job_timeout = 600
+        self.retention = 86400
+        self._builders = {}
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._last_cleanup = 0.0
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        self.db_path = config.get('REPORT_JOBS_DB') or os.path.join(app.instance_path, 'report_jobs.sqlite3')
+        self.output_dir = config.get('REPORT_JOBS_DIR') or os.path.join(app.instance_path, 'report_jobs')
+        self.workers = config.get('REPORT_WORKERS', 1)
+        self.job_timeout = config.get('REPORT_JOB_TIMEOUT', self.job_timeout)
+        self.retention = config.get('REPORT_JOB_RETENTION', self.retention)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(trabajos)')}
+            if 'latido' not in columns:
+                # Cola creada por una versión anterior
+                conn.execute('ALTER TABLE trabajos ADD COLUMN latido REAL')
+
+    def register(self, tipo):
+        """Registrar la función que genera los trabajos de ``tipo``
+
+        La función recibe los parámetros del trabajo y devuelve
+        (nombre del fichero, fichero binario con el PDF), que se copia por
+        bloques al resultado del trabajo y se cierra.
+        """
+        def decorator(f):
+            self._builders[tipo] = f
+            return f
+        return decorator
+
+    @contextmanager
+    def _connect(self):
+        # Conexión en modo autocommit: las transacciones se abren explícitamente
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # -- Encolar y consultar ------------------------------------------------
+
+    def enqueue(self, tipo, params, id_usuario):
+        """Encolar un trabajo y devolverlo
+
+        Si el mismo usuario ya tiene un trabajo idéntico pendiente o en curso se
+        devuelve ese, para que pulsar varias veces el botón no llene la cola.
+        """
+        if tipo not in self._builders:
+            raise ValueError(f'Tipo de reporte desconocido: {tipo}')
+        parametros = json.dumps(params, sort_keys=True)
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            # Un trabajo en curso cuyo worker se ha caído no debe devolverse como si siguiera vivo
+            self._requeue_stale(conn, time.time())
+            row = conn.execute(
+                'SELECT * FROM trabajos WHERE id_usuario = ? AND tipo = ? AND parametros = ? '
+                'AND estado IN (?, ?) ORDER BY creado LIMIT 1',
+                (id_usuario, tipo, parametros, PENDIENTE, EN_CURSO)).fetchone()
+            if row is None:
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    'INSERT INTO trabajos (id, tipo, parametros, id_usuario, estado, creado) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (job_id, tipo, parametros, id_usuario, PENDIENTE, time.time()))
+                row = conn.execute('SELECT * FROM trabajos WHERE id = ?', (job_id,)).fetchone()
+            conn.execute('COMMIT')
+
+        self.wake()
+        return dict(row)
+
+    def add_finished(self, tipo, params, id_usuario, nombre, source):
+        """Registrar como terminado un trabajo cuyo fichero ya existe (por ejemplo, en la caché de reportes)"""
+        job_id = uuid.uuid4().hex
+        fichero = job_id + os.path.splitext(nombre)[1]
+        path = os.path.join(self.output_dir, fichero)
+        try:
+            os.link(source, path)
+        except OSError:
+            shutil.copyfile(source, path)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO trabajos (id, tipo, parametros, id_usuario, estado, creado, iniciado, terminado, '
+                'fichero, nombre) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, tipo, json.dumps(params, sort_keys=True), id_usuario, TERMINADO, now, now, now,
+                 fichero, nombre))
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """Trabajo ``job_id`` como diccionario, o None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM trabajos WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def position(self, job):
+        """Trabajos pendientes por delante de ``job`` en la cola"""
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM trabajos WHERE estado = ? AND creado < ?',
+                                (PENDIENTE, job['creado'])).fetchone()[0]
+
+    def file_path(self, job):
+        if job['estado'] != TERMINADO or not job['fichero']:
+            return None
+        path = os.path.join(self.output_dir, job['fichero'])
+        return path if os.path.exists(path) else None
+
+    # -- Workers ------------------------------------------------------------
+
+    def wake(self):
+        """Arrancar los workers del proceso (si REPORT_WORKERS > 0) y avisarles de que miren la cola
+
+        Se llama al encolar y al consultar un trabajo sin terminar, así que un
+        trabajo que quedó en la cola al reiniciarse el proceso no espera a que
+        alguien encole otro.
+        """
+        self._ensure_workers()
+        self._wakeup.set()
+
+    def _ensure_workers(self):
+        if not self.workers or self._threads:
+            return
+        with self._lock:
+            if not self._threads:
+                self.start(self.workers)
+
+    def start(self, count, daemon=True):
+        """Arrancar ``count`` hilos worker en este proceso"""
+        self._stopping.clear()
+        for number in range(count):
+            thread = threading.Thread(target=self._work, name=f'report-worker-{number + 1}', daemon=daemon)
+            thread.start()
+            self._threads.append(thread)
+        return self._threads
+
+    def stop(self, timeout=None):
+        """Pedir a los workers que terminen cuando acaben su trabajo actual"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                job = self.claim()
+            except sqlite3.Error:
+                logger.exception('No se pudo leer la cola de trabajos')
+                job = None
+            if job is None:
+                self._cleanup_if_due()
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self.run(job)
+
+    def claim(self):
+        """Reclamar el trabajo pendiente más antiguo, o None si no hay"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._requeue_stale(conn, now)
+            row = conn.execute('SELECT * FROM trabajos WHERE estado = ? ORDER BY creado LIMIT 1',
+                               (PENDIENTE,)).fetchone()
+            if row is not None:
+                conn.execute('UPDATE trabajos SET estado = ?, iniciado = ?, latido = ?, intentos = intentos + 1 '
+                             'WHERE id = ?', (EN_CURSO, now, now, row['id']))
+            conn.execute('COMMIT')
+        if row is None:
+            return None
+        job = dict(row)
+        job.update(estado=EN_CURSO, iniciado=now, latido=now, intentos=job['intentos'] + 1)
+        return job
+
+    def _requeue_stale(self, conn, now):
+        """Trabajos de workers caídos (sin latido): se reintentan o se dan por fallidos"""
+        stale = now - self.job_timeout
+        conn.execute('UPDATE trabajos SET estado = ? '
+                     'WHERE estado = ? AND COALESCE(latido, iniciado) < ? AND intentos < ?',
+                     (PENDIENTE, EN_CURSO, stale, MAX_ATTEMPTS))
+        conn.execute('UPDATE trabajos SET estado = ?, terminado = ?, error = ? '
+                     'WHERE estado = ? AND COALESCE(latido, iniciado) < ?',
+                     (ERROR, now, 'El worker dejó de responder', EN_CURSO, stale))
+
+    def run(self, job):
+        """Generar el PDF de un trabajo reclamado y guardar el resultado"""
+        started = time.perf_counter()
+        # Fichero propio de este intento: otro intento del mismo trabajo no lo toca.
+        # La extensión (.pdf o .zip) es la del nombre que devuelve el generador
+        base = f"{job['id']}-{job['intentos']}"
+        tmp_path = os.path.join(self.output_dir, base + '.tmp')
+        try:
+            builder = self._builders[job['tipo']]
+            with self._heartbeat(job):
+                with self.app.app_context():
+                    nombre, pdf = builder(**json.loads(job['parametros']))
+                with pdf, open(tmp_path, 'wb') as output:
+                    pdf.seek(0)
+                    shutil.copyfileobj(pdf, output)
+                fichero = base + os.path.splitext(nombre)[1]
+                path = os.path.join(self.output_dir, fichero)
+                os.replace(tmp_path, path)
+        except Exception as exc:
+            logger.exception('Error generando el reporte %s (%s)', job['id'], job['tipo'])
+            _remove(tmp_path)
+            self._finish(job, ERROR, error=str(exc) or exc.__class__.__name__)
+            return
+        if not self._finish(job, TERMINADO, fichero=fichero, nombre=nombre):
+            logger.warning('El reporte %s se volvió a encolar mientras se generaba: se descarta este intento',
+                           job['id'])
+            _remove(path)
+            return
+        logger.info('Reporte %s (%s) generado en %.2f s', job['id'], job['tipo'], time.perf_counter() - started)
+
+    @contextmanager
+    def _heartbeat(self, job):
+        """Actualizar el latido del trabajo en un hilo aparte mientras se genera"""
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(self.job_timeout / 3):
+                try:
+                    with self._connect() as conn:
+                        conn.execute('UPDATE trabajos SET latido = ? WHERE id = ? AND iniciado = ? AND estado = ?',
+                                     (time.time(), job['id'], job['iniciado'], EN_CURSO))
+                except sqlite3.Error:
+                    logger.exception('No se pudo actualizar el latido del reporte %s', job['id'])
+
+        thread = threading.Thread(target=beat, name=f"report-heartbeat-{job['id'][:8]}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def _finish(self, job, estado, fichero=None, nombre=None, error=None):
+        """Guardar el resultado si el trabajo sigue siendo de este intento; False si no"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE trabajos SET estado = ?, terminado = ?, fichero = ?, nombre = ?, error = ? '
+                'WHERE id = ? AND iniciado = ? AND estado = ?',
+                (estado, time.time(), fichero, nombre, error, job['id'], job['iniciado'], EN_CURSO))
+        return cursor.rowcount == 1
+
+    # -- Limpieza -------------------------------------------------------------
+
+    def _cleanup_if_due(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_cleanup < CLEANUP_INTERVAL:
+                return
+            self._last_cleanup = now
+        try:
+            self.cleanup(now)
+        except (sqlite3.Error, OSError):
+            logger.exception('Error limpiando los trabajos caducados')
+
+    def cleanup(self, now=None):
+        """Eliminar los trabajos terminados hace más de REPORT_JOB_RETENTION segundos"""
+        limit = (now or time.time()) - self.retention
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('SELECT id, fichero FROM trabajos WHERE estado IN (?, ?) AND terminado < ?',
+                                (TERMINADO, ERROR, limit)).fetchall()
+            conn.executemany('DELETE FROM trabajos WHERE id = ?', [(row['id'],) for row in rows])
+            conn.execute('COMMIT')
+        for row in rows:
+            if row['fichero']:
+                _remove(os.path.join(self.output_dir, row['fichero']))
+        return len(rows)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+report_jobs = ReportJobQueue()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Proceso worker de la cola de reportes PDF (report_jobs.py)
+
+Ejecuta los trabajos encolados por las rutas de reportes en un proceso aparte
+del servidor web. Con este proceso en marcha conviene fijar REPORT_WORKERS=0
+en el servidor web para que no arranque también sus propios hilos.
+
+Uso:
+    python report_worker.py [--workers N]
+"""
+
+import argparse
+import logging
+import time
+
+from app import app
+from report_jobs import report_jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker de la cola de reportes PDF')
+    parser.add_argument('--workers', type=int, default=2, help='hilos que generan reportes a la vez (2)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(threadName)s %(message)s')
+    report_jobs.start(max(1, args.workers), daemon=True)
+    print(f"[OK] {args.workers} worker(s) procesando {report_jobs.db_path}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("[INFO] Esperando a que terminen los trabajos en curso...")
+        report_jobs.stop()
+
+
+if __name__ == '__main__':
+    main()
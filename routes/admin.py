@@ -1,8 +1,18 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
 from models import db, Usuario, Rol, Actividad, Entrenamiento, Asistencia, Competicion, ResultadoCompeticion
-from forms import UsuarioForm, ActividadForm, EntrenamientoForm, CompeticionForm, AsistenciaForm
+from forms import UsuarioForm, ActividadForm, EntrenamientoForm, CompeticionForm, AsistenciaForm, ImportarForm
+from pagination import keyset_paginate, next_page_url
+from sqlalchemy.orm import joinedload, contains_eager
 from datetime import datetime, date
+import csv
+import os
+import tempfile
+from query_stats import query_budget
+from principal import principal_cache
+from club_stats import get_stats
+from report_jobs import report_jobs
+import imports
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -15,24 +25,44 @@ def admin_required(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+def _parse_date(value):
+    """Convertir un parámetro YYYY-MM-DD en fecha, ignorando valores inválidos"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        return None
+
+def _paginate(query, columns, default_order='desc'):
+    """Paginar un listado según los parámetros ``cursor`` y ``orden`` de la petición"""
+    return keyset_paginate(
+        query,
+        columns,
+        cursor=request.args.get('cursor'),
+        per_page=current_app.config['ADMIN_PAGE_SIZE'],
+        descending=request.args.get('orden', default_order) == 'desc'
+    )
+
+def _rows_response(template, endpoint, page, **context):
+    """Fragmento JSON con las filas de una página para window.loadMoreData"""
+    return jsonify({
+        'html': render_template(template, **context),
+        'next_url': next_page_url(endpoint, page)
+    })
+
 @admin_bp.route('/dashboard')
 @login_required
 @admin_required
+@query_budget(10)
 def dashboard():
-    # Estadísticas básicas
-    stats = {
-        'total_usuarios': Usuario.query.count(),
-        'total_entrenadores': Usuario.query.join(Rol).filter(Rol.nombre_rol == 'Entrenador').count(),
-        'total_miembros': Usuario.query.join(Rol).filter(Rol.nombre_rol == 'Miembro').count(),
-        'total_entrenamientos': Entrenamiento.query.count(),
-        'total_competiciones': Competicion.query.count()
-    }
+    # Estadísticas básicas (fila mantenida de forma incremental, ver club_stats.py)
+    stats = get_stats()
     
     # Usuarios recientes
-    recent_usuarios = Usuario.query.order_by(Usuario.id_usuario.desc()).limit(5).all()
+    recent_usuarios = Usuario.query.options(joinedload(Usuario.rol))\
+        .order_by(Usuario.id_usuario.desc()).limit(5).all()
     
     # Próximas competiciones
-    upcoming_competiciones = Competicion.query.filter(
+    upcoming_competiciones = Competicion.query.options(joinedload(Competicion.actividad)).filter(
         Competicion.fecha >= date.today()
     ).order_by(Competicion.fecha).limit(5).all()
     
@@ -45,9 +75,46 @@ def dashboard():
 @admin_bp.route('/usuarios')
 @login_required
 @admin_required
+@query_budget(10)
 def usuarios():
-    usuarios = Usuario.query.all()
-    return render_template('admin/usuarios.html', usuarios=usuarios)
+    page = _usuarios_page()
+    roles = Rol.query.order_by(Rol.nombre_rol).all()
+    return render_template('admin/usuarios.html',
+                         usuarios=page.items,
+                         roles=roles,
+                         next_url=next_page_url('admin.usuarios_rows', page))
+
+@admin_bp.route('/usuarios/rows')
+@login_required
+@admin_required
+@query_budget(10)
+def usuarios_rows():
+    page = _usuarios_page()
+    return _rows_response('admin/_usuarios_rows.html', 'admin.usuarios_rows', page, usuarios=page.items)
+
+def _usuarios_page():
+    """Página de usuarios filtrada por rol y por prefijo de nombre, apellido o email"""
+    query = Usuario.query
+    
+    rol = request.args.get('rol', '')
+    if rol:
+        query = query.join(Rol).filter(Rol.nombre_rol == rol).options(contains_eager(Usuario.rol))
+    else:
+        query = query.options(joinedload(Usuario.rol))
+    
+    q = request.args.get('q', '').strip()
+    if q:
+        query = query.filter(db.or_(
+            Usuario.nombre.startswith(q),
+            Usuario.apellido.startswith(q),
+            Usuario.email.startswith(q)
+        ))
+    
+    if request.args.get('sort') == 'apellido':
+        columns = [Usuario.apellido, Usuario.id_usuario]
+    else:
+        columns = [Usuario.id_usuario]
+    return _paginate(query, columns, default_order='asc')
 
 @admin_bp.route('/usuarios/add', methods=['GET', 'POST'])
 @login_required
@@ -87,6 +154,7 @@ def edit_usuario(id):
         try:
             form.populate_obj(usuario)
             db.session.commit()
+            principal_cache.invalidate(id)
             flash('Usuario actualizado exitosamente', 'success')
             return redirect(url_for('admin.usuarios'))
         except Exception as e:
@@ -102,6 +170,7 @@ def delete_usuario(id):
     usuario = Usuario.query.get_or_404(id)
     db.session.delete(usuario)
     db.session.commit()
+    principal_cache.invalidate(id)
     flash('Usuario eliminado exitosamente', 'success')
     return redirect(url_for('admin.usuarios'))
 
@@ -161,11 +230,48 @@ def delete_actividad(id):
 @admin_bp.route('/entrenamientos')
 @login_required
 @admin_required
+@query_budget(10)
 def entrenamientos():
-    entrenamientos = Entrenamiento.query.join(Usuario, Entrenamiento.id_entrenador == Usuario.id_usuario)\
-        .join(Actividad, Entrenamiento.id_actividad == Actividad.id_actividad)\
-        .order_by(Entrenamiento.fecha.desc()).all()
-    return render_template('admin/entrenamientos.html', entrenamientos=entrenamientos)
+    page = _entrenamientos_page()
+    actividades = Actividad.query.order_by(Actividad.nombre_actividad).all()
+    return render_template('admin/entrenamientos.html',
+                         entrenamientos=page.items,
+                         actividades=actividades,
+                         next_url=next_page_url('admin.entrenamientos_rows', page))
+
+@admin_bp.route('/entrenamientos/rows')
+@login_required
+@admin_required
+@query_budget(10)
+def entrenamientos_rows():
+    page = _entrenamientos_page()
+    return _rows_response('admin/_entrenamientos_rows.html', 'admin.entrenamientos_rows', page,
+                          entrenamientos=page.items)
+
+def _entrenamientos_page():
+    """Página de entrenamientos filtrada por actividad, entrenador y rango de fechas"""
+    query = Entrenamiento.query.options(
+        joinedload(Entrenamiento.entrenador),
+        joinedload(Entrenamiento.actividad)
+    )
+    
+    id_actividad = request.args.get('actividad', type=int)
+    if id_actividad:
+        query = query.filter(Entrenamiento.id_actividad == id_actividad)
+    
+    id_entrenador = request.args.get('entrenador', type=int)
+    if id_entrenador:
+        query = query.filter(Entrenamiento.id_entrenador == id_entrenador)
+    
+    desde = _parse_date(request.args.get('desde'))
+    if desde:
+        query = query.filter(Entrenamiento.fecha >= desde)
+    
+    hasta = _parse_date(request.args.get('hasta'))
+    if hasta:
+        query = query.filter(Entrenamiento.fecha <= hasta)
+    
+    return _paginate(query, [Entrenamiento.fecha, Entrenamiento.id_entrenamiento])
 
 @admin_bp.route('/entrenamientos/add', methods=['GET', 'POST'])
 @login_required
@@ -221,10 +327,41 @@ def delete_entrenamiento(id):
 @admin_bp.route('/competiciones')
 @login_required
 @admin_required
+@query_budget(10)
 def competiciones():
-    competiciones = Competicion.query.join(Actividad, Competicion.id_actividad == Actividad.id_actividad, isouter=True)\
-        .order_by(Competicion.fecha.desc()).all()
-    return render_template('admin/competiciones.html', competiciones=competiciones)
+    page = _competiciones_page()
+    actividades = Actividad.query.order_by(Actividad.nombre_actividad).all()
+    return render_template('admin/competiciones.html',
+                         competiciones=page.items,
+                         actividades=actividades,
+                         next_url=next_page_url('admin.competiciones_rows', page))
+
+@admin_bp.route('/competiciones/rows')
+@login_required
+@admin_required
+@query_budget(10)
+def competiciones_rows():
+    page = _competiciones_page()
+    return _rows_response('admin/_competiciones_rows.html', 'admin.competiciones_rows', page,
+                          competiciones=page.items)
+
+def _competiciones_page():
+    """Página de competiciones filtrada por actividad y rango de fechas"""
+    query = Competicion.query.options(joinedload(Competicion.actividad))
+    
+    id_actividad = request.args.get('actividad', type=int)
+    if id_actividad:
+        query = query.filter(Competicion.id_actividad == id_actividad)
+    
+    desde = _parse_date(request.args.get('desde'))
+    if desde:
+        query = query.filter(Competicion.fecha >= desde)
+    
+    hasta = _parse_date(request.args.get('hasta'))
+    if hasta:
+        query = query.filter(Competicion.fecha <= hasta)
+    
+    return _paginate(query, [Competicion.fecha, Competicion.id_competicion])
 
 @admin_bp.route('/competiciones/add', methods=['GET', 'POST'])
 @login_required
@@ -278,4 +415,45 @@ def delete_competicion(id):
     db.session.delete(competicion)
     db.session.commit()
     flash('Competición eliminada exitosamente', 'success')
-    return redirect(url_for('admin.competiciones'))
\ No newline at end of file
+    return redirect(url_for('admin.competiciones'))
+
+# Importación CSV
+@admin_bp.route('/importar', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def importar():
+    form = ImportarForm()
+    resultado = None
+    informe_url = None
+    
+    if form.validate_on_submit():
+        conjunto = form.conjunto.data
+        try:
+            resultado = imports.import_csv(conjunto, form.archivo.data.stream,
+                                           current_app.config['IMPORT_HASH_PROCESSES'])
+        except (UnicodeDecodeError, csv.Error):
+            flash('El archivo debe ser un CSV con codificación UTF-8', 'error')
+        except Exception:
+            current_app.logger.exception('Error importando %s', conjunto)
+            flash('Error al importar: no se ha guardado ninguna fila', 'error')
+        else:
+            if resultado.errores:
+                informe_url = _error_report_url(conjunto, resultado.errores)
+            flash(f'{resultado.importadas} de {resultado.filas} filas importadas',
+                  'warning' if resultado.errores else 'success')
+    
+    return render_template('admin/importar.html', form=form, resultado=resultado, informe_url=informe_url,
+                           errores=resultado.errores[:current_app.config['IMPORT_ERRORS_SHOWN']] if resultado else [])
+
+def _error_report_url(conjunto, errores):
+    """Guardar el informe de errores como trabajo terminado y devolver su URL de descarga"""
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', suffix='.csv', delete=False) as output:
+        imports.write_error_report(errores, output)
+    try:
+        nombre = f'errores_importacion_{conjunto}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        job = report_jobs.add_finished('importacion', {'conjunto': conjunto}, current_user.id_usuario,
+                                       nombre, output.name)
+    finally:
+        os.remove(output.name)
+    return url_for('reports.job_download', job_id=job['id'])
+
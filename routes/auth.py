@@ -15,6 +15,9 @@ def login():
         user = Usuario.query.filter_by(email=form.email.data).first()
         if user and user.check_password(form.password.data) and user.is_active:
             login_user(user, remember=form.remember_me.data)
+            # check_password puede haber actualizado el hash a la política actual
+            if db.session.is_modified(user):
+                db.session.commit()
             next_page = request.args.get('next')
             if not next_page or not next_page.startswith('/'):
                 next_page = url_for('main.dashboard')
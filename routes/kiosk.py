@@ -0,0 +1,55 @@
+import math
+from flask import Blueprint, render_template, request, jsonify, abort
+from models import Entrenamiento
+from sqlalchemy.orm import joinedload
+from query_stats import query_budget
+import checkin
+from checkin import checkin_batcher, failed_codes
+
+kiosk_bp = Blueprint('kiosk', __name__)
+
+
+def _training_id(token):
+    id_entrenamiento = checkin.read_kiosk_token(token)
+    if id_entrenamiento is None:
+        abort(404)
+    return id_entrenamiento
+
+@kiosk_bp.route('/<token>')
+@query_budget(5)
+def index(token):
+    """Página del kiosco (sin sesión: el token firmado indica el entrenamiento)"""
+    entrenamiento = Entrenamiento.query.options(joinedload(Entrenamiento.actividad))\
+        .filter_by(id_entrenamiento=_training_id(token)).first_or_404()
+    return render_template('kiosk/index.html', entrenamiento=entrenamiento, token=token)
+
+@kiosk_bp.route('/<token>/checkin', methods=['POST'])
+def checkin_miembro(token):
+    """Registrar un código de check-in; las escrituras las agrupa el hilo de checkin.py"""
+    id_entrenamiento = _training_id(token)
+    data = request.get_json(silent=True) or request.form
+    codigo = data.get('codigo')
+    # Los fallos se cuentan por kiosco y por el miembro al que corresponde el código
+    keys = [('kiosco', token)]
+    claimed = checkin.claimed_member(codigo)
+    if claimed is not None:
+        keys.append(('miembro', claimed))
+    retry_after = failed_codes.retry_after(keys)
+    if retry_after:
+        seconds = math.ceil(retry_after)
+        response = jsonify({'estado': checkin.BLOQUEADO,
+                            'mensaje': f'Demasiados códigos incorrectos, espera {seconds} s'})
+        response.headers['Retry-After'] = str(seconds)
+        return response, 429
+    id_miembro = checkin.read_checkin_code(codigo)
+    if id_miembro is None:
+        failed_codes.record(keys)
+        return jsonify({'estado': checkin.NO_VALIDO, 'mensaje': 'Código no válido'}), 400
+    try:
+        estado, nombre = checkin_batcher.check_in(id_entrenamiento, id_miembro)
+    except Exception:
+        return jsonify({'estado': 'error', 'mensaje': 'No se pudo registrar, inténtalo de nuevo'}), 503
+    if estado == checkin.NO_VALIDO:
+        return jsonify({'estado': estado, 'mensaje': 'Código no válido'}), 400
+    mensaje = f'¡Bienvenido, {nombre}!' if estado == checkin.REGISTRADA else f'{nombre}, ya estabas registrado'
+    return jsonify({'estado': estado, 'mensaje': mensaje})
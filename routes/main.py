@@ -1,10 +1,25 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort, current_app, stream_with_context
 from flask_login import login_required, current_user
 from models import db, User, Usuario, Rol, Actividad, Entrenamiento, Asistencia, Competicion, ResultadoCompeticion
+from search_index import search_index
+from member_stats import get_member_stats
+from calendar_feed import calendar_cache
+from forms import RegenerarForm
+import credentials
+import ics_feed
+from sqlalchemy.orm import joinedload, contains_eager
 from datetime import datetime, date
 
 main_bp = Blueprint('main', __name__)
 
+# Tipo de resultado -> ((URL para administradores, URL para el resto), icono)
+SEARCH_RESULT_LINKS = {
+    'usuario': (('/admin/usuarios', '/profile'), 'fa-user'),
+    'entrenamiento': (('/admin/entrenamientos', '/trainer/trainings'), 'fa-running'),
+    'competicion': (('/admin/competiciones', '/member/competitions'), 'fa-trophy'),
+    'actividad': (('/admin/actividades', '/calendar'), 'fa-dumbbell'),
+}
+
 @main_bp.route('/')
 def index():
     if current_user.is_authenticated:
@@ -28,13 +43,81 @@ def dashboard():
 @main_bp.route('/calendar')
 @login_required
 def calendar():
-    competitions = Competicion.query.filter(
-        Competicion.fecha >= date.today()
-    ).order_by(Competicion.fecha).all()
+    # Solo la estructura de la página: los eventos del mes visible se piden a /calendar/events
+    return render_template('calendar.html', subscriptions=_calendar_subscriptions(),
+                         regenerar_form=RegenerarForm())
+
+def _calendar_subscriptions():
+    """Enlaces de suscripción .ics disponibles para el usuario actual: (etiqueta, URL)"""
+    version = credentials.current_version(current_user.id_usuario, credentials.CALENDARIO)
+    def link(scope, id):
+        token = ics_feed.feed_token(scope, id, current_user.id_usuario, version)
+        return url_for('main.calendar_ics', token=token, _external=True)
     
-    trainings = Entrenamiento.query.all()
+    subscriptions = []
+    nombre_rol = current_user.rol.nombre_rol if current_user.rol else None
+    if nombre_rol == 'Miembro':
+        subscriptions.append(('Mis actividades', link('miembro', current_user.id_usuario)))
+    elif nombre_rol == 'Entrenador':
+        subscriptions.append(('Mis entrenamientos', link('entrenador', current_user.id_usuario)))
+    for actividad in Actividad.query.order_by(Actividad.nombre_actividad):
+        subscriptions.append((actividad.nombre_actividad, link('actividad', actividad.id_actividad)))
+    return subscriptions
+
+@main_bp.route('/calendar/enlaces', methods=['POST'])
+@login_required
+def regenerar_enlaces_calendario():
+    """Invalidar todos los enlaces de suscripción del usuario (por ejemplo, si se han compartido)"""
+    if RegenerarForm().validate_on_submit():
+        credentials.rotate(current_user.id_usuario, credentials.CALENDARIO)
+        db.session.commit()
+        flash('Tus enlaces de suscripción se han regenerado; los anteriores ya no funcionan', 'success')
+    return redirect(url_for('main.calendar'))
+
+@main_bp.route('/calendar/feed/<token>.ics')
+def calendar_ics(token):
+    """Suscripción iCalendar (sin sesión: el token firmado indica el ámbito)"""
+    scope_id = ics_feed.read_token(token)
+    if scope_id is None:
+        abort(404)
+    scope, id = scope_id
+    start, end = ics_feed.feed_window()
+    actividades = ics_feed.scope_activities(scope, id)
+    name = ics_feed.feed_name(scope, id)
     
-    return render_template('calendar.html', competitions=competitions, trainings=trainings)
+    etag = ics_feed.feed_etag(scope, id, start, end, actividades, name)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(
+            stream_with_context(ics_feed.iter_ics(scope, id, start, end, actividades, name)),
+            mimetype='text/calendar')
+        response.headers['Content-Disposition'] = 'inline; filename="club-deportivo.ics"'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=300'
+    return response
+
+@main_bp.route('/calendar/events')
+@login_required
+def calendar_events():
+    """Entrenamientos y competiciones entre ``start`` y ``end`` (AAAA-MM-DD, ambos incluidos)"""
+    try:
+        start = date.fromisoformat(request.args['start'])
+        end = date.fromisoformat(request.args['end'])
+    except (KeyError, ValueError):
+        abort(400)
+    if end < start or (end - start).days > current_app.config['CALENDAR_MAX_DAYS']:
+        abort(400)
+    
+    entrenamientos, competiciones, etag = calendar_cache.events(start, end)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify({'entrenamientos': entrenamientos, 'competiciones': competiciones})
+    response.set_etag(etag)
+    # El navegador guarda la respuesta pero la revalida siempre con If-None-Match
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @main_bp.route('/profile')
 @login_required
@@ -49,15 +132,18 @@ def profile():
     
     if hasattr(current_user, 'rol') and current_user.rol:
         if current_user.rol.nombre_rol == 'Miembro':
-            # Estadísticas para miembros
-            user_stats['total_trainings'] = Entrenamiento.query.count()
-            user_stats['total_attendance'] = Asistencia.query.filter_by(id_miembro=current_user.id_usuario).count()
-            if user_stats['total_trainings'] > 0:
-                user_stats['attendance_rate'] = round((user_stats['total_attendance'] / user_stats['total_trainings']) * 100, 1)
+            # Estadísticas para miembros: entrenamientos a los que ha sido convocado
+            # y asistencias (resúmenes mantenidos en member_stats.py)
+            member_stats = get_member_stats(current_user.id_usuario)
+            user_stats['total_trainings'] = member_stats['total_convocatorias']
+            user_stats['total_attendance'] = member_stats['total_asistencias']
+            user_stats['attendance_rate'] = member_stats['tasa_asistencia']
             
             # Actividades recientes
             recent_attendances = Asistencia.query.filter_by(id_miembro=current_user.id_usuario)\
-                .join(Entrenamiento).order_by(Entrenamiento.fecha.desc()).limit(5).all()
+                .join(Entrenamiento)\
+                .options(contains_eager(Asistencia.entrenamiento).joinedload(Entrenamiento.actividad))\
+                .order_by(Entrenamiento.fecha.desc()).limit(5).all()
             user_stats['recent_activities'] = recent_attendances
     
     return render_template('profile.html', user_stats=user_stats)
@@ -74,100 +160,42 @@ def search():
     if not query or len(query) < 2:
         return jsonify([])
     
-    results = []
+    try:
+        fecha = datetime.strptime(search_date, '%Y-%m-%d').date() if search_date else None
+    except ValueError:
+        return jsonify([])
     
     try:
-        # Buscar usuarios
-        if not search_type or search_type == 'usuario':
-            usuarios_query = Usuario.query.join(Rol)
-            
-            if search_role:
-                usuarios_query = usuarios_query.filter(Rol.nombre_rol == search_role)
-            
-            usuarios = usuarios_query.filter(
-                db.or_(
-                    Usuario.nombre.contains(query),
-                    Usuario.apellido.contains(query),
-                    Usuario.email.contains(query),
-                    Rol.nombre_rol.contains(query)
-                )
-            ).limit(10).all()
-            
-            for usuario in usuarios:
-                results.append({
-                    'type': 'usuario',
-                    'title': f"{usuario.nombre} {usuario.apellido}",
-                    'description': f"{usuario.rol.nombre_rol} - {usuario.email}",
-                    'url': '/admin/usuarios' if current_user.rol and current_user.rol.nombre_rol == 'Administrador' else '/profile',
-                    'icon': 'fa-user'
-                })
-        
-        # Buscar entrenamientos
-        if not search_type or search_type == 'entrenamiento':
-            entrenamientos_query = Entrenamiento.query.join(Actividad).join(Usuario, Entrenamiento.id_entrenador == Usuario.id_usuario)
-            
-            if search_date:
-                entrenamientos_query = entrenamientos_query.filter(Entrenamiento.fecha == search_date)
-            
-            entrenamientos = entrenamientos_query.filter(
-                db.or_(
-                    Actividad.nombre_actividad.contains(query),
-                    Usuario.nombre.contains(query),
-                    Usuario.apellido.contains(query)
-                )
-            ).limit(10).all()
-            
-            for entrenamiento in entrenamientos:
-                results.append({
-                    'type': 'entrenamiento',
-                    'title': f"Entrenamiento de {entrenamiento.actividad.nombre_actividad}",
-                    'description': f"Entrenador: {entrenamiento.entrenador.nombre} {entrenamiento.entrenador.apellido} - {entrenamiento.fecha.strftime('%d/%m/%Y')}",
-                    'url': '/admin/entrenamientos' if current_user.rol and current_user.rol.nombre_rol == 'Administrador' else '/trainer/trainings',
-                    'icon': 'fa-running'
-                })
-        
-        # Buscar competiciones
-        if not search_type or search_type == 'competicion':
-            competiciones_query = Competicion.query.join(Actividad)
-            
-            if search_date:
-                competiciones_query = competiciones_query.filter(Competicion.fecha == search_date)
-            
-            competiciones = competiciones_query.filter(
-                db.or_(
-                    Competicion.nombre.contains(query),
-                    Competicion.ubicacion.contains(query),
-                    Competicion.descripcion.contains(query),
-                    Actividad.nombre_actividad.contains(query)
-                )
-            ).limit(10).all()
-            
-            for competicion in competiciones:
-                results.append({
-                    'type': 'competicion',
-                    'title': competicion.nombre,
-                    'description': f"{competicion.ubicacion or 'Sin ubicación'} - {competicion.fecha.strftime('%d/%m/%Y')}",
-                    'url': '/admin/competiciones' if current_user.rol and current_user.rol.nombre_rol == 'Administrador' else '/member/competitions',
-                    'icon': 'fa-trophy'
-                })
-        
-        # Buscar actividades
-        if not search_type or search_type == 'actividad':
-            actividades = Actividad.query.filter(
-                Actividad.nombre_actividad.contains(query)
-            ).limit(10).all()
-            
-            for actividad in actividades:
-                results.append({
-                    'type': 'actividad',
-                    'title': actividad.nombre_actividad,
-                    'description': 'Actividad deportiva',
-                    'url': '/admin/actividades' if current_user.rol and current_user.rol.nombre_rol == 'Administrador' else '/calendar',
-                    'icon': 'fa-dumbbell'
-                })
-        
+        # Búsqueda en el índice en memoria, ordenada por relevancia
+        documents = search_index.search(query, doc_type=search_type or None,
+                                        role=search_role or None, fecha=fecha)
     except Exception as e:
         print(f"Error en búsqueda: {e}")
         return jsonify([])
     
-    return jsonify(results[:20])  # Limitar a 20 resultados
\ No newline at end of file
+    es_admin = current_user.rol and current_user.rol.nombre_rol == 'Administrador'
+    results = []
+    for document in documents:
+        url, icon = SEARCH_RESULT_LINKS[document.type]
+        results.append({
+            'type': document.type,
+            'title': document.title,
+            'description': document.description,
+            'url': url[0] if es_admin else url[1],
+            'icon': icon
+        })
+    
+    return jsonify(results)
+
+@main_bp.route('/api/search/suggest')
+@login_required
+def suggest():
+    """Autocompletado por prefijo servido íntegramente desde memoria"""
+    query = request.args.get('q', '').strip()
+    suggest_type = request.args.get('type', '')
+    
+    if not query:
+        return jsonify([])
+    
+    documents = search_index.suggest(query, doc_type=suggest_type or None)
+    return jsonify([{'type': document.type, 'text': document.title} for document in documents])
@@ -1,10 +1,31 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
 from models import db, Usuario, Rol, Actividad, Entrenamiento, Asistencia, Competicion, ResultadoCompeticion
-from datetime import datetime, date
+from sqlalchemy.orm import joinedload
+from pagination import keyset_paginate, next_page_url
+from member_stats import get_member_stats
+from datetime import datetime, date, timedelta
+from query_stats import query_budget
+import checkin
+import credentials
+from forms import RegenerarForm
 
 member_bp = Blueprint('member', __name__)
 
+
+def _entrenamiento_loaders():
+    """Cargas explícitas de lo que muestran las plantillas de cada entrenamiento"""
+    return (joinedload(Entrenamiento.actividad), joinedload(Entrenamiento.entrenador))
+
+
+def _asistencia_loaders():
+    """Cargas explícitas de lo que muestran las plantillas de cada asistencia"""
+    return (
+        joinedload(Asistencia.entrenamiento).joinedload(Entrenamiento.actividad),
+        joinedload(Asistencia.entrenamiento).joinedload(Entrenamiento.entrenador),
+    )
+
+
 def member_required(f):
     def decorated_function(*args, **kwargs):
         if not current_user.is_authenticated or not hasattr(current_user, 'rol') or current_user.rol.nombre_rol != 'Miembro':
@@ -17,30 +38,30 @@ def member_required(f):
 @member_bp.route('/dashboard')
 @login_required
 @member_required
+@query_budget(10)
 def dashboard():
-    # Estadísticas del miembro
+    # Estadísticas del miembro (resúmenes mantenidos en member_stats.py)
+    member_stats = get_member_stats(current_user.id_usuario)
     stats = {
-        'total_asistencias': Asistencia.query.filter_by(id_miembro=current_user.id_usuario).count(),
-        'este_mes_asistencias': Asistencia.query.filter(
-            Asistencia.id_miembro == current_user.id_usuario,
-            Asistencia.id_entrenamiento == Entrenamiento.id_entrenamiento
-        ).count(),
-        'esta_semana_asistencias': Asistencia.query.filter(
-            Asistencia.id_miembro == current_user.id_usuario,
-            Asistencia.id_entrenamiento == Entrenamiento.id_entrenamiento
-        ).count()
+        'total_asistencias': member_stats['total_asistencias'],
+        'este_mes_asistencias': member_stats['asistencias_mes'],
+        'esta_semana_asistencias': member_stats['asistencias_semana']
     }
     
     # Asistencias recientes del miembro
-    recent_asistencias = Asistencia.query.filter_by(
+    recent_asistencias = Asistencia.query.options(*_asistencia_loaders()).filter_by(
         id_miembro=current_user.id_usuario
     ).order_by(Asistencia.id_asistencia.desc()).limit(10).all()
     
     # Próximos entrenamientos disponibles
-    available_entrenamientos = Entrenamiento.query.all()
+    today = date.today()
+    available_entrenamientos = Entrenamiento.query.options(*_entrenamiento_loaders()).filter(
+        Entrenamiento.fecha >= today,
+        Entrenamiento.fecha <= today + timedelta(days=current_app.config['MEMBER_UPCOMING_DAYS'])
+    ).order_by(Entrenamiento.fecha).all()
     
     # Próximas competiciones
-    upcoming_competiciones = Competicion.query.filter(
+    upcoming_competiciones = Competicion.query.options(joinedload(Competicion.actividad)).filter(
         Competicion.fecha >= date.today()
     ).order_by(Competicion.fecha).limit(5).all()
     
@@ -53,15 +74,17 @@ def dashboard():
 @member_bp.route('/entrenamientos')
 @login_required
 @member_required
+@query_budget(10)
 def entrenamientos():
-    entrenamientos = Entrenamiento.query.all()
+    entrenamientos = Entrenamiento.query.options(*_entrenamiento_loaders()).all()
     return render_template('member/entrenamientos.html', entrenamientos=entrenamientos)
 
 @member_bp.route('/asistencias')
 @login_required
 @member_required
+@query_budget(10)
 def asistencias():
-    asistencias = Asistencia.query.filter_by(
+    asistencias = Asistencia.query.options(*_asistencia_loaders()).filter_by(
         id_miembro=current_user.id_usuario
     ).order_by(Asistencia.id_asistencia.desc()).all()
     return render_template('member/asistencias.html', asistencias=asistencias)
@@ -69,8 +92,9 @@ def asistencias():
 @member_bp.route('/competiciones')
 @login_required
 @member_required
+@query_budget(10)
 def competiciones():
-    competiciones = Competicion.query.filter(
+    competiciones = Competicion.query.options(joinedload(Competicion.actividad)).filter(
         Competicion.fecha >= date.today()
     ).order_by(Competicion.fecha).all()
     return render_template('member/competiciones.html', competiciones=competiciones)
@@ -84,23 +108,58 @@ def perfil():
 @member_bp.route('/historial')
 @login_required
 @member_required
+@query_budget(10)
 def historial():
-    # Obtener historial de asistencias con estadísticas
-    asistencias = Asistencia.query.filter_by(
-        id_miembro=current_user.id_usuario
-    ).order_by(Asistencia.id_asistencia.desc()).all()
+    # Primera página del historial de asistencias
+    page = _historial_page()
     
     # Estadísticas por mes
-    monthly_stats = {}
-    for asistencia in asistencias:
-        # Obtener la fecha del entrenamiento
-        entrenamiento = Entrenamiento.query.get(asistencia.id_entrenamiento)
-        if entrenamiento:
-            month_key = entrenamiento.fecha.strftime('%Y-%m')
-            if month_key not in monthly_stats:
-                monthly_stats[month_key] = 0
-            monthly_stats[month_key] += 1
+    monthly_stats = _monthly_stats(current_user.id_usuario)
     
     return render_template('member/historial.html', 
-                         asistencias=asistencias,
-                         monthly_stats=monthly_stats)
\ No newline at end of file
+                         asistencias=page.items,
+                         monthly_stats=monthly_stats,
+                         checkin_code=checkin.checkin_code(current_user.id_usuario),
+                         regenerar_form=RegenerarForm(),
+                         next_url=next_page_url('member.historial_rows', page))
+
+@member_bp.route('/codigo-checkin', methods=['POST'])
+@login_required
+@member_required
+def regenerar_codigo_checkin():
+    """Invalidar el código de check-in actual (por ejemplo, si otra persona lo conoce)"""
+    if RegenerarForm().validate_on_submit():
+        credentials.rotate(current_user.id_usuario, credentials.CHECKIN)
+        db.session.commit()
+        flash('Tu código de check-in se ha regenerado; el anterior ya no es válido', 'success')
+    return redirect(url_for('member.historial'))
+
+@member_bp.route('/historial/rows')
+@login_required
+@member_required
+@query_budget(10)
+def historial_rows():
+    page = _historial_page()
+    return jsonify({
+        'html': render_template('member/_historial_rows.html', asistencias=page.items),
+        'next_url': next_page_url('member.historial_rows', page)
+    })
+
+def _historial_page():
+    """Página de asistencias del miembro, de la más reciente a la más antigua"""
+    query = Asistencia.query.options(*_asistencia_loaders()).filter_by(id_miembro=current_user.id_usuario)
+    return keyset_paginate(query, [Asistencia.id_asistencia],
+                           cursor=request.args.get('cursor'),
+                           per_page=current_app.config['MEMBER_PAGE_SIZE'],
+                           descending=True)
+
+def _monthly_stats(id_miembro):
+    """Asistencias por mes ('AAAA-MM' -> total), calculadas con una sola consulta agrupada"""
+    year = db.extract('year', Entrenamiento.fecha)
+    month = db.extract('month', Entrenamiento.fecha)
+    rows = db.session.query(year, month, db.func.count(Asistencia.id_asistencia))\
+        .join(Entrenamiento, Asistencia.id_entrenamiento == Entrenamiento.id_entrenamiento)\
+        .filter(Asistencia.id_miembro == id_miembro)\
+        .group_by(year, month)\
+        .order_by(year.desc(), month.desc()).all()
+    return {f'{int(y):04d}-{int(m):02d}': total for y, m, total in rows}
\ No newline at end of file
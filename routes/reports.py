@@ -1,8 +1,14 @@
-from flask import Blueprint, render_template, make_response, request, redirect, url_for, flash
+from flask import Blueprint, render_template, make_response, request, redirect, url_for, flash, jsonify, abort, send_file, current_app, stream_with_context
 from flask_login import login_required, current_user
 from models import db, Usuario, Rol, Actividad, Entrenamiento, Asistencia, Competicion, ResultadoCompeticion
 from datetime import datetime, date, timedelta
 from pdf_generator import ClubPDFGenerator
+from sqlalchemy.orm import joinedload, contains_eager
+from query_stats import query_budget
+from report_jobs import report_jobs, TERMINADO, ERROR, PENDIENTE
+from report_cache import report_cache, data_stamp
+import exports
+import member_reports
 
 reports_bp = Blueprint('reports', __name__)
 
@@ -19,169 +25,289 @@ def admin_required(f):
 def index():
     return render_template('reports/index.html')
 
-@reports_bp.route('/usuarios/pdf')
-@login_required
-@admin_required
-def usuarios_pdf():
+def _timestamp(moment=None):
+    return (moment or datetime.now()).strftime("%Y%m%d_%H%M%S")
+
+# Tablas que lee cada reporte: sus versiones forman parte de la clave en la caché
+REPORT_TABLES = {}
+
+def cached_report(tipo, tables):
+    """Registrar el generador de ``tipo`` en la cola de reportes, a través de la caché de reportes
+
+    El generador recibe la fecha de los datos (la que muestra el PDF) y los
+    parámetros del trabajo, y devuelve (nombre del fichero, fichero con el PDF).
+    """
+    REPORT_TABLES[tipo] = tables
+    def decorator(f):
+        def build(**params):
+            # Versiones leídas antes que los datos: en el peor caso se regenera de más
+            stamp, generated_at = data_stamp(tables)
+            key = report_cache.key(tipo, params, stamp)
+            cached = report_cache.get(key)
+            if cached is not None:
+                return cached.nombre, open(cached.path, 'rb')
+            nombre, pdf = f(generated_at or datetime.now(), **params)
+            report_cache.put(key, nombre, pdf)
+            return nombre, pdf
+        build.__name__ = f.__name__
+        report_jobs.register(tipo)(build)
+        return f
+    return decorator
+
+# Generadores de los reportes: se ejecutan en los workers de report_jobs, fuera
+# de la petición
+
+@cached_report('usuarios', ('usuarios', 'roles'))
+def build_usuarios_pdf(generated_at):
     """Generar PDF de usuarios"""
-    usuarios = Usuario.query.join(Rol).all()
-    
-    pdf_generator = ClubPDFGenerator()
-    
-    # Crear un PDF simple con lista de usuarios
-    buffer = BytesIO()
-    from reportlab.lib.pagesizes import A4
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib.styles import getSampleStyleSheet
-    from reportlab.lib import colors
-    from reportlab.lib.enums import TA_CENTER
-    
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    story = []
+    usuarios = Usuario.query.outerjoin(Rol).options(contains_eager(Usuario.rol)).order_by(Usuario.id_usuario).all()
     
-    # Título
-    story.append(Paragraph("REPORTE DE USUARIOS", styles['Title']))
-    story.append(Spacer(1, 20))
-    
-    # Tabla de usuarios
-    data = [['ID', 'Nombre', 'Email', 'Rol']]
-    for usuario in usuarios:
-        data.append([
-            str(usuario.id_usuario),
-            f"{usuario.nombre} {usuario.apellido}",
-            usuario.email,
-            usuario.rol.nombre_rol if usuario.rol else 'No asignado'
-        ])
+    pdf_generator = ClubPDFGenerator(generated_at)
+    return f'usuarios_{_timestamp(generated_at)}.pdf', pdf_generator.generate_users_report(usuarios)
+
+@cached_report('actividades', ('actividades',))
+def build_actividades_pdf(generated_at):
+    """Generar PDF de actividades"""
+    actividades = Actividad.query.all()
     
-    table = Table(data, colWidths=[1*inch, 2.5*inch, 2.5*inch, 1.5*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+    pdf_generator = ClubPDFGenerator(generated_at)
+    return f'actividades_{_timestamp(generated_at)}.pdf', pdf_generator.generate_activities_report(actividades)
+
+@cached_report('entrenamientos', ('entrenamientos', 'usuarios', 'actividades'))
+def build_entrenamientos_pdf(generated_at):
+    """Generar PDF de entrenamientos"""
+    entrenamientos = Entrenamiento.query.join(Usuario, Entrenamiento.id_entrenador == Usuario.id_usuario)\
+        .join(Actividad, Entrenamiento.id_actividad == Actividad.id_actividad)\
+        .options(contains_eager(Entrenamiento.entrenador), contains_eager(Entrenamiento.actividad))\
+        .order_by(Entrenamiento.fecha.desc()).all()
     
-    story.append(table)
-    doc.build(story)
+    pdf_generator = ClubPDFGenerator(generated_at)
+    return f'entrenamientos_{_timestamp(generated_at)}.pdf', pdf_generator.generate_trainings_report(entrenamientos)
+
+@cached_report('competiciones', ('competiciones', 'actividades'))
+def build_competiciones_pdf(generated_at):
+    """Generar PDF de competiciones"""
+    competiciones = Competicion.query.join(Actividad, Competicion.id_actividad == Actividad.id_actividad, isouter=True)\
+        .options(contains_eager(Competicion.actividad))\
+        .order_by(Competicion.fecha.desc()).all()
     
-    buffer.seek(0)
-    response = make_response(buffer.getvalue())
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=usuarios_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+    pdf_generator = ClubPDFGenerator(generated_at)
+    return f'competiciones_{_timestamp(generated_at)}.pdf', pdf_generator.generate_competitions_report(competiciones)
+
+@cached_report('asistencias', ('asistencias', 'entrenamientos', 'usuarios', 'actividades'))
+def build_asistencias_pdf(generated_at):
+    """Generar PDF de asistencias"""
+    # Filas planas leídas del cursor por lotes mientras se maqueta el PDF: la
+    # memoria no depende del número de asistencias
+    asistencias = db.session.query(Usuario.nombre.label('miembro_nombre'), Usuario.apellido.label('miembro_apellido'),
+                                   Actividad.nombre_actividad.label('actividad'), Entrenamiento.fecha,
+                                   Asistencia.presente, Asistencia.observaciones)\
+        .join(Usuario, Asistencia.id_miembro == Usuario.id_usuario)\
+        .join(Entrenamiento, Asistencia.id_entrenamiento == Entrenamiento.id_entrenamiento)\
+        .join(Actividad, Entrenamiento.id_actividad == Actividad.id_actividad)\
+        .order_by(Asistencia.id_asistencia.desc()).yield_per(exports.STREAM_BATCH)
     
+    pdf_generator = ClubPDFGenerator(generated_at)
+    return f'asistencias_{_timestamp(generated_at)}.pdf', pdf_generator.generate_attendance_report(asistencias)
+
+@cached_report('miembro', member_reports.MEMBER_TABLES)
+def build_miembro_pdf(generated_at, user_id):
+    """Generar PDF de miembro individual"""
+    reports = member_reports.load_member_reports([user_id])
+    if not reports:
+        raise LookupError(f'El usuario {user_id} ya no existe')
+    usuario = reports[0].member
+    buffer = member_reports.render_member_report(reports[0], generated_at)
+    return f'miembro_{usuario.nombre}_{usuario.apellido}_{_timestamp(generated_at)}.pdf', buffer
+
+@cached_report('miembros', member_reports.MEMBER_TABLES)
+def build_miembros_zip(generated_at):
+    """ZIP con el reporte individual de cada miembro (fin de temporada)"""
+    reports = member_reports.load_member_reports()
+    archive = member_reports.build_members_zip(reports, generated_at, current_app.config.get('REPORT_ZIP_PROCESSES'))
+    return f'miembros_{_timestamp(generated_at)}.zip', archive
+
+def _is_admin():
+    return hasattr(current_user, 'rol') and current_user.rol and current_user.rol.nombre_rol == 'Administrador'
+
+def _wants_json():
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+def _job_status(job):
+    """Estado de un trabajo para la respuesta JSON"""
+    status = {
+        'id': job['id'],
+        'tipo': job['tipo'],
+        'estado': job['estado'],
+        'creado': datetime.fromtimestamp(job['creado']).isoformat(timespec='seconds'),
+        'status_url': url_for('reports.job_status', job_id=job['id']),
+    }
+    if job['estado'] == PENDIENTE:
+        status['posicion'] = report_jobs.position(job)
+    elif job['estado'] == TERMINADO:
+        status['download_url'] = url_for('reports.job_download', job_id=job['id'])
+        status['nombre'] = job['nombre']
+    elif job['estado'] == ERROR:
+        status['error'] = 'No se pudo generar el reporte'
+    return status
+
+def _cached(tipo, params):
+    """Reporte en caché para los datos actuales, o None"""
+    if not report_cache.enabled:
+        return None
+    stamp, _ = data_stamp(REPORT_TABLES[tipo])
+    return report_cache.get(report_cache.key(tipo, params, stamp))
+
+def _send_cached(cached):
+    """Servir un reporte de la caché; su clave es el ETag (If-None-Match -> 304)
+
+    El tipo (PDF o ZIP) se deduce del nombre de descarga.
+    """
+    response = send_file(cached.path, as_attachment=True, download_name=cached.nombre, etag=cached.key)
+    response.headers['Cache-Control'] = 'private, no-cache'
     return response
 
+def _enqueue(tipo, **params):
+    """Encolar un reporte y enviar al usuario a la página de seguimiento (o devolver el trabajo en JSON)
+
+    Si los datos no han cambiado desde la última vez, el reporte sale de la caché sin encolar nada.
+    """
+    cached = _cached(tipo, params)
+    if cached is not None:
+        if not _wants_json():
+            return _send_cached(cached)
+        job = report_jobs.add_finished(tipo, params, current_user.id_usuario, cached.nombre, cached.path)
+        return jsonify(_job_status(job))
+    
+    job = report_jobs.enqueue(tipo, params, current_user.id_usuario)
+    if _wants_json():
+        response = jsonify(_job_status(job))
+        response.status_code = 202
+        response.headers['Location'] = url_for('reports.job_status', job_id=job['id'])
+        return response
+    return redirect(url_for('reports.job_page', job_id=job['id']))
+
+def _get_job_or_404(job_id):
+    """Trabajo del usuario actual (los administradores ven todos)"""
+    job = report_jobs.get(job_id)
+    if job is None or (job['id_usuario'] != current_user.id_usuario and not _is_admin()):
+        abort(404)
+    return job
+
+@reports_bp.route('/usuarios/pdf')
+@login_required
+@admin_required
+def usuarios_pdf():
+    """Encolar el PDF de usuarios"""
+    return _enqueue('usuarios')
+
 @reports_bp.route('/actividades/pdf')
 @login_required
 @admin_required
 def actividades_pdf():
-    """Generar PDF de actividades"""
-    actividades = Actividad.query.all()
-    
-    pdf_generator = ClubPDFGenerator()
-    buffer = pdf_generator.generate_activities_report(actividades)
-    
-    response = make_response(buffer.getvalue())
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=actividades_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-    
-    return response
+    """Encolar el PDF de actividades"""
+    return _enqueue('actividades')
 
 @reports_bp.route('/entrenamientos/pdf')
 @login_required
 @admin_required
 def entrenamientos_pdf():
-    """Generar PDF de entrenamientos"""
-    entrenamientos = Entrenamiento.query.join(Usuario, Entrenamiento.id_entrenador == Usuario.id_usuario)\
-        .join(Actividad, Entrenamiento.id_actividad == Actividad.id_actividad)\
-        .order_by(Entrenamiento.fecha.desc()).all()
-    
-    pdf_generator = ClubPDFGenerator()
-    buffer = pdf_generator.generate_trainings_report(entrenamientos)
-    
-    response = make_response(buffer.getvalue())
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=entrenamientos_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-    
-    return response
+    """Encolar el PDF de entrenamientos"""
+    return _enqueue('entrenamientos')
 
 @reports_bp.route('/competiciones/pdf')
 @login_required
 @admin_required
 def competiciones_pdf():
-    """Generar PDF de competiciones"""
-    competiciones = Competicion.query.join(Actividad, Competicion.id_actividad == Actividad.id_actividad, isouter=True)\
-        .order_by(Competicion.fecha.desc()).all()
-    
-    pdf_generator = ClubPDFGenerator()
-    buffer = pdf_generator.generate_competitions_report(competiciones)
-    
-    response = make_response(buffer.getvalue())
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=competiciones_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-    
-    return response
+    """Encolar el PDF de competiciones"""
+    return _enqueue('competiciones')
 
 @reports_bp.route('/asistencias/pdf')
 @login_required
 @admin_required
 def asistencias_pdf():
-    """Generar PDF de asistencias"""
-    asistencias = Asistencia.query.join(Usuario, Asistencia.id_miembro == Usuario.id_usuario)\
-        .join(Entrenamiento, Asistencia.id_entrenamiento == Entrenamiento.id_entrenamiento)\
-        .join(Actividad, Entrenamiento.id_actividad == Actividad.id_actividad)\
-        .order_by(Asistencia.id_asistencia.desc()).all()
-    
-    pdf_generator = ClubPDFGenerator()
-    buffer = pdf_generator.generate_attendance_report(asistencias)
-    
-    response = make_response(buffer.getvalue())
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=asistencias_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-    
-    return response
+    """Encolar el PDF de asistencias"""
+    return _enqueue('asistencias')
 
 @reports_bp.route('/miembro/<int:user_id>/pdf')
 @login_required
 def miembro_pdf(user_id):
-    """Generar PDF de miembro individual"""
+    """Encolar el PDF de un miembro individual"""
     # Solo permitir que los usuarios vean su propio reporte o que los admins vean cualquier reporte
-    if current_user.id_usuario != user_id and (not hasattr(current_user, 'rol') or current_user.rol.nombre_rol != 'Administrador'):
+    if current_user.id_usuario != user_id and not _is_admin():
         flash('No tienes permisos para ver este reporte', 'error')
         return redirect(url_for('main.dashboard'))
     
-    usuario = Usuario.query.get_or_404(user_id)
-    
-    # Obtener entrenamientos y competiciones del usuario
-    entrenamientos = []
-    competiciones = []
-    
-    if hasattr(usuario, 'rol') and usuario.rol.nombre_rol == 'Miembro':
-        # Obtener asistencias del miembro
-        asistencias = Asistencia.query.filter_by(id_miembro=user_id)\
-            .join(Entrenamiento).join(Actividad).all()
-        entrenamientos = asistencias
-    
-        # Obtener competiciones relacionadas (esto sería más complejo en un caso real)
-        competiciones = Competicion.query.join(Actividad).all()
-    
-    pdf_generator = ClubPDFGenerator()
-    buffer = pdf_generator.generate_member_report(usuario, entrenamientos, competiciones)
-    
-    response = make_response(buffer.getvalue())
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=miembro_{usuario.nombre}_{usuario.apellido}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+    if db.session.query(Usuario.id_usuario).filter(Usuario.id_usuario == user_id).scalar() is None:
+        abort(404)
+    return _enqueue('miembro', user_id=user_id)
+
+@reports_bp.route('/miembros/zip')
+@login_required
+@admin_required
+def miembros_zip():
+    """Encolar el ZIP con el PDF de cada miembro"""
+    return _enqueue('miembros')
+
+@reports_bp.route('/jobs/<job_id>')
+@login_required
+def job_page(job_id):
+    """Página que espera a que termine un reporte y lo descarga"""
+    job = _get_job_or_404(job_id)
+    return render_template('reports/job.html', job=_job_status(job))
+
+@reports_bp.route('/jobs/<job_id>/status')
+@login_required
+def job_status(job_id):
+    """Estado de un trabajo (para consultar periódicamente)"""
+    job = _get_job_or_404(job_id)
+    response = jsonify(_job_status(job))
+    response.headers['Cache-Control'] = 'no-store'
+    if job['estado'] not in (TERMINADO, ERROR):
+        report_jobs.wake()
+        response.headers['Retry-After'] = '1'
+    return response
+
+@reports_bp.route('/jobs/<job_id>/download')
+@login_required
+def job_download(job_id):
+    """Descargar el fichero de un trabajo terminado"""
+    job = _get_job_or_404(job_id)
+    if job['estado'] != TERMINADO:
+        response = jsonify(_job_status(job))
+        response.status_code = 409
+        return response
+    path = report_jobs.file_path(job)
+    if path is None:
+        # El fichero ya se ha eliminado por antigüedad
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=job['nombre'])
+
+@reports_bp.route('/export/<dataset>.<fmt>')
+@login_required
+@admin_required
+def export_dataset(dataset, fmt):
+    """Exportar un conjunto de datos en CSV o NDJSON, fila a fila"""
+    if dataset not in exports.DATASETS or fmt not in exports.FORMATS:
+        abort(404)
+    try:
+        start = date.fromisoformat(request.args['start_date']) if request.args.get('start_date') else None
+        end = date.fromisoformat(request.args['end_date']) if request.args.get('end_date') else None
+    except ValueError:
+        abort(400)
     
+    query = exports.dataset_query(dataset, start, end)
+    response = current_app.response_class(stream_with_context(exports.iter_export(query, fmt)),
+                                          content_type=exports.FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={dataset}_{_timestamp()}.{fmt}'
+    # Que un proxy intermedio no acumule la respuesta entera antes de reenviarla
+    response.headers['X-Accel-Buffering'] = 'no'
     return response
 
 @reports_bp.route('/asistencias')
 @login_required
 @admin_required
+@query_budget(10)
 def reporte_asistencias():
     # Obtener parámetros de fecha
     start_date = request.args.get('start_date', (date.today() - timedelta(days=30)).strftime('%Y-%m-%d'))
@@ -192,7 +318,10 @@ def reporte_asistencias():
     end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
     
     # Obtener asistencias en el rango de fechas
-    asistencias = Asistencia.query.join(Entrenamiento).filter(
+    asistencias = Asistencia.query.join(Entrenamiento).options(
+        contains_eager(Asistencia.entrenamiento).joinedload(Entrenamiento.actividad),
+        joinedload(Asistencia.miembro)
+    ).filter(
         Entrenamiento.fecha >= start_date,
         Entrenamiento.fecha <= end_date
     ).order_by(Entrenamiento.fecha.desc()).all()
@@ -205,20 +334,26 @@ def reporte_asistencias():
 @reports_bp.route('/usuarios')
 @login_required
 @admin_required
+@query_budget(10)
 def reporte_usuarios():
-    usuarios = Usuario.query.all()
+    usuarios = Usuario.query.options(joinedload(Usuario.rol)).all()
     return render_template('reports/usuarios.html', usuarios=usuarios)
 
 @reports_bp.route('/entrenamientos')
 @login_required
 @admin_required
+@query_budget(10)
 def reporte_entrenamientos():
-    entrenamientos = Entrenamiento.query.all()
+    entrenamientos = Entrenamiento.query.options(
+        joinedload(Entrenamiento.entrenador),
+        joinedload(Entrenamiento.actividad)
+    ).all()
     return render_template('reports/entrenamientos.html', entrenamientos=entrenamientos)
 
 @reports_bp.route('/competiciones')
 @login_required
 @admin_required
+@query_budget(10)
 def reporte_competiciones():
-    competiciones = Competicion.query.all()
+    competiciones = Competicion.query.options(joinedload(Competicion.actividad)).all()
     return render_template('reports/competiciones.html', competiciones=competiciones)
\ No newline at end of file
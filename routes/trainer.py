@@ -1,11 +1,26 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
+from flask_wtf.csrf import generate_csrf, validate_csrf
+from wtforms.validators import ValidationError
 from flask_login import login_required, current_user
 from models import db, Usuario, Rol, Actividad, Entrenamiento, Asistencia, Competicion, ResultadoCompeticion
-from forms import EntrenamientoForm, AsistenciaForm
+from forms import EntrenamientoForm, AsistenciaForm, ListaAsistenciaForm
+from sqlalchemy.orm import joinedload, contains_eager
 from datetime import datetime, date, time
+from query_stats import query_budget
+import attendance
+import checkin
 
 trainer_bp = Blueprint('trainer', __name__)
 
+
+def _asistencia_loaders():
+    """Cargas explícitas de lo que muestran las plantillas de cada asistencia"""
+    return (
+        contains_eager(Asistencia.entrenamiento).joinedload(Entrenamiento.actividad),
+        joinedload(Asistencia.miembro),
+    )
+
+
 def trainer_required(f):
     def decorated_function(*args, **kwargs):
         if not current_user.is_authenticated or not hasattr(current_user, 'rol') or current_user.rol.nombre_rol != 'Entrenador':
@@ -18,6 +33,7 @@ def trainer_required(f):
 @trainer_bp.route('/dashboard')
 @login_required
 @trainer_required
+@query_budget(10)
 def dashboard():
     # Estadísticas del entrenador
     stats = {
@@ -32,10 +48,11 @@ def dashboard():
     }
     
     # Entrenamientos del entrenador
-    entrenamientos = Entrenamiento.query.filter_by(id_entrenador=current_user.id_usuario).all()
+    entrenamientos = Entrenamiento.query.options(joinedload(Entrenamiento.actividad))\
+        .filter_by(id_entrenador=current_user.id_usuario).all()
     
     # Asistencias recientes
-    recent_asistencias = Asistencia.query.join(Entrenamiento).filter(
+    recent_asistencias = Asistencia.query.join(Entrenamiento).options(*_asistencia_loaders()).filter(
         Entrenamiento.id_entrenador == current_user.id_usuario
     ).order_by(Asistencia.id_asistencia.desc()).limit(10).all()
     
@@ -47,8 +64,10 @@ def dashboard():
 @trainer_bp.route('/entrenamientos')
 @login_required
 @trainer_required
+@query_budget(10)
 def entrenamientos():
-    entrenamientos = Entrenamiento.query.filter_by(id_entrenador=current_user.id_usuario).all()
+    entrenamientos = Entrenamiento.query.options(joinedload(Entrenamiento.actividad))\
+        .filter_by(id_entrenador=current_user.id_usuario).all()
     return render_template('trainer/entrenamientos.html', entrenamientos=entrenamientos)
 
 @trainer_bp.route('/entrenamientos/add', methods=['GET', 'POST'])
@@ -77,9 +96,10 @@ def add_entrenamiento():
 @trainer_bp.route('/asistencias')
 @login_required
 @trainer_required
+@query_budget(10)
 def asistencias():
     # Obtener asistencias de los entrenamientos del entrenador
-    asistencias = Asistencia.query.join(Entrenamiento).filter(
+    asistencias = Asistencia.query.join(Entrenamiento).options(*_asistencia_loaders()).filter(
         Entrenamiento.id_entrenador == current_user.id_usuario
     ).order_by(Asistencia.id_asistencia.desc()).all()
     
@@ -119,10 +139,91 @@ def add_asistencia():
     
     return render_template('trainer/add_asistencia.html', form=form)
 
+@trainer_bp.route('/entrenamientos/<int:id>/asistencia', methods=['GET', 'POST'])
+@login_required
+@trainer_required
+@query_budget(15)
+def lista_asistencia(id):
+    """Pasar lista de un entrenamiento: todos los miembros en una página y un solo guardado"""
+    entrenamiento = Entrenamiento.query.options(joinedload(Entrenamiento.actividad))\
+        .filter_by(id_entrenamiento=id, id_entrenador=current_user.id_usuario).first_or_404()
+    miembros = attendance.roster(id)
+    form = ListaAsistenciaForm()
+    
+    if form.validate_on_submit():
+        # Solo miembros de la lista; dejar sin registrar a uno que lo estaba elimina su asistencia
+        marks = {}
+        deletes = set()
+        for miembro in miembros:
+            estado = request.form.get(f'estado-{miembro.id_miembro}')
+            if estado not in ('presente', 'ausente'):
+                if estado == '' and miembro.presente is not None:
+                    deletes.add((id, miembro.id_miembro))
+                continue
+            observaciones = request.form.get(f'observaciones-{miembro.id_miembro}', '').strip() or None
+            marks[(id, miembro.id_miembro)] = (estado == 'presente', observaciones)
+        try:
+            creadas, modificadas = attendance.save_attendance(marks)
+            eliminadas = len(attendance.delete_attendance(deletes))
+            db.session.commit()
+            flash(f'Lista guardada: {creadas} asistencias nuevas, {modificadas} modificadas '
+                  f'y {eliminadas} eliminadas', 'success')
+            return redirect(url_for('trainer.lista_asistencia', id=id))
+        except Exception as e:
+            db.session.rollback()
+            flash('Error al guardar la lista de asistencia', 'error')
+    
+    return render_template('trainer/lista_asistencia.html', form=form, entrenamiento=entrenamiento,
+                           miembros=miembros)
+
+@trainer_bp.route('/asistencias/sync', methods=['POST'])
+@login_required
+@trainer_required
+@query_budget(25)
+def sync_asistencias():
+    """Aplicar en una transacción un lote de cambios de asistencia guardados sin conexión"""
+    try:
+        if current_app.config.get('WTF_CSRF_ENABLED', True):
+            validate_csrf(request.headers.get('X-CSRFToken'))
+    except ValidationError:
+        # El cliente pide un token nuevo a sync_token y reenvía el lote
+        return jsonify({'error': 'Token CSRF no válido', 'motivo': 'csrf'}), 400
+    data = request.get_json(silent=True)
+    cambios = data.get('cambios') if isinstance(data, dict) else None
+    if not isinstance(cambios, list):
+        return jsonify({'error': 'Se esperaba una lista de cambios'}), 400
+    if len(cambios) > attendance.SYNC_MAX_CHANGES:
+        return jsonify({'error': f'Máximo {attendance.SYNC_MAX_CHANGES} cambios por lote'}), 413
+    try:
+        resultados = attendance.sync_attendance(cambios, current_user.id_usuario)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Error sincronizando asistencias')
+        return jsonify({'error': 'No se pudieron guardar los cambios'}), 500
+    return jsonify({'resultados': resultados})
+
+@trainer_bp.route('/asistencias/sync/token')
+@login_required
+@trainer_required
+def sync_token():
+    """Token CSRF nuevo para la lista sin conexión (el de la página caduca a las WTF_CSRF_TIME_LIMIT)"""
+    return jsonify({'csrf_token': generate_csrf()})
+
+@trainer_bp.route('/entrenamientos/<int:id>/kiosco')
+@login_required
+@trainer_required
+def kiosco(id):
+    """Abrir el kiosco de check-in del entrenamiento (el enlace no requiere sesión)"""
+    Entrenamiento.query.filter_by(id_entrenamiento=id, id_entrenador=current_user.id_usuario).first_or_404()
+    return redirect(url_for('kiosk.index', token=checkin.kiosk_token(id)))
+
 @trainer_bp.route('/miembros')
 @login_required
 @trainer_required
+@query_budget(10)
 def miembros():
     # Obtener miembros (usuarios con rol de miembro)
-    miembros = Usuario.query.join(Rol).filter(Rol.nombre_rol == 'Miembro').all()
+    miembros = Usuario.query.join(Rol).options(contains_eager(Usuario.rol))\
+        .filter(Rol.nombre_rol == 'Miembro').all()
     return render_template('trainer/miembros.html', miembros=miembros)
\ No newline at end of file
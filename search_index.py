@@ -0,0 +1,562 @@
+"""
+Índice de búsqueda en memoria para /api/search y /api/search/suggest
+
+Mantiene un índice invertido (término -> documentos) sobre usuarios,
+entrenamientos, competiciones y actividades, y un array ordenado de frases
+sin acentos para el autocompletado por prefijo. Se construye una vez desde la
+base de datos y después se actualiza con cada commit a través de los eventos
+de sesión de SQLAlchemy, por lo que las búsquedas no tocan la base de datos.
+"""
+
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import db, Rol, Usuario, Actividad, Entrenamiento, Competicion
+
+logger = logging.getLogger('club_deportivo.search')
+
+# Palabras demasiado frecuentes para aportar relevancia
+STOPWORDS = {'de', 'del', 'la', 'las', 'el', 'los', 'y', 'en', 'a', 'para', 'con', 'por', 'un', 'una'}
+
+# Máximo de términos del vocabulario en los que se expande un prefijo
+MAX_PREFIX_EXPANSION = 64
+
+# Penalización de una coincidencia por prefijo frente a una palabra completa
+PREFIX_FACTOR = 0.6
+
+# Número máximo de sugerencias devueltas por el autocompletado
+MAX_SUGGESTIONS = 8
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text):
+    """Pasar a minúsculas y eliminar acentos ("Núñez" -> "nunez")"""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """Dividir un texto normalizado en términos indexables"""
+    return [t for t in _TOKEN_RE.findall(normalize(text)) if t not in STOPWORDS]
+
+
+def suggestion_phrases(text):
+    """Frases de autocompletado: el texto desde el inicio de cada palabra significativa
+
+    "Ana Rodríguez" -> ["ana rodriguez", "rodriguez"], de modo que escribir
+    "rodri" encuentra la coincidencia con una búsqueda por prefijo.
+    """
+    words = _TOKEN_RE.findall(normalize(text))
+    return [' '.join(words[i:]) for i, word in enumerate(words) if word not in STOPWORDS]
+
+
+class SearchDocument:
+    """Documento indexado con los datos necesarios para mostrar el resultado"""
+
+    __slots__ = ('key', 'type', 'title', 'description', 'fecha', 'rol', 'terms', 'phrases')
+
+    def __init__(self, key, title, description, fields, fecha=None, rol=None, suggest=()):
+        self.key = key
+        self.type = key[0]
+        self.title = title
+        self.description = description
+        self.fecha = fecha
+        self.rol = rol
+        # Cada término se queda con el mayor peso de los campos donde aparece
+        self.terms = {}
+        for text, weight in fields:
+            for term in tokenize(text):
+                if weight > self.terms.get(term, 0):
+                    self.terms[term] = weight
+        self.phrases = set()
+        for text in suggest:
+            self.phrases.update(suggestion_phrases(text))
+
+
+class _IndexState:
+    """Registros de origen, documentos y listas invertidas de una generación del índice"""
+
+    def __init__(self):
+        self.roles = {}
+        self.usuarios = {}
+        self.actividades = {}
+        self.entrenamientos = {}
+        self.competiciones = {}
+        self.docs = {}
+        # término -> {(peso, tipo): documentos}; agrupar así permite recorrer por relevancia
+        # y saltarse de golpe los tipos que ya no pueden aportar resultados
+        self.postings = {}
+        self.df = {}
+        self.vocabulary = []
+        # Frases (frase sin acentos, clave) ordenadas para el autocompletado
+        self.suggestions = []
+        # Durante la carga inicial se añade sin ordenar y se ordena una sola vez al final
+        self._bulk = False
+
+    # --- Composición de documentos ---
+
+    def _usuario_doc(self, id_usuario):
+        u = self.usuarios[id_usuario]
+        rol = self.roles.get(u['id_rol'], '')
+        return SearchDocument(
+            ('usuario', id_usuario),
+            f"{u['nombre']} {u['apellido']}",
+            f"{rol} - {u['email']}",
+            [(u['nombre'], 3), (u['apellido'], 3), (u['email'], 2), (rol, 1)],
+            rol=rol,
+            suggest=(f"{u['nombre']} {u['apellido']}", u['email'])
+        )
+
+    def _entrenamiento_doc(self, id_entrenamiento):
+        e = self.entrenamientos[id_entrenamiento]
+        actividad = self.actividades.get(e['id_actividad'], '')
+        entrenador = self.usuarios.get(e['id_entrenador'], {})
+        nombre_entrenador = f"{entrenador.get('nombre', '')} {entrenador.get('apellido', '')}".strip()
+        return SearchDocument(
+            ('entrenamiento', id_entrenamiento),
+            f"Entrenamiento de {actividad}",
+            f"Entrenador: {nombre_entrenador} - {e['fecha'].strftime('%d/%m/%Y')}",
+            [(actividad, 3), (nombre_entrenador, 2)],
+            fecha=e['fecha']
+        )
+
+    def _competicion_doc(self, id_competicion):
+        c = self.competiciones[id_competicion]
+        actividad = self.actividades.get(c['id_actividad'], '')
+        return SearchDocument(
+            ('competicion', id_competicion),
+            c['nombre'],
+            f"{c['ubicacion'] or 'Sin ubicación'} - {c['fecha'].strftime('%d/%m/%Y')}",
+            [(c['nombre'], 3), (c['ubicacion'], 2), (actividad, 2), (c['descripcion'], 1)],
+            fecha=c['fecha'],
+            suggest=(c['nombre'],)
+        )
+
+    def _actividad_doc(self, id_actividad):
+        return SearchDocument(
+            ('actividad', id_actividad),
+            self.actividades[id_actividad],
+            'Actividad deportiva',
+            [(self.actividades[id_actividad], 3)],
+            suggest=(self.actividades[id_actividad],)
+        )
+
+    # --- Mantenimiento de las listas invertidas ---
+
+    def _remove_doc(self, key):
+        doc = self.docs.pop(key, None)
+        if doc is None:
+            return
+        for term, weight in doc.terms.items():
+            buckets = self.postings[term]
+            bucket = buckets[(weight, doc.type)]
+            del bucket[key]
+            if not bucket:
+                del buckets[(weight, doc.type)]
+            self.df[term] -= 1
+            if not self.df[term]:
+                del self.postings[term]
+                del self.df[term]
+                del self.vocabulary[bisect_left(self.vocabulary, term)]
+        for phrase in doc.phrases:
+            entry = (phrase, key)
+            i = bisect_left(self.suggestions, entry)
+            if i < len(self.suggestions) and self.suggestions[i] == entry:
+                del self.suggestions[i]
+
+    def _add_doc(self, doc):
+        self._remove_doc(doc.key)
+        self.docs[doc.key] = doc
+        for term, weight in doc.terms.items():
+            buckets = self.postings.get(term)
+            if buckets is None:
+                buckets = self.postings[term] = {}
+                self.df[term] = 0
+                if self._bulk:
+                    self.vocabulary.append(term)
+                else:
+                    insort(self.vocabulary, term)
+            # Diccionario como conjunto ordenado: los más recientes quedan al final
+            buckets.setdefault((weight, doc.type), {})[doc.key] = None
+            self.df[term] += 1
+        for phrase in doc.phrases:
+            if self._bulk:
+                self.suggestions.append((phrase, doc.key))
+            else:
+                insort(self.suggestions, (phrase, doc.key))
+
+    def _refresh(self, doc_type, ident):
+        builders = {
+            'usuario': (self.usuarios, self._usuario_doc),
+            'entrenamiento': (self.entrenamientos, self._entrenamiento_doc),
+            'competicion': (self.competiciones, self._competicion_doc),
+            'actividad': (self.actividades, self._actividad_doc),
+        }
+        records, builder = builders[doc_type]
+        if ident in records:
+            self._add_doc(builder(ident))
+        else:
+            self._remove_doc((doc_type, ident))
+
+    # --- Aplicación de cambios ---
+
+    def apply(self, change):
+        """Aplicar un cambio ('upsert' | 'delete', tabla, id, datos) y recomponer dependientes"""
+        action, table, ident, data = change
+        records = {
+            'roles': self.roles,
+            'usuarios': self.usuarios,
+            'actividades': self.actividades,
+            'entrenamientos': self.entrenamientos,
+            'competiciones': self.competiciones,
+        }[table]
+        previous = records.pop(ident, None) if action == 'delete' else records.get(ident)
+        if action != 'delete':
+            records[ident] = data
+        # Los documentos dependientes solo se recomponen si cambia el texto que heredan
+        if previous is None or data is None:
+            renamed = True
+        elif table == 'usuarios':
+            renamed = (previous['nombre'], previous['apellido']) != (data['nombre'], data['apellido'])
+        else:
+            renamed = previous != data
+
+        if table == 'roles':
+            if not renamed:
+                return
+            for id_usuario, u in self.usuarios.items():
+                if u['id_rol'] == ident:
+                    self._refresh('usuario', id_usuario)
+        elif table == 'usuarios':
+            self._refresh('usuario', ident)
+            if renamed:
+                for id_entrenamiento, e in self.entrenamientos.items():
+                    if e['id_entrenador'] == ident:
+                        self._refresh('entrenamiento', id_entrenamiento)
+        elif table == 'actividades':
+            self._refresh('actividad', ident)
+            if not renamed:
+                return
+            for id_entrenamiento, e in self.entrenamientos.items():
+                if e['id_actividad'] == ident:
+                    self._refresh('entrenamiento', id_entrenamiento)
+            for id_competicion, c in self.competiciones.items():
+                if c['id_actividad'] == ident:
+                    self._refresh('competicion', id_competicion)
+        elif table == 'entrenamientos':
+            self._refresh('entrenamiento', ident)
+        elif table == 'competiciones':
+            self._refresh('competicion', ident)
+
+    def build_documents(self):
+        """Indexar todos los registros cargados (solo en una reconstrucción completa)"""
+        self._bulk = True
+        for id_usuario in self.usuarios:
+            self._refresh('usuario', id_usuario)
+        for id_actividad in self.actividades:
+            self._refresh('actividad', id_actividad)
+        for id_entrenamiento in self.entrenamientos:
+            self._refresh('entrenamiento', id_entrenamiento)
+        for id_competicion in self.competiciones:
+            self._refresh('competicion', id_competicion)
+        self.vocabulary.sort()
+        self.suggestions.sort()
+        self._bulk = False
+
+    # --- Consulta ---
+
+    def _expand(self, token):
+        """Términos del vocabulario que coinciden con ``token`` (exacto o como prefijo)"""
+        matches = []
+        i = bisect_left(self.vocabulary, token)
+        while i < len(self.vocabulary) and len(matches) < MAX_PREFIX_EXPANSION:
+            term = self.vocabulary[i]
+            if not term.startswith(token):
+                break
+            matches.append((term, 1.0 if term == token else PREFIX_FACTOR))
+            i += 1
+        return matches
+
+    def _idf(self, term):
+        return math.log(1 + (len(self.docs) or 1) / self.df[term])
+
+    def search(self, tokens, accept, limit, per_type):
+        """Documentos con todos los ``tokens`` por relevancia, con cupo por tipo
+
+        ``accept`` decide si un documento pasa los filtros de la búsqueda.
+        """
+        # Para cada token: término coincidente -> idf * factor de coincidencia
+        expansions = []
+        for token in tokens:
+            terms = {term: self._idf(term) * factor for term, factor in self._expand(token)}
+            if not terms:
+                return []
+            expansions.append(terms)
+
+        results = []
+        per_type_count = {}
+
+        def take(doc):
+            if per_type_count.get(doc.type, 0) >= per_type or not accept(doc):
+                return False
+            per_type_count[doc.type] = per_type_count.get(doc.type, 0) + 1
+            results.append(doc)
+            return True
+
+        if len(expansions) == 1:
+            # Un solo token: recorrer los grupos de mayor a menor puntuación y parar pronto
+            groups = []
+            for term, term_score in expansions[0].items():
+                for (weight, doc_type), bucket in self.postings[term].items():
+                    groups.append((weight * term_score, doc_type, bucket))
+            groups.sort(key=lambda g: g[0], reverse=True)
+            seen = set()
+            for score, doc_type, bucket in groups:
+                for key in reversed(bucket):
+                    if per_type_count.get(doc_type, 0) >= per_type:
+                        break
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    if take(self.docs[key]) and len(results) >= limit:
+                        return results
+            return results
+
+        # Varios tokens: intersección de conjuntos y puntuación solo de los supervivientes
+        candidates = None
+        for terms in sorted(expansions, key=lambda t: sum(self.df[term] for term in t)):
+            keys = set()
+            for term in terms:
+                for bucket in self.postings[term].values():
+                    keys.update(bucket)
+            candidates = keys if candidates is None else candidates & keys
+            if not candidates:
+                return []
+
+        scored = []
+        for key in candidates:
+            doc = self.docs[key]
+            total = 0
+            for terms in expansions:
+                total += max(weight * terms[term] for term, weight in doc.terms.items() if term in terms)
+            scored.append((total, key[1], doc))
+        scored.sort(key=lambda c: (c[0], c[1]), reverse=True)
+        for total, _, doc in scored:
+            if take(doc) and len(results) >= limit:
+                break
+        return results
+
+
+    def suggest(self, prefix, doc_type, limit):
+        """Documentos con alguna frase que empiece por ``prefix`` (ya normalizado)"""
+        results = []
+        seen = set()
+        i = bisect_left(self.suggestions, (prefix,))
+        while i < len(self.suggestions) and len(results) < limit:
+            phrase, key = self.suggestions[i]
+            if not phrase.startswith(prefix):
+                break
+            i += 1
+            if key in seen or (doc_type and key[0] != doc_type):
+                continue
+            seen.add(key)
+            results.append(self.docs[key])
+        return results
+
+
+class SearchIndex:
+    """Índice de búsqueda compartido por todas las peticiones del proceso"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._state = None
+        self._built_at = 0
+        self._rebuilding = False
+        self._replay = None
+        self._expired = False
+        self.max_age = 300
+
+    def init_app(self, app):
+        self.max_age = app.config.get('SEARCH_INDEX_MAX_AGE', self.max_age)
+        event.listen(Session, 'after_flush', _collect_changes)
+        event.listen(Session, 'after_commit', _publish_changes)
+        event.listen(Session, 'after_rollback', _discard_changes)
+
+    def _load_state(self):
+        """Leer de la base de datos únicamente las columnas que se indexan"""
+        state = _IndexState()
+        for r in db.session.query(Rol.id_rol, Rol.nombre_rol):
+            state.roles[r.id_rol] = r.nombre_rol
+        for r in db.session.query(Usuario.id_usuario, Usuario.nombre, Usuario.apellido,
+                                  Usuario.email, Usuario.id_rol):
+            state.usuarios[r.id_usuario] = _row_data(r, USUARIO_FIELDS)
+        for r in db.session.query(Actividad.id_actividad, Actividad.nombre_actividad):
+            state.actividades[r.id_actividad] = r.nombre_actividad
+        for r in db.session.query(Entrenamiento.id_entrenamiento, Entrenamiento.id_entrenador,
+                                  Entrenamiento.id_actividad, Entrenamiento.fecha):
+            state.entrenamientos[r.id_entrenamiento] = _row_data(r, ENTRENAMIENTO_FIELDS)
+        for r in db.session.query(Competicion.id_competicion, Competicion.nombre, Competicion.fecha,
+                                  Competicion.ubicacion, Competicion.descripcion, Competicion.id_actividad):
+            state.competiciones[r.id_competicion] = _row_data(r, COMPETICION_FIELDS)
+        state.build_documents()
+        return state
+
+    def rebuild(self):
+        """Reconstruir el índice completo (requiere contexto de aplicación)"""
+        with self._build_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        with self._lock:
+            self._replay = []
+            self._expired = False
+        try:
+            state = self._load_state()
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            # Los commits ocurridos durante la carga se vuelven a aplicar
+            for change in self._replay:
+                state.apply(change)
+            self._replay = None
+            self._state = state
+            self._built_at = time.monotonic()
+
+    def _rebuild_in_background(self, app):
+        def run():
+            try:
+                with app.app_context():
+                    self.rebuild()
+            except Exception:
+                logger.exception('Error reconstruyendo el índice de búsqueda')
+            finally:
+                self._rebuilding = False
+
+        self._rebuilding = True
+        threading.Thread(target=run, daemon=True).start()
+
+    def ensure_built(self):
+        """Construir el índice si no existe o refrescarlo si ha caducado"""
+        if self._state is None:
+            with self._build_lock:
+                if self._state is None:
+                    self._rebuild()
+        elif not self._rebuilding and (self._expired or (
+                self.max_age and time.monotonic() - self._built_at > self.max_age)):
+            # Otros procesos también escriben en la base de datos: refrescar sin bloquear
+            from flask import current_app
+            self._rebuild_in_background(current_app._get_current_object())
+
+    def expire(self):
+        """Refrescar el índice en la próxima búsqueda sin esperar a SEARCH_INDEX_MAX_AGE
+
+        Para los cambios confirmados sin pasar por la sesión (importaciones masivas).
+        """
+        self._expired = True
+
+    def apply_changes(self, changes):
+        with self._lock:
+            if self._replay is not None:
+                self._replay.extend(changes)
+            if self._state is not None:
+                for change in changes:
+                    self._state.apply(change)
+
+    def search(self, query, doc_type=None, role=None, fecha=None, limit=20, per_type=10):
+        """Documentos ordenados por relevancia para ``query``"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        self.ensure_built()
+
+        def accept(doc):
+            if doc_type and doc.type != doc_type:
+                return False
+            if role and doc.type == 'usuario' and doc.rol != role:
+                return False
+            if fecha and doc.type in ('entrenamiento', 'competicion') and doc.fecha != fecha:
+                return False
+            return True
+
+        with self._lock:
+            return self._state.search(tokens, accept, limit, per_type)
+
+
+    def suggest(self, prefix, doc_type=None, limit=MAX_SUGGESTIONS):
+        """Autocompletado por prefijo, sin acentos ni mayúsculas"""
+        prefix = ' '.join(_TOKEN_RE.findall(normalize(prefix)))
+        if not prefix:
+            return []
+        self.ensure_built()
+        with self._lock:
+            return self._state.suggest(prefix, doc_type, limit)
+
+
+USUARIO_FIELDS = ('nombre', 'apellido', 'email', 'id_rol')
+ENTRENAMIENTO_FIELDS = ('id_entrenador', 'id_actividad', 'fecha')
+COMPETICION_FIELDS = ('nombre', 'fecha', 'ubicacion', 'descripcion', 'id_actividad')
+
+# Modelo -> (tabla del índice, atributo clave, campos copiados)
+TRACKED_MODELS = {
+    Rol: ('roles', 'id_rol', None),
+    Usuario: ('usuarios', 'id_usuario', USUARIO_FIELDS),
+    Actividad: ('actividades', 'id_actividad', None),
+    Entrenamiento: ('entrenamientos', 'id_entrenamiento', ENTRENAMIENTO_FIELDS),
+    Competicion: ('competiciones', 'id_competicion', COMPETICION_FIELDS),
+}
+
+# Modelos cuyo registro en el índice es solo un nombre
+NAME_FIELDS = {Rol: 'nombre_rol', Actividad: 'nombre_actividad'}
+
+
+def _row_data(row, fields):
+    return {field: getattr(row, field) for field in fields}
+
+
+def _snapshot(obj, deleted=False):
+    """Copiar los valores indexados de una instancia al cambio que se publicará"""
+    table, pk, fields = TRACKED_MODELS[type(obj)]
+    if deleted:
+        return ('delete', table, inspect(obj).identity[0], None)
+    if fields is None:
+        data = getattr(obj, NAME_FIELDS[type(obj)])
+    else:
+        data = _row_data(obj, fields)
+    return ('upsert', table, getattr(obj, pk), data)
+
+
+def _collect_changes(session, flush_context):
+    pending = session.info.setdefault('search_changes', [])
+    for obj in list(session.new) + list(session.dirty):
+        if type(obj) in TRACKED_MODELS:
+            pending.append(_snapshot(obj))
+    for obj in session.deleted:
+        if type(obj) in TRACKED_MODELS:
+            pending.append(_snapshot(obj, deleted=True))
+
+
+def _publish_changes(session):
+    changes = session.info.pop('search_changes', None)
+    if changes:
+        search_index.apply_changes(changes)
+
+
+def _discard_changes(session):
+    session.info.pop('search_changes', None)
+
+
+search_index = SearchIndex()
@@ -0,0 +1,138 @@
+// Calendario de eventos: pide a /calendar/events solo los eventos del mes visible
+
+document.addEventListener('DOMContentLoaded', function() {
+    var calendar = document.getElementById('calendar');
+    if (!calendar) return;
+
+    var eventsUrl = calendar.dataset.eventsUrl;
+    var monthLabel = document.getElementById('calendar-month');
+    var competicionesContainer = document.getElementById('calendar-competiciones');
+    var entrenamientosContainer = document.getElementById('calendar-entrenamientos');
+    var today = new Date();
+    var current = new Date(today.getFullYear(), today.getMonth(), 1);
+    var controller = null;
+
+    function isoDate(date) {
+        var month = String(date.getMonth() + 1).padStart(2, '0');
+        var day = String(date.getDate()).padStart(2, '0');
+        return date.getFullYear() + '-' + month + '-' + day;
+    }
+
+    function displayDate(iso) {
+        var parts = iso.split('-');
+        return parts[2] + '/' + parts[1] + '/' + parts[0];
+    }
+
+    function element(tag, className, text) {
+        var el = document.createElement(tag);
+        if (className) el.className = className;
+        if (text !== undefined) el.textContent = text;
+        return el;
+    }
+
+    function iconText(icon, text) {
+        var small = element('small', 'text-muted');
+        small.appendChild(element('i', 'fas ' + icon + ' me-1'));
+        small.appendChild(document.createTextNode(text));
+        return small;
+    }
+
+    function emptyMessage(text) {
+        var message = element('p', 'text-muted');
+        message.appendChild(element('i', 'fas fa-info-circle me-2'));
+        message.appendChild(document.createTextNode(text));
+        return message;
+    }
+
+    function renderCompeticiones(competiciones) {
+        competicionesContainer.innerHTML = '';
+        if (!competiciones.length) {
+            competicionesContainer.appendChild(emptyMessage('No hay competiciones este mes.'));
+            return;
+        }
+        competiciones.forEach(function(competicion) {
+            var card = element('div', 'card mb-3 border-warning');
+            var body = element('div', 'card-body');
+            body.appendChild(element('h6', 'card-title text-warning', competicion.nombre));
+            var fecha = element('p', 'card-text');
+            fecha.appendChild(iconText('fa-calendar', displayDate(competicion.fecha)));
+            body.appendChild(fecha);
+            var ubicacion = element('p', 'card-text');
+            ubicacion.appendChild(iconText('fa-map-marker-alt', competicion.ubicacion || 'Ubicación por definir'));
+            body.appendChild(ubicacion);
+            body.appendChild(element('span', 'badge bg-warning text-dark', competicion.actividad || 'General'));
+            card.appendChild(body);
+            competicionesContainer.appendChild(card);
+        });
+    }
+
+    function renderEntrenamientos(entrenamientos) {
+        entrenamientosContainer.innerHTML = '';
+        if (!entrenamientos.length) {
+            entrenamientosContainer.appendChild(emptyMessage('No hay entrenamientos este mes.'));
+            return;
+        }
+        var wrapper = element('div', 'table-responsive');
+        var table = element('table', 'table table-sm');
+        var head = element('thead', 'table-primary');
+        var headRow = element('tr');
+        ['Fecha', 'Entrenador', 'Actividad'].forEach(function(title) {
+            headRow.appendChild(element('th', null, title));
+        });
+        head.appendChild(headRow);
+        table.appendChild(head);
+        var body = element('tbody');
+        entrenamientos.forEach(function(entrenamiento) {
+            var row = element('tr');
+            row.appendChild(element('td', null, displayDate(entrenamiento.fecha)));
+            row.appendChild(element('td', null, entrenamiento.entrenador));
+            var actividad = element('td');
+            actividad.appendChild(element('span', 'badge bg-primary', entrenamiento.actividad));
+            row.appendChild(actividad);
+            body.appendChild(row);
+        });
+        table.appendChild(body);
+        wrapper.appendChild(table);
+        entrenamientosContainer.appendChild(wrapper);
+    }
+
+    function load() {
+        var start = current;
+        var end = new Date(current.getFullYear(), current.getMonth() + 1, 0);
+        monthLabel.textContent = start.toLocaleDateString('es-ES', { month: 'long', year: 'numeric' });
+
+        if (controller) controller.abort();
+        controller = new AbortController();
+
+        // El navegador revalida con If-None-Match y reutiliza su copia si recibe un 304
+        fetch(eventsUrl + '?start=' + isoDate(start) + '&end=' + isoDate(end), {
+            headers: { 'Accept': 'application/json' },
+            signal: controller.signal
+        })
+            .then(function(response) {
+                if (!response.ok) throw new Error('HTTP ' + response.status);
+                return response.json();
+            })
+            .then(function(data) {
+                renderCompeticiones(data.competiciones);
+                renderEntrenamientos(data.entrenamientos);
+            })
+            .catch(function(error) {
+                if (error.name === 'AbortError') return;
+                console.error('Error cargando el calendario:', error);
+                competicionesContainer.innerHTML = '';
+                competicionesContainer.appendChild(emptyMessage('No se pudieron cargar los eventos.'));
+                entrenamientosContainer.innerHTML = '';
+            });
+    }
+
+    document.querySelectorAll('[data-calendar-nav]').forEach(function(button) {
+        button.addEventListener('click', function() {
+            var step = parseInt(button.dataset.calendarNav, 10);
+            current = new Date(current.getFullYear(), current.getMonth() + step, 1);
+            load();
+        });
+    });
+
+    load();
+});
@@ -149,7 +149,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Cargar más datos (paginación infinita)
     let loadingMore = false;
-    window.loadMoreData = function(url, container) {
+    window.loadMoreData = function(url, container, onLoaded) {
         if (loadingMore) return;
         
         loadingMore = true;
@@ -162,8 +162,10 @@ document.addEventListener('DOMContentLoaded', function() {
             .then(response => response.json())
             .then(data => {
                 loadingIndicator.remove();
-                container.innerHTML += data.html;
+                // insertAdjacentHTML no vuelve a serializar las filas ya cargadas
+                container.insertAdjacentHTML('beforeend', data.html);
                 loadingMore = false;
+                if (onLoaded) onLoaded(data);
             })
             .catch(error => {
                 loadingIndicator.remove();
@@ -172,6 +174,35 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     };
 
+    // Listados paginados por cursor: botón "Cargar más" y scroll infinito
+    document.querySelectorAll('[data-load-more]').forEach(function(button) {
+        let container = document.querySelector(button.dataset.target);
+        let observer = null;
+        
+        function loadNextPage() {
+            let url = button.dataset.loadMore;
+            if (!url || !container) return;
+            
+            window.loadMoreData(url, container, function(data) {
+                if (data.next_url) {
+                    button.dataset.loadMore = data.next_url;
+                } else {
+                    if (observer) observer.disconnect();
+                    button.remove();
+                }
+            });
+        }
+        
+        button.addEventListener('click', loadNextPage);
+        
+        if ('IntersectionObserver' in window) {
+            observer = new IntersectionObserver(function(entries) {
+                if (entries[0].isIntersecting) loadNextPage();
+            });
+            observer.observe(button);
+        }
+    });
+
     // Exportar datos a CSV
     window.exportToCSV = function(tableId, filename) {
         let table = document.getElementById(tableId);
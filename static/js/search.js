@@ -5,6 +5,7 @@ class AdvancedSearch {
         this.searchResults = [];
         this.currentQuery = '';
         this.filters = {};
+        this.suggestController = null;
         this.init();
     }
 
@@ -60,6 +61,7 @@ class AdvancedSearch {
                         <input type="date" id="search-date">
                     </div>
                 </div>
+                <div class="search-suggestions" id="search-suggestions"></div>
                 <div class="search-results" id="search-results">
                     <div class="search-placeholder">
                         <i class="fas fa-search"></i>
@@ -97,6 +99,10 @@ class AdvancedSearch {
         const debouncedSearch = this.debounce((value) => this.handleSearch(value), 300);
         document.getElementById('search-input').addEventListener('input', (e) => debouncedSearch(e.target.value));
         
+        // Las sugerencias salen de un índice en memoria: basta con una espera mínima
+        const debouncedSuggest = this.debounce((value) => this.fetchSuggestions(value), 80);
+        document.getElementById('search-input').addEventListener('input', (e) => debouncedSuggest(e.target.value));
+        
         // Filtros
         ['search-type', 'search-role', 'search-date'].forEach(id => {
             document.getElementById(id).addEventListener('change', () => this.applyFilters());
@@ -127,9 +133,53 @@ class AdvancedSearch {
         document.getElementById('search-input').value = '';
         document.getElementById('search-clear').style.display = 'none';
         this.currentQuery = '';
+        this.showSuggestions([]);
         this.showPlaceholder();
     }
 
+    async fetchSuggestions(query) {
+        // Cancelar la petición anterior si el usuario sigue escribiendo
+        if (this.suggestController) {
+            this.suggestController.abort();
+        }
+        
+        if (!query.trim()) {
+            this.showSuggestions([]);
+            return;
+        }
+        
+        this.suggestController = new AbortController();
+        try {
+            const params = new URLSearchParams({ q: query, type: this.filters.type || '' });
+            const response = await fetch(`/api/search/suggest?${params}`, { signal: this.suggestController.signal });
+            if (response.ok) {
+                this.showSuggestions(await response.json());
+            }
+        } catch (error) {
+            if (error.name !== 'AbortError') {
+                console.error('Error en sugerencias:', error);
+            }
+        }
+    }
+
+    showSuggestions(suggestions) {
+        const container = document.getElementById('search-suggestions');
+        container.innerHTML = suggestions.map(item => `
+            <button type="button" class="search-suggestion" data-text="${this.escapeHtml(item.text)}">
+                <i class="fas ${this.getIconForType(item.type)}"></i>${this.escapeHtml(item.text)}
+            </button>
+        `).join('');
+        
+        container.querySelectorAll('.search-suggestion').forEach(button => {
+            button.addEventListener('click', () => {
+                const input = document.getElementById('search-input');
+                input.value = button.dataset.text;
+                this.showSuggestions([]);
+                this.handleSearch(input.value);
+            });
+        });
+    }
+
     handleSearch(query) {
         this.currentQuery = query.toLowerCase();
         